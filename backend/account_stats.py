@@ -0,0 +1,191 @@
+"""
+账号统计：每个账号的邮件数量、最后同步时间和占用空间，保存在 data/account_stats.json 中，
+由收取邮件时增量更新，读取时不需要扫描邮件目录
+
+占用空间是磁盘上实际保存的数据：邮件记录在存储中的大小（正文压缩后）加上附件文件，
+内容相同的附件只保存一份，计入第一次保存它的账号
+"""
+import os
+import json
+import threading
+from datetime import datetime
+import config
+
+# 内存中的修改最多延迟这么多秒写入文件
+FLUSH_INTERVAL = 5
+
+# 重新统计期间账号一直有新邮件时，最多重新统计这么多次
+REBUILD_ATTEMPTS = 3
+
+
+def new_account_stats():
+    return {
+        'email_count': 0,
+        'last_sync': None,
+        'size_bytes': 0
+    }
+
+
+# 对外返回的统计字段，不包括同步中的标记
+def public_stats(stats):
+    return {key: stats.get(key, default) for key, default in new_account_stats().items()}
+
+
+class AccountStats:
+    def __init__(self, stats_file, email_store, attachment_store, attachments_dir):
+        self.stats_file = stats_file
+        self.email_store = email_store
+        self.attachment_store = attachment_store
+        self.attachments_dir = attachments_dir
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._timer = None
+        self._versions = {}   # 账号 -> 修改次数，用于发现重新统计期间的修改
+        self._stale = set()   # 需要重新统计的账号
+        self._stats = self._load()
+
+    # 文件中带有同步中标记的账号说明上次同步时进程异常退出，保存的统计可能不完整，读取时重新统计
+    def _load(self):
+        try:
+            with open(self.stats_file, 'r', encoding='utf-8') as f:
+                stats = json.load(f)
+        except:
+            return {}
+        for account, item in stats.items():
+            if item.pop('syncing', False):
+                self._stale.add(account)
+        return stats
+
+    # 获取账号的统计信息，还没有统计过的账号从已保存的邮件重建
+    def get(self, account):
+        with self._lock:
+            stats = self._stats.get(account)
+            if stats is not None and account not in self._stale:
+                return public_stats(stats)
+        return self.rebuild(account)
+
+    # 新保存了一封邮件
+    def add_email(self, account, size):
+        with self._lock:
+            stats = self._stats.setdefault(account, new_account_stats())
+            stats['email_count'] += 1
+            stats['size_bytes'] += size
+            self._mark_dirty(account)
+
+    # 已保存的邮件大小变化，例如按需下载了正文或附件
+    def add_size(self, account, delta):
+        with self._lock:
+            stats = self._stats.setdefault(account, new_account_stats())
+            stats['size_bytes'] = max(0, stats['size_bytes'] + delta)
+            self._mark_dirty(account)
+
+    # 开始同步账号：先在文件中写入同步中标记，同步结束前进程退出时下次启动会重新统计
+    def begin_sync(self, account):
+        with self._lock:
+            stats = self._stats.setdefault(account, new_account_stats())
+            stats['syncing'] = True
+            self._write()
+
+    # 同步结束（包括出错和取消），清除同步中标记并立即写入文件
+    def end_sync(self, account):
+        with self._lock:
+            stats = self._stats.setdefault(account, new_account_stats())
+            stats.pop('syncing', None)
+            self._write()
+
+    # 记录账号完成同步的时间，和统计一起在 end_sync 时写入文件
+    def mark_synced(self, account):
+        with self._lock:
+            stats = self._stats.setdefault(account, new_account_stats())
+            stats['last_sync'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self._dirty = True
+
+    # 修改后最多 FLUSH_INTERVAL 秒写入文件
+    def _mark_dirty(self, account):
+        self._versions[account] = self._versions.get(account, 0) + 1
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(FLUSH_INTERVAL, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    # 按存储中实际占用的空间重新统计账号，保留最后同步时间
+    # 统计期间有新保存的邮件时结果可能漏算或重复计算，重新统计，不覆盖期间的修改
+    def rebuild(self, account):
+        attempts = 0
+        while True:
+            with self._lock:
+                version = self._versions.get(account, 0)
+            count, size = self._scan(account)
+            attempts += 1
+            with self._lock:
+                if self._versions.get(account, 0) != version and attempts < REBUILD_ATTEMPTS:
+                    continue
+                stats = self._stats.setdefault(account, new_account_stats())
+                stats['email_count'] = count
+                stats['size_bytes'] = size
+                self._stale.discard(account)
+                self._write()
+                return public_stats(stats)
+
+    # 返回 (邮件数, 占用的字节数)：邮件记录在存储中的大小、计入这个账号的附件文件，
+    # 以及迁移到附件存储之前保存在邮件附件目录中的文件；只读取元数据，不读取正文
+    def _scan(self, account):
+        count = 0
+        legacy_size = 0
+        sha256s = set()
+        check_legacy = os.path.isdir(self.attachments_dir)
+        for email_data in self.email_store.iter_emails(account, with_body=False):
+            count += 1
+            sha256s.update(item['sha256'] for item in email_data.get('attachments', []) if item.get('sha256'))
+            if check_legacy:
+                attachment_dir = os.path.join(self.attachments_dir, email_data['id'])
+                if os.path.isdir(attachment_dir):
+                    legacy_size += sum(entry.stat().st_size for entry in os.scandir(attachment_dir) if entry.is_file())
+
+        # 附件存储记录账号之前保存的附件还没有所属账号，计入第一个重新统计时引用它的账号
+        self.attachment_store.claim(account, sha256s)
+        return count, self.email_store.account_size(account) + self.attachment_store.account_size(account) + legacy_size
+
+    def flush(self):
+        with self._lock:
+            self._timer = None
+            if self._dirty:
+                self._write()
+
+    # 先写临时文件再替换，避免中途退出时文件损坏
+    def _write(self):
+        tmp_file = f'{self.stats_file}.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._stats, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.stats_file)
+        self._dirty = False
+
+
+# 迁移、压缩或清理脚本改变了账号在磁盘上的占用空间后，重新统计这些账号
+def rebuild_accounts(data_dir, email_store, attachment_store, accounts):
+    account_stats = AccountStats(os.path.join(data_dir, config.ACCOUNT_STATS_FILE), email_store, attachment_store,
+                                 os.path.join(data_dir, config.ATTACHMENTS_DIR))
+    for account in sorted(accounts):
+        account_stats.rebuild(account)
+
+
+if __name__ == '__main__':
+    import sys
+    from storage import create_email_store
+    from attachment_store import AttachmentStore
+
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), config.DATA_DIR)
+    email_store = create_email_store(data_dir)
+    account_stats = AccountStats(
+        os.path.join(data_dir, config.ACCOUNT_STATS_FILE),
+        email_store,
+        AttachmentStore(os.path.join(data_dir, config.ATTACHMENT_BLOBS_DIR)),
+        os.path.join(data_dir, config.ATTACHMENTS_DIR)
+    )
+
+    # 用法: python account_stats.py [账号 ...]，不指定账号时重新统计全部
+    accounts = sys.argv[1:] or email_store.accounts()
+    for account in accounts:
+        stats = account_stats.rebuild(account)
+        print(f'{account}: {stats["email_count"]} 封邮件，{stats["size_bytes"]} 字节')
@@ -1,8 +1,7 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context, g
 from flask_cors import CORS
 import os
 import json
-import imaplib
 import email
 from email.header import decode_header
 import time
@@ -11,7 +10,31 @@ import re
 import base64
 import uuid
 import threading
+import atexit
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 import config
+import metrics
+from sync_state import SyncStateStore, get_uidvalidity, search_new_uids
+from dedup_index import DedupIndex, make_dedup_keys
+from search_index import SearchIndex
+from storage import create_email_store
+from account_stats import AccountStats
+from date_utils import parse_email_date
+from lru_cache import LRUCache
+from search_cache import SearchCache
+from attachment_store import AttachmentStore
+from imap_stream import iter_uid_batches, uid_fetch_stream, parse_bodystructure, decode_transfer_encoding, estimate_decoded_size
+from mime_stream import StreamingMessageParser, PartWriter
+from progress_bus import ProgressBus
+from idle_listener import IdleListener
+from notifications import NotificationBuffer
+from job_manager import JobManager, JobCancelled, JobConflict, JobQueueFull
+from imap_pool import IMAPSessionPool
+from metrics import timed_iter
+from search_query import QueryError, parse_query
+from scan_pool import REPORT_EVERY, make_partitions, match_record, parallel_available, parallel_scan
 
 app = Flask(__name__)
 CORS(app, supports_credentials=True, expose_headers=['Authorization'], allow_headers=['Authorization', 'Content-Type'])
@@ -21,76 +44,244 @@ DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__
 ACCOUNTS_FILE = os.path.join(DATA_DIR, config.ACCOUNTS_FILE)
 EMAILS_DIR = os.path.join(DATA_DIR, config.EMAILS_DIR)
 ATTACHMENTS_DIR = os.path.join(DATA_DIR, config.ATTACHMENTS_DIR)
+ATTACHMENT_BLOBS_DIR = os.path.join(DATA_DIR, config.ATTACHMENT_BLOBS_DIR)
+INCOMING_DIR = os.path.join(ATTACHMENTS_DIR, '.incoming')
 NOTIFICATIONS_FILE = os.path.join(DATA_DIR, 'notifications.json')
+SYNC_STATE_DIR = os.path.join(DATA_DIR, config.SYNC_STATE_DIR)
+DEDUP_INDEX_DIR = os.path.join(DATA_DIR, config.DEDUP_INDEX_DIR)
+SEARCH_INDEX_FILE = os.path.join(DATA_DIR, config.SEARCH_INDEX_FILE)
+ACCOUNT_STATS_FILE = os.path.join(DATA_DIR, config.ACCOUNT_STATS_FILE)
 
 # 确保目录存在
 os.makedirs(EMAILS_DIR, exist_ok=True)
 os.makedirs(ATTACHMENTS_DIR, exist_ok=True)
+
+# 清理上次运行中断时留下的附件暂存文件
+shutil.rmtree(INCOMING_DIR, ignore_errors=True)
 os.makedirs(os.path.dirname(NOTIFICATIONS_FILE), exist_ok=True)
 
+# 邮件存储
+email_store = create_email_store(DATA_DIR)
+
+# 附件存储，相同内容的附件只保存一份
+attachment_store = AttachmentStore(ATTACHMENT_BLOBS_DIR)
+
+# 最近打开的邮件详情缓存
+email_cache = LRUCache(config.EMAIL_CACHE_SIZE)
+
+# 增量同步状态
+sync_state = SyncStateStore(SYNC_STATE_DIR)
+
+# 邮件去重索引
+dedup_index = DedupIndex(DEDUP_INDEX_DIR, email_store)
+
+# 账号统计，收取邮件时增量更新，退出时写入未保存的修改
+account_stats = AccountStats(ACCOUNT_STATS_FILE, email_store, attachment_store, ATTACHMENTS_DIR)
+atexit.register(account_stats.flush)
+
+# 搜索结果缓存，账号写入新邮件时失效
+search_cache = SearchCache(config.SEARCH_CACHE_SIZE, config.SEARCH_CACHE_MAX_RESULTS)
+
+# 全文索引，还没有建立时在后台从已保存的邮件重建，重建完成前搜索使用逐个扫描
+search_index = SearchIndex(SEARCH_INDEX_FILE)
+
+def rebuild_search_index():
+    try:
+        search_index.rebuild(email_store.iter_emails())
+        # 改用全文索引搜索后结果会不同
+        search_cache.clear()
+    except Exception as e:
+        add_notification(f'重建全文索引失败: {str(e)}', 'error')
+
+if not search_index.is_ready():
+    threading.Thread(target=rebuild_search_index, daemon=True).start()
+
+# 进度消息总线，收取进度、搜索进度和通知通过 /api/events 推送给前端
+progress_bus = ProgressBus(config.PROGRESS_EVENT_INTERVAL)
+
+# 后台任务：收取和搜索在有界线程池中执行，同时只能有一个收取任务
+job_manager = JobManager(config.JOB_WORKERS, config.JOB_QUEUE_SIZE, config.JOB_RESULT_TTL)
+
 # 全局变量用于跟踪进度
-fetch_progress = {
-    'status': 'idle',
-    'current_account': '',
-    'total_accounts': 0,
-    'current_account_index': 0,
-    'current_email_index': 0,
-    'total_emails': 0,
-    'message': '',
-    'percentage': 0
-}
-
-search_progress = {
-    'status': 'idle',
-    'message': '',
-    'percentage': 0,
-    'total_emails': 0,
-    'processed_emails': 0
-}
-
-# 通知系统
+def new_account_progress():
+    return {
+        'status': 'pending',
+        'current_email_index': 0,
+        'total_emails': 0,
+        'message': '',
+        'percentage': 0
+    }
+
+def new_fetch_progress(status='idle', message='', accounts=()):
+    return {
+        'status': status,
+        'total_accounts': len(accounts),
+        'current_account_index': 0,  # 已处理完成的账号数
+        'current_email_index': 0,
+        'total_emails': 0,
+        'message': message,
+        'percentage': 0,
+        'accounts': {account: new_account_progress() for account in accounts}
+    }
+
+# 收取进度只在持有 fetch_progress_lock 时修改，修改后发布到进度总线，读取进度时使用总线中的副本
+# 进度总线只在推送时复制收取进度，逐封邮件的更新只修改这里的字典
+fetch_progress = new_fetch_progress()
+fetch_progress_lock = threading.Lock()
+fetch_percentage_sum = [0]  # 各账号进度百分比之和，随账号进度增量更新
+progress_bus.publish('fetch', fetch_progress, force=True, lock=fetch_progress_lock)
+
+FINISHED_ACCOUNT_STATUSES = ('completed', 'error', 'cancelled')
+
+# 辅助函数：替换收取进度
+def set_fetch_progress(progress):
+    with fetch_progress_lock:
+        fetch_progress.clear()
+        fetch_progress.update(progress)
+        fetch_percentage_sum[0] = sum(p['percentage'] for p in fetch_progress.get('accounts', {}).values())
+        progress_bus.publish('fetch', fetch_progress, force=True, lock=fetch_progress_lock)
+
+# 辅助函数：更新收取进度的汇总字段，用于设置最终状态
+def finish_fetch_progress(**fields):
+    with fetch_progress_lock:
+        fetch_progress.update(fields)
+        progress_bus.publish('fetch', fetch_progress, force=True, lock=fetch_progress_lock)
+
+# 辅助函数：更新单个账号的收取进度，并汇总到全局进度
+# 汇总字段按这个账号的变化量增量更新，不遍历所有账号；逐封邮件的进度更新由进度总线合并推送，状态变化立即推送
+def update_account_progress(account, **fields):
+    with fetch_progress_lock:
+        accounts = fetch_progress.setdefault('accounts', {})
+        progress = accounts.setdefault(account, new_account_progress())
+        was_finished = progress['status'] in FINISHED_ACCOUNT_STATUSES
+        old_email_index = progress['current_email_index']
+        old_total_emails = progress['total_emails']
+        old_percentage = progress['percentage']
+        progress.update(fields)
+        
+        if 'message' in fields:
+            if fetch_progress.get('total_accounts', 0) > 1:
+                fetch_progress['message'] = f'[{account}] {fields["message"]}'
+            else:
+                fetch_progress['message'] = fields['message']
+        
+        if 'status' in fields:
+            fetch_progress['current_account_index'] += (progress['status'] in FINISHED_ACCOUNT_STATUSES) - was_finished
+        fetch_progress['current_email_index'] += progress['current_email_index'] - old_email_index
+        fetch_progress['total_emails'] += progress['total_emails'] - old_total_emails
+        fetch_percentage_sum[0] += progress['percentage'] - old_percentage
+        total_accounts = fetch_progress.get('total_accounts') or len(accounts)
+        fetch_progress['percentage'] = int(fetch_percentage_sum[0] / total_accounts) if total_accounts > 0 else 0
+        progress_bus.publish('fetch', fetch_progress, force='status' in fields, lock=fetch_progress_lock)
+
+# 辅助函数：重置收取进度，正在收取时不重置
+def reset_fetch_progress():
+    with fetch_progress_lock:
+        if fetch_progress['status'] == 'fetching':
+            return
+        fetch_progress.clear()
+        fetch_progress.update(new_fetch_progress())
+        fetch_percentage_sum[0] = 0
+        progress_bus.publish('fetch', fetch_progress, force=True, lock=fetch_progress_lock)
+
+# 辅助函数：延迟重置收取进度，由任务管理的后台线程执行
+def reset_fetch_progress_later(delay):
+    job_manager.call_later(delay, reset_fetch_progress)
+
+# 每个邮件服务器的并发连接数限制
+host_semaphores = {}
+host_semaphores_lock = threading.Lock()
+
+def get_host_semaphore(server):
+    with host_semaphores_lock:
+        if server not in host_semaphores:
+            host_semaphores[server] = threading.BoundedSemaphore(max(1, config.MAX_CONNECTIONS_PER_HOST))
+        return host_semaphores[server]
+
+# 同一账号同时只进行一次同步，手动收取和新邮件监听触发的收取不会重复下载
+account_sync_locks = {}
+account_sync_locks_lock = threading.Lock()
+
+def get_account_sync_lock(account):
+    with account_sync_locks_lock:
+        if account not in account_sync_locks:
+            account_sync_locks[account] = threading.Lock()
+        return account_sync_locks[account]
+
+# 后台收取不更新收取进度
+def ignore_account_progress(account, **fields):
+    pass
+
+# 搜索进度保存在进度总线中
+def new_search_progress(status='idle', message='', total_emails=0, processed_emails=0):
+    return {
+        'status': status,
+        'message': message,
+        'percentage': 100 if status == 'completed' else 0,
+        'total_emails': total_emails,
+        'processed_emails': processed_emails
+    }
+
+progress_bus.publish('search', new_search_progress(), force=True)
+
+# 通知系统：通知保存在内存中，相同的通知合并，定期写入通知文件，退出时写入未保存的修改
+notification_buffer = NotificationBuffer(NOTIFICATIONS_FILE, config.MAX_NOTIFICATIONS)
+atexit.register(notification_buffer.flush)
+
+# IMAP 连接池：按 (服务器, 账号) 复用已登录的连接，退出时关闭空闲连接
+imap_pool = IMAPSessionPool(config.IMAP_POOL_SIZE, config.IMAP_POOL_IDLE_TIMEOUT)
+atexit.register(imap_pool.close_all)
+
+# 运行指标，关闭时计时和计数直接返回；连接池和任务的统计在输出 /metrics 时读取
+metrics.registry.enabled = config.METRICS_ENABLED
+metrics.registry.collect('multimail_imap_pool_sessions', 'IMAP 连接池累计新建、复用、丢弃的连接数和当前空闲连接数',
+                         lambda: [({'state': key}, value) for key, value in sorted(imap_pool.stats().items())])
+metrics.registry.collect('multimail_jobs', '当前保留的任务数',
+                         lambda: [({'kind': kind, 'status': status}, count) for (kind, status), count in sorted(count_jobs().items())])
+
+def count_jobs():
+    counts = {}
+    for job in job_manager.list():
+        counts[(job.kind, job.status)] = counts.get((job.kind, job.status), 0) + 1
+    return counts
+
+# 记录每个接口请求的耗时，按路由规则（而不是实际路径）区分
+@app.before_request
+def start_request_timer():
+    if metrics.registry.enabled:
+        g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.http_request_seconds.observe(time.perf_counter() - start, method=request.method, route=route, status=response.status_code)
+    return response
+
 def get_notifications():
-    if not os.path.exists(NOTIFICATIONS_FILE):
-        with open(NOTIFICATIONS_FILE, 'w', encoding='utf-8') as f:
-            json.dump([], f)
-        return []
-    
-    try:
-        with open(NOTIFICATIONS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except:
-        return []
+    return notification_buffer.list()
 
+# 每封邮件出错时都可能调用，短时间内的多次更新合并推送
 def add_notification(message, type='info'):
-    notifications = get_notifications()
-    notifications.append({
-        'message': message,
-        'type': type,
-        'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    })
-    
-    # 最多保留100条通知
-    if len(notifications) > 100:
-        notifications = notifications[-100:]
-    
-    try:
-        with open(NOTIFICATIONS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(notifications, f, ensure_ascii=False, indent=2)
-    except:
-        pass
+    notification_buffer.add(message, type)
+    progress_bus.publish('notifications', notification_buffer.list())
 
 def clear_notifications():
-    try:
-        with open(NOTIFICATIONS_FILE, 'w', encoding='utf-8') as f:
-            json.dump([], f)
-    except:
-        pass
+    notification_buffer.clear()
+    progress_bus.publish('notifications', [], force=True)
+
+progress_bus.publish('notifications', get_notifications(), force=True)
 
 # 辅助函数：验证访问秘钥
-def verify_access_key():
+# allow_query 为 True 时也接受 access_key 查询参数，EventSource 无法设置请求头
+def verify_access_key(allow_query=False):
     if not config.ACCESS_KEY:
         return True
     
+    if allow_query and request.args.get('access_key') == config.ACCESS_KEY:
+        return True
+    
     auth_header = request.headers.get('Authorization')
     if not auth_header:
         return False
@@ -124,515 +315,825 @@ def decode_email_subject(subject):
     return result
 
 # 辅助函数：解码邮件内容
-def get_email_content(msg):
+def get_email_content(message):
     content = ""
     html_content = None
     
-    if msg.is_multipart():
-        for part in msg.walk():
-            content_type = part.get_content_type()
-            content_disposition = str(part.get("Content-Disposition"))
-            
-            if "attachment" not in content_disposition:
-                if content_type == "text/plain":
-                    try:
-                        charset = part.get_content_charset() or 'utf-8'
-                        content = part.get_payload(decode=True).decode(charset, errors='replace')
-                    except:
-                        content = part.get_payload(decode=True).decode('utf-8', errors='replace')
-                elif content_type == "text/html":
-                    try:
-                        charset = part.get_content_charset() or 'utf-8'
-                        html_content = part.get_payload(decode=True).decode(charset, errors='replace')
-                    except:
-                        html_content = part.get_payload(decode=True).decode('utf-8', errors='replace')
-    else:
-        content_type = msg.get_content_type()
-        if content_type == "text/plain":
-            try:
-                charset = msg.get_content_charset() or 'utf-8'
-                content = msg.get_payload(decode=True).decode(charset, errors='replace')
-            except:
-                content = msg.get_payload(decode=True).decode('utf-8', errors='replace')
-        elif content_type == "text/html":
-            try:
-                charset = msg.get_content_charset() or 'utf-8'
-                html_content = msg.get_payload(decode=True).decode(charset, errors='replace')
-            except:
-                html_content = msg.get_payload(decode=True).decode('utf-8', errors='replace')
+    for content_type, charset, data in message.text_parts:
+        try:
+            text = data.decode(charset or 'utf-8', errors='replace')
+        except LookupError:
+            text = data.decode('utf-8', errors='replace')
+        
+        if content_type == "text/html":
+            html_content = text
+        else:
+            content = text
     
     # 优先返回HTML内容
     return html_content if html_content else content
 
-# 辅助函数：保存附件
-def save_attachments(msg, email_id):
+# 辅助函数：解码附件文件名并确保文件名安全
+def decode_attachment_filename(filename):
+    return re.sub(r'[^\w\.-]', '_', decode_email_subject(filename))
+
+# 辅助函数：保存附件，返回 (附件列表, 附件存储新占用的字节数)
+def save_attachments(message, email_id, account):
     attachments = []
-    email_attachment_dir = os.path.join(ATTACHMENTS_DIR, email_id)
-    os.makedirs(email_attachment_dir, exist_ok=True)
+    stored = 0
     
-    if msg.is_multipart():
-        for part in msg.walk():
-            if part.get_content_maintype() == 'multipart':
-                continue
+    # 附件在解析时已经解码到暂存目录并计算了 SHA-256，相同内容的附件只保存一份
+    try:
+        for item in message.attachments:
+            filename = decode_attachment_filename(item['filename'])
+            stored += attachment_store.add(item['path'], item['sha256'], item['size'], account)[1]
             
-            filename = part.get_filename()
-            if filename:
-                # 解码文件名
-                filename_parts = decode_header(filename)
-                filename = ""
-                for content, encoding in filename_parts:
-                    if isinstance(content, bytes):
-                        try:
-                            if encoding:
-                                filename += content.decode(encoding)
-                            else:
-                                filename += content.decode('utf-8', errors='replace')
-                        except:
-                            filename += content.decode('utf-8', errors='replace')
-                    else:
-                        filename += str(content)
-                
-                # 确保文件名安全
-                filename = re.sub(r'[^\w\.-]', '_', filename)
-                
-                # 保存附件
-                file_path = os.path.join(email_attachment_dir, filename)
-                with open(file_path, 'wb') as f:
-                    f.write(part.get_payload(decode=True))
-                
-                attachments.append({
-                    'filename': filename,
-                    'path': f'/api/attachments/{email_id}/{filename}'
-                })
-    
-    return attachments
+            attachments.append({
+                'filename': filename,
+                'path': f'/api/attachments/{email_id}/{filename}',
+                'size': item['size'],
+                'sha256': item['sha256']
+            })
+    except Exception:
+        release_attachments(attachments)
+        raise
+    
+    return attachments, stored
 
-# 辅助函数：获取邮件发送时间
+# 辅助函数：释放邮件对附件存储的引用，用于邮件没有保存成功时
+def release_attachments(attachments):
+    for item in attachments:
+        if item.get('sha256'):
+            attachment_store.release(item['sha256'])
+
+# 辅助函数：获取邮件发送时间，返回 (UTC 时间戳, 显示字符串)
 def get_email_date(msg):
     date_str = msg.get('Date')
     if not date_str:
-        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    
-    try:
-        # 尝试解析各种日期格式
-        date_formats = [
-            '%a, %d %b %Y %H:%M:%S %z',
-            '%a, %d %b %Y %H:%M:%S %Z',
-            '%d %b %Y %H:%M:%S %z',
-            '%d %b %Y %H:%M:%S %Z',
-            '%a, %d %b %Y %H:%M:%S',
-            '%d %b %Y %H:%M:%S'
-        ]
-        
-        for fmt in date_formats:
-            try:
-                dt = datetime.strptime(date_str, fmt)
-                return dt.strftime('%Y-%m-%d %H:%M:%S')
-            except:
-                continue
-        
-        # 如果所有格式都失败，使用简单的正则表达式提取日期部分
-        match = re.search(r'\d{1,2}\s+\w{3}\s+\d{4}\s+\d{1,2}:\d{1,2}:\d{1,2}', date_str)
-        if match:
-            date_part = match.group(0)
-            dt = datetime.strptime(date_part, '%d %b %Y %H:%M:%S')
-            return dt.strftime('%Y-%m-%d %H:%M:%S')
-        
-        return date_str
-    except:
-        return date_str
-
-# 辅助函数：检查邮件是否已存在
-def is_email_exists(account, subject, date):
-    account_dir = os.path.join(EMAILS_DIR, account)
-    if not os.path.exists(account_dir):
-        return False
+        return int(time.time()), datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
-    for filename in os.listdir(account_dir):
-        if filename.endswith('.json'):
-            try:
-                with open(os.path.join(account_dir, filename), 'r', encoding='utf-8') as f:
-                    email_data = json.load(f)
-                    if email_data.get('subject') == subject and email_data.get('date') == date:
-                        return True
-            except:
-                continue
-    
-    return False
+    return parse_email_date(str(date_str))
 
-# 辅助函数：获取账号列表
-def get_accounts():
+# 辅助函数：读取账号配置文件，不包含统计信息
+def load_accounts():
     if not os.path.exists(ACCOUNTS_FILE):
         return {"server": "", "emails": []}
     
     try:
         with open(ACCOUNTS_FILE, 'r', encoding='utf-8') as f:
-            accounts_data = json.load(f)
-            # 添加邮件数量信息
-            for email_data in accounts_data.get('emails', []):
-                account = email_data.get('user', '')
-                email_data['email_count'] = get_account_email_count(account)
-            return accounts_data
+            return json.load(f)
     except:
         return {"server": "", "emails": []}
 
+# 辅助函数：获取账号列表，附带邮件数量、最后同步时间和占用空间
+def get_accounts():
+    accounts_data = load_accounts()
+    for email_data in accounts_data.get('emails', []):
+        email_data.update(account_stats.get(email_data.get('user', '')))
+    return accounts_data
+
+# 辅助函数：获取账号的服务器地址和密码
+def get_account_login(account):
+    accounts_data = load_accounts()
+    for email_data in accounts_data.get('emails', []):
+        if email_data.get('user', '') == account:
+            return accounts_data.get('server', ''), email_data.get('password', '')
+    
+    return None, None
+
 # 辅助函数：获取账号邮件数量
 def get_account_email_count(account):
-    account_dir = os.path.join(EMAILS_DIR, account)
-    if not os.path.exists(account_dir):
-        return 0
-    
-    return len([f for f in os.listdir(account_dir) if f.endswith('.json')])
+    return account_stats.get(account)['email_count']
 
 # 辅助函数：获取账号邮件列表
-def get_account_emails(account):
-    account_dir = os.path.join(EMAILS_DIR, account)
-    if not os.path.exists(account_dir):
-        return []
-    
-    emails = []
-    for filename in os.listdir(account_dir):
-        if filename.endswith('.json'):
-            try:
-                with open(os.path.join(account_dir, filename), 'r', encoding='utf-8') as f:
-                    email_data = json.load(f)
-                    emails.append(email_data)
-            except:
-                continue
-    
-    # 按日期排序，最新的在前面
-    emails.sort(key=lambda x: x.get('date', ''), reverse=True)
-    return emails
+def get_account_emails(account, summary=False):
+    with metrics.storage_seconds.time(operation='list'):
+        return email_store.list_emails(account, summary)
 
-# 辅助函数：搜索邮件
-def search_emails(query):
-    global search_progress
-    
-    search_progress = {
-        'status': 'searching',
-        'message': '正在搜索邮件...',
-        'percentage': 0,
-        'total_emails': 0,
-        'processed_emails': 0
-    }
+# 辅助函数：报告搜索进度，在任务中搜索时同时更新任务的进度，推送的进度带有任务 id
+def report_search_progress(job, progress, force=True):
+    if job is not None:
+        progress = dict(progress, job_id=job.id)
+        job.set_progress(progress)
+    progress_bus.publish('search', progress, force=force)
+
+# 辅助函数：搜索邮件，返回结果的 (邮件 id, 账号) 列表，相同的查询直接使用缓存的结果
+# query 使用 search_query 中的查询语法，语法错误时抛出 QueryError
+# 指定 limit 时最多返回 limit 封邮件，扫描搜索找到足够的邮件后提前停止
+def search_email_ids(query, job=None, limit=None):
+    parsed = parse_query(query)
+    # 限定了账号的查询只在这些账号写入新邮件时失效
+    accounts = parsed.accounts()
+    start = time.perf_counter()
+    results = search_cache.get(query, accounts)
+    if results is not None:
+        if limit is not None:
+            results = results[:limit]
+        record_search_metrics('cache', start, results)
+        if job is not None:
+            report_search_progress(job, new_search_progress('completed', f'搜索完成，找到 {len(results)} 封邮件', len(results), len(results)))
+        return results
+    
+    # 搜索期间写入的新邮件会使这次的结果过期
+    version = search_cache.version(accounts)
+    if search_index.is_ready() and not parsed.needs_scan:
+        report_search_progress(job, new_search_progress('searching', '正在搜索邮件...'))
+        
+        # 通过全文索引查找，有关键词时按相关度排序，否则按时间排序
+        results = [(email_id, account) for email_id, account, score in search_index.query(parsed, limit)]
+        record_search_metrics('index', start, results)
+        
+        report_search_progress(job, new_search_progress('completed', f'搜索完成，找到 {len(results)} 封邮件', len(results), len(results)))
+    else:
+        results = scan_emails(parsed, job, limit)
+        record_search_metrics('scan', start, results)
     
-    results = []
-    query = query.lower()
+    # 达到 limit 的结果可能不完整，不缓存
+    if limit is None or len(results) < limit:
+        search_cache.put(query, results, version, accounts)
+    return results
+
+# 辅助函数：记录一次搜索的耗时和结果数，mode 为 cache、index 或 scan
+def record_search_metrics(mode, start, results):
+    metrics.search_seconds.observe(time.perf_counter() - start, mode=mode)
+    metrics.search_results.observe(len(results), mode=mode)
+
+# 辅助函数：按 (邮件 id, 账号) 列表逐封读取邮件，跳过已经不存在的邮件
+def iter_emails_by_ids(results):
+    for email_id, account in results:
+        email_data = email_store.get(email_id, account)
+        if email_data is not None:
+            yield email_data
+
+# 辅助函数：搜索邮件，返回完整的邮件列表
+def search_emails(query, job=None):
+    return list(iter_emails_by_ids(search_email_ids(query, job)))
+
+# 辅助函数：逐封返回搜索结果，用于流式输出
+def iter_search_results(query):
+    yield from iter_emails_by_ids(search_email_ids(query))
+
+# 辅助函数：逐个扫描邮件搜索，全文索引建立前使用；返回按时间倒序排列的 (邮件 id, 账号) 列表
+# query 为 search_query.Query，限定了账号时只扫描这些账号
+# 邮件较多时由多个进程并行扫描；指定 limit 时找到 limit 封邮件后停止扫描
+def scan_emails(query, job=None, limit=None):
+    search_progress = new_search_progress('searching', '正在搜索邮件...')
+    report_search_progress(job, search_progress)
     
     # 获取所有账号
-    accounts_data = get_accounts()
+    accounts_data = load_accounts()
     all_accounts = [email['user'] for email in accounts_data.get('emails', [])]
+    accounts = query.accounts()
+    if accounts is not None:
+        all_accounts = [account for account in all_accounts if account in accounts]
     
     # 计算总邮件数
-    total_emails = 0
-    for account in all_accounts:
-        account_dir = os.path.join(EMAILS_DIR, account)
-        if os.path.exists(account_dir):
-            total_emails += len([f for f in os.listdir(account_dir) if f.endswith('.json')])
-    
+    counts = {account: get_account_email_count(account) for account in all_accounts}
+    total_emails = sum(counts.values())
     search_progress['total_emails'] = total_emails
-    processed_emails = 0
     
-    # 搜索每个账号的邮件
-    for account in all_accounts:
-        account_dir = os.path.join(EMAILS_DIR, account)
-        if not os.path.exists(account_dir):
-            continue
-        
-        for filename in os.listdir(account_dir):
-            if filename.endswith('.json'):
-                try:
-                    with open(os.path.join(account_dir, filename), 'r', encoding='utf-8') as f:
-                        email_data = json.load(f)
-                        
-                        # 检查标题和发件人
-                        subject = email_data.get('subject', '').lower()
-                        sender = email_data.get('from', '').lower()
-                        
-                        if query in subject or query in sender:
-                            results.append(email_data)
-                except:
-                    continue
+    def on_progress(processed_emails, found):
+        search_progress['processed_emails'] = processed_emails
+        search_progress['percentage'] = int(processed_emails / total_emails * 100) if total_emails > 0 else 100
+        report_search_progress(job, search_progress, force=False)
+    
+    workers = config.SEARCH_SCAN_WORKERS or os.cpu_count() or 1
+    if workers > 1 and total_emails >= max(1, config.SEARCH_SCAN_PARALLEL_MIN) and parallel_available():
+        partitions = make_partitions(counts, workers)
+        should_stop = (lambda: job.cancelled) if job is not None else None
+        results = parallel_scan(DATA_DIR, partitions, query, min(workers, len(partitions)), limit, on_progress, should_stop)
+        if job is not None:
+            job.check_cancelled()
+    else:
+        results = []
+        processed_emails = 0
+        for account in all_accounts:
+            if limit is not None and len(results) >= limit:
+                break
+            for email_data in email_store.iter_emails(account, with_body=query.needs_body):
+                if job is not None:
+                    job.check_cancelled()
+                
+                if query(email_data):
+                    results.append(match_record(email_data, account))
+                    if limit is not None and len(results) >= limit:
+                        break
                 
                 processed_emails += 1
-                search_progress['processed_emails'] = processed_emails
-                search_progress['percentage'] = int(processed_emails / total_emails * 100) if total_emails > 0 else 100
+                if processed_emails % REPORT_EVERY == 0:
+                    on_progress(processed_emails, len(results))
     
-    # 按日期排序，最新的在前面
-    results.sort(key=lambda x: x.get('date', ''), reverse=True)
+    # 按时间排序，最新的在前面
+    results.sort(reverse=True)
     
-    search_progress = {
-        'status': 'completed',
-        'message': f'搜索完成，找到 {len(results)} 封邮件',
-        'percentage': 100,
-        'total_emails': total_emails,
-        'processed_emails': total_emails
-    }
+    report_search_progress(job, new_search_progress('completed', f'搜索完成，找到 {len(results)} 封邮件', total_emails, total_emails))
     
-    return results
+    return [(email_id, account) for timestamp, email_id, account in results]
 
-# 辅助函数：获取邮件详情
+# 辅助函数：获取邮件详情，最近打开过的邮件直接从缓存返回
 def get_email_detail(email_id):
-    for account_dir in os.listdir(EMAILS_DIR):
-        account_path = os.path.join(EMAILS_DIR, account_dir)
-        if os.path.isdir(account_path):
-            email_file = os.path.join(account_path, f"{email_id}.json")
-            if os.path.exists(email_file):
-                try:
-                    with open(email_file, 'r', encoding='utf-8') as f:
-                        return json.load(f)
-                except:
-                    return None
+    email_data = email_cache.get(email_id)
+    if email_data is None:
+        with metrics.storage_seconds.time(operation='get'):
+            email_data = email_store.get(email_id)
+        if email_data is None:
+            return None
+        email_cache.put(email_id, email_data)
+    
+    # 返回副本，调用方修改后需要通过 write_email_data 保存
+    return dict(email_data)
+
+# 辅助函数：获取所有邮件
+def get_all_emails(summary=False):
+    with metrics.storage_seconds.time(operation='list'):
+        return email_store.list_emails(summary=summary)
+
+# 辅助函数：分页获取邮件列表，account 为 None 时获取所有账号
+def get_emails_page(account, limit, cursor, summary=True):
+    with metrics.storage_seconds.time(operation='list_page'):
+        emails, next_cursor = email_store.list_page(account, limit, cursor, summary)
+    return {'emails': emails, 'next_cursor': next_cursor}
+
+# 辅助函数：把邮件逐封序列化为 JSON 数组或 NDJSON，按块输出
+def iter_json_chunks(items, mode='json', chunk_size=65536):
+    buffer = []
+    buffered = 0
+    first = True
+    if mode != 'ndjson':
+        buffer.append('[')
+    
+    for item in items:
+        text = json.dumps(item, ensure_ascii=False)
+        if mode == 'ndjson':
+            text += '\n'
+        elif not first:
+            text = ',' + text
+        first = False
+        
+        buffer.append(text)
+        buffered += len(text)
+        if buffered >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            buffered = 0
+    
+    if mode != 'ndjson':
+        buffer.append(']')
+    if buffer:
+        yield ''.join(buffer)
+
+# 辅助函数：流式返回邮件，mode 为 ndjson 或 json
+def stream_emails_response(items, mode):
+    mimetype = 'application/x-ndjson' if mode == 'ndjson' else 'application/json'
+    return Response(stream_with_context(iter_json_chunks(items, mode)), mimetype=mimetype)
+
+# 辅助函数：按请求参数返回邮件列表
+# 带 limit 参数时按 (时间戳, id) 分页，默认只返回摘要；带 stream 参数时逐封流式返回；都不带时返回完整列表
+def list_emails_response(account):
+    summary_default = 'summary' if 'limit' in request.args else 'full'
+    summary = request.args.get('fields', summary_default) == 'summary'
     
+    stream = request.args.get('stream')
+    if stream in ('ndjson', 'json'):
+        return stream_emails_response(email_store.iter_sorted(account, summary), stream)
+    
+    if 'limit' not in request.args:
+        if account is None:
+            return jsonify(get_all_emails(summary))
+        return jsonify(get_account_emails(account, summary))
+    
+    try:
+        limit = max(1, min(int(request.args.get('limit')), config.MAX_PAGE_SIZE))
+        return jsonify(get_emails_page(account, limit, request.args.get('cursor') or None, summary))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+
+# 辅助函数：保存邮件数据，返回邮件在存储中占用的字节数
+def write_email_data(email_data):
+    with metrics.storage_seconds.time(operation='save'):
+        stored_size = email_store.save(email_data)
+    email_cache.pop(email_data['id'])
+    
+    # 同步更新全文索引，该账号缓存的搜索结果失效
+    with metrics.storage_seconds.time(operation='index'):
+        search_index.add_email(email_data)
+    search_cache.invalidate(email_data.get('account'))
+    return stored_size
+
+# 辅助函数：创建流式邮件解析器，收取时 RFC822 字面量直接分块交给它
+def new_message_parser(name):
+    if name == 'RFC822':
+        return StreamingMessageParser(INCOMING_DIR)
     return None
 
-# 辅助函数：获取所有邮件
-def get_all_emails():
-    all_emails = []
-    
-    for account_dir in os.listdir(EMAILS_DIR):
-        account_path = os.path.join(EMAILS_DIR, account_dir)
-        if os.path.isdir(account_path):
-            for filename in os.listdir(account_path):
-                if filename.endswith('.json'):
+# 辅助函数：解析并保存一封收取到的邮件，返回 (邮件数据, 标题)，邮件已存在时邮件数据为 None
+# message 是已经接收完整封邮件的 StreamingMessageParser，也可以是原始邮件
+def save_fetched_email(account, account_index, message):
+    if isinstance(message, bytes):
+        raw_email = message
+        message = StreamingMessageParser(INCOMING_DIR)
+        message.feed(raw_email)
+    
+    try:
+        with metrics.mime_parse_seconds.time(mode='full'):
+            message.close()
+        metrics.fetched_messages_total.inc(account=account)
+        metrics.fetched_bytes_total.inc(message.size, account=account)
+        return save_parsed_email(account, account_index, message)
+    finally:
+        # 邮件已存在或保存失败时，删除暂存的附件
+        message.discard()
+
+def save_parsed_email(account, account_index, message):
+    msg = message.headers
+    
+    # 获取邮件信息
+    subject = decode_email_subject(msg['Subject'])
+    sender = msg['From']
+    timestamp, date = get_email_date(msg)
+    message_id = msg.get('Message-ID', '')
+    
+    # 检查邮件是否已存在
+    dedup_keys = make_dedup_keys(message_id, subject, date, sender)
+    if account_index.contains(dedup_keys):
+        metrics.duplicates_skipped_total.inc(account=account)
+        return None, subject
+    
+    # 生成唯一ID
+    email_uuid = str(uuid.uuid4())
+    
+    # 获取邮件内容
+    content = get_email_content(message)
+    
+    # 保存附件
+    with metrics.attachment_write_seconds.time():
+        attachments, attachments_size = save_attachments(message, email_uuid, account)
+    
+    # 保存邮件数据
+    email_data = {
+        'id': email_uuid,
+        'account': account,
+        'message_id': message_id,
+        'subject': subject,
+        'from': sender,
+        'date': date,
+        'timestamp': timestamp,
+        'content': content,
+        'attachments': attachments
+    }
+    
+    try:
+        stored_size = write_email_data(email_data)
+    except Exception:
+        # 邮件记录没有写入时释放附件的引用；已经写入（例如更新全文索引时出错）的邮件仍然引用这些附件
+        if not email_store.record_size(email_uuid, account):
+            release_attachments(attachments)
+        raise
+    
+    # 占用空间按实际写入的邮件记录和新保存的附件文件计算，已经保存过的附件不重复计算
+    account_stats.add_email(account, stored_size + attachments_size)
+    
+    account_index.add(dedup_keys)
+    return email_data, subject
+
+# 辅助函数：只根据邮件头和 BODYSTRUCTURE 保存邮件，正文和附件在第一次查看时再下载
+def save_fetched_headers(account, account_index, email_uid, uidvalidity, fetched):
+    header = fetched.get('BODY[HEADER]') or b''
+    metrics.fetched_messages_total.inc(account=account)
+    metrics.fetched_bytes_total.inc(len(header), account=account)
+    with metrics.mime_parse_seconds.time(mode='headers'):
+        msg = email.message_from_bytes(header)
+    
+    # 获取邮件信息
+    subject = decode_email_subject(msg['Subject'])
+    sender = msg['From']
+    timestamp, date = get_email_date(msg)
+    message_id = msg.get('Message-ID', '')
+    
+    # 检查邮件是否已存在
+    dedup_keys = make_dedup_keys(message_id, subject, date, sender)
+    if account_index.contains(dedup_keys):
+        metrics.duplicates_skipped_total.inc(account=account)
+        return None, subject
+    
+    # 生成唯一ID
+    email_uuid = str(uuid.uuid4())
+    
+    # 记录正文和附件所在的部分编号，供之后按需下载
+    # BODYSTRUCTURE 中是编码后的大小，附件大小先按解码后的估算值记录，下载后更新为实际大小
+    text_parts, attachment_parts = parse_bodystructure(fetched.get('BODYSTRUCTURE'))
+    attachments = []
+    for part in attachment_parts:
+        filename = decode_attachment_filename(part['filename'])
+        attachments.append({
+            'filename': filename,
+            'path': f'/api/attachments/{email_uuid}/{filename}',
+            'section': part['section'],
+            'encoding': part['encoding'],
+            'size': estimate_decoded_size(part['size'], part['encoding']),
+            'encoded_size': part['size']
+        })
+    
+    # 与完整收取时的邮件大小一致：显示的正文（有 HTML 时为 HTML）加上附件，正文下载后按实际内容计算
+    html_parts = [part for part in text_parts if part['type'] == 'text/html']
+    shown_parts = html_parts or text_parts
+    size = sum(item['size'] for item in attachments)
+    if shown_parts:
+        size += estimate_decoded_size(shown_parts[-1]['size'], shown_parts[-1]['encoding'])
+    
+    # 保存邮件数据
+    email_data = {
+        'id': email_uuid,
+        'account': account,
+        'message_id': message_id,
+        'subject': subject,
+        'from': sender,
+        'date': date,
+        'timestamp': timestamp,
+        'content': '',
+        'attachments': attachments,
+        'body_fetched': False,
+        'body_parts': [
+            {'section': part['section'], 'type': part['type'], 'charset': part['charset'], 'encoding': part['encoding']}
+            for part in text_parts
+        ],
+        'size': size,
+        'uid': email_uid,
+        'uidvalidity': uidvalidity
+    }
+    
+    # 附件还没有下载，只统计邮件记录本身
+    account_stats.add_email(account, write_email_data(email_data))
+    
+    account_index.add(dedup_keys)
+    return email_data, subject
+
+# 辅助函数：从连接池取出账号的连接并只读选择收件箱，确认邮件的 UID 仍然有效，用完后放回连接池
+@contextmanager
+def open_email_mailbox(email_data):
+    account = email_data.get('account', '')
+    server, password = get_account_login(account)
+    if not server:
+        raise Exception(f'找不到账号 {account} 的登录信息')
+    
+    with imap_pool.session(server, account, password) as mail:
+        mail.select('INBOX', readonly=True)
+        
+        if get_uidvalidity(mail) != email_data.get('uidvalidity'):
+            raise Exception(f'账号 {account} 的 UIDVALIDITY 已变化，无法下载这封邮件的内容')
+        
+        yield mail
+
+# 辅助函数：按需下载邮件正文，下载后保存到本地
+def ensure_email_body(email_data):
+    if email_data.get('body_fetched', True):
+        return email_data
+    
+    body_parts = email_data.get('body_parts', [])
+    content = ""
+    html_content = None
+    if body_parts:
+        fetched_body = False
+        with open_email_mailbox(email_data) as mail:
+            items = '(UID ' + ' '.join(f'BODY.PEEK[{part["section"]}]' for part in body_parts) + ')'
+            for email_uid, fetched in uid_fetch_stream(mail, [email_data['uid']], items):
+                fetched_body = True
+                for part in body_parts:
+                    data = decode_transfer_encoding(fetched.get(f'BODY[{part["section"]}]'), part['encoding'])
                     try:
-                        with open(os.path.join(account_path, filename), 'r', encoding='utf-8') as f:
-                            email_data = json.load(f)
-                            all_emails.append(email_data)
-                    except:
-                        continue
-    
-    # 按日期排序，最新的在前面
-    all_emails.sort(key=lambda x: x.get('date', ''), reverse=True)
-    return all_emails
-
-# 辅助函数：更新账号邮件数量
-def update_account_email_count(account):
-    accounts_data = get_accounts()
-    for email_data in accounts_data.get('emails', []):
-        if email_data.get('user', '') == account:
-            email_data['email_count'] = get_account_email_count(account)
+                        text = data.decode(part['charset'] or 'utf-8', errors='replace')
+                    except LookupError:
+                        text = data.decode('utf-8', errors='replace')
+                    
+                    if part['type'] == 'text/html':
+                        html_content = text
+                    else:
+                        content = text
+        
+        # 邮件已经从服务器上删除时 FETCH 没有返回数据，不记录为已下载，之后查看时还会重试
+        if not fetched_body:
+            raise Exception('服务器没有返回邮件正文，邮件可能已被删除')
+    
+    # 优先使用HTML内容
+    old_size = email_store.record_size(email_data['id'], email_data.get('account'))
+    email_data['content'] = html_content if html_content else content
+    email_data['body_fetched'] = True
+    # 正文已经下载，邮件大小改为按实际正文和附件计算
+    email_data.pop('size', None)
+    account_stats.add_size(email_data.get('account', ''), write_email_data(email_data) - old_size)
+    return email_data
+
+# 辅助函数：按需下载单个附件，返回附件的本地路径
+def ensure_attachment(email_data, filename):
+    attachment = None
+    for item in email_data.get('attachments', []):
+        if item.get('filename') == filename:
+            attachment = item
             break
     
-    return accounts_data
-
-# 辅助函数：获取单个账号的邮件
-def fetch_account_emails(server, account, password, is_batching = False):
-    global fetch_progress
+    if attachment is None:
+        return None
+    
+    # 已经保存在附件存储中
+    if attachment.get('sha256'):
+        file_path = attachment_store.blob_path(attachment['sha256'])
+        return file_path if os.path.exists(file_path) else None
+    
+    if not attachment.get('section'):
+        return None
     
-    account_dir = os.path.join(EMAILS_DIR, account)
-    os.makedirs(account_dir, exist_ok=True)
+    section = attachment['section']
+    os.makedirs(INCOMING_DIR, exist_ok=True)
     
-    fetch_progress['current_account'] = account
-    fetch_progress['message'] = f'正在连接到邮件服务器 {server}...'
+    # 附件内容边接收边解码写入暂存文件，完整下载后再加入附件存储
+    tmp_path = os.path.join(INCOMING_DIR, uuid.uuid4().hex)
+    file_path = None
+    def new_writer(name):
+        if name == f'BODY[{section}]':
+            return PartWriter(attachment.get('encoding'), tmp_path)
+        return None
     
     try:
-        # 连接到IMAP服务器
-        mail = imaplib.IMAP4_SSL(server)
-        mail.login(account, password)
+        with open_email_mailbox(email_data) as mail:
+            for email_uid, fetched in uid_fetch_stream(mail, [email_data['uid']], f'(UID BODY.PEEK[{section}])', new_writer):
+                writer = fetched.get(f'BODY[{section}]')
+                if isinstance(writer, PartWriter):
+                    writer.close()
+                    account = email_data.get('account', '')
+                    with metrics.attachment_write_seconds.time():
+                        file_path, stored = attachment_store.add(tmp_path, writer.sha256, writer.size, account)
+                    
+                    # 记录附件对应的存储文件
+                    old_size = email_store.record_size(email_data['id'], account)
+                    attachment['sha256'] = writer.sha256
+                    attachment['size'] = writer.size
+                    account_stats.add_size(account, write_email_data(email_data) - old_size + stored)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    
+    return file_path
+
+# 辅助函数：获取单个账号的邮件
+# background 为 True 时（新邮件监听触发的收取）不更新收取进度
+# job 为所属的收取任务，任务被取消时在两批邮件之间停止
+def fetch_account_emails(server, account, password, is_batching = False, background = False, job = None):
+    report_progress = ignore_account_progress if background else update_account_progress
+    report_progress(account, status='fetching', message=f'正在连接到邮件服务器 {server}...')
+    
+    sync_lock = get_account_sync_lock(account)
+    sync_lock.acquire()
+    account_stats.begin_sync(account)
+    mail = None
+    try:
+        # 从连接池取出已登录的连接，没有可用的连接时重新连接
+        mail = imap_pool.acquire(server, account, password)
         mail.select('INBOX')
         
-        # 获取所有邮件
-        status, messages = mail.search(None, 'ALL')
-        email_ids = messages[0].split()
+        # 读取同步状态，UIDVALIDITY 变化时旧的 UID 全部失效，需要全量同步
+        uidvalidity = get_uidvalidity(mail)
+        state = sync_state.load(account)
+        last_uid = state['last_uid']
+        retry = state['retry']
+        if uidvalidity is None:
+            # 服务器没有返回 UIDVALIDITY 时无法判断 UID 是否失效，沿用上次的同步位置，不每次都全量同步
+            uidvalidity = state['uidvalidity']
+            if not background:
+                add_notification(f'账号 {account} 的邮件服务器没有返回 UIDVALIDITY，将从上次的同步位置继续收取', 'info')
+        elif state['uidvalidity'] != uidvalidity:
+            if state['uidvalidity'] is not None:
+                add_notification(f'账号 {account} 的 UIDVALIDITY 已变化，将重新同步全部邮件', 'info')
+            last_uid = 0
+            retry = {}
         
-        fetch_progress['total_emails'] = len(email_ids)
-        fetch_progress['message'] = f'找到 {len(email_ids)} 封邮件，开始下载...'
+        # 本次同步只加载一次去重索引
+        account_index = dedup_index.open(account)
         
-        # 从最新的邮件开始处理
-        email_ids.reverse()
+        # 先重试上次处理失败的邮件，再获取上次同步之后的新邮件
+        retry_uids = sorted(uid for uid in retry if uid <= last_uid)
+        email_uids = search_new_uids(mail, last_uid)
+        total = len(retry_uids) + len(email_uids)
         
-        for i, email_id in enumerate(email_ids):
-            fetch_progress['current_email_index'] = i + 1
-            fetch_progress['percentage'] = int((i + 1) / len(email_ids) * 100)
-            fetch_progress['message'] = f'正在处理第 {i + 1}/{len(email_ids)} 封邮件...'
-            
-            try:
-                # 获取邮件内容
-                status, msg_data = mail.fetch(email_id, '(RFC822)')
+        report_progress(account, total_emails=total, message=f'找到 {len(email_uids)} 封新邮件，开始下载...')
+        
+        # 只收取邮件头时，正文和附件在第一次查看时再下载
+        headers_only = config.FETCH_MODE == 'headers'
+        fetch_items = '(UID BODYSTRUCTURE BODY.PEEK[HEADER])' if headers_only else '(UID RFC822)'
+        
+        # 按 UID 从小到大分批获取，每批结束后同步位置前进到这一批收到的最大 UID；
+        # 处理失败的邮件记录在 retry 中，之后单独重试，不阻止同步位置前进
+        batches = [(batch, True) for batch in iter_uid_batches(retry_uids, config.FETCH_BATCH_SIZE)]
+        batches += [(batch, False) for batch in iter_uid_batches(email_uids, config.FETCH_BATCH_SIZE)]
+        processed = 0
+        for batch, retrying in batches:
+            if job is not None:
+                job.check_cancelled()
+            received = set()
+            # 记录每批在等待服务器和接收数据上的时间，不包括保存邮件的时间
+            fetch_stream = uid_fetch_stream(mail, batch, fetch_items, None if headers_only else new_message_parser)
+            for email_uid, fetched in timed_iter(fetch_stream, metrics.imap_fetch_seconds, server=server):
+                processed += 1
+                received.add(email_uid)
+                report_progress(
+                    account,
+                    current_email_index=processed,
+                    percentage=int(processed / total * 100),
+                    message=f'正在处理第 {processed}/{total} 封邮件...'
+                )
                 
-                for response_part in msg_data:
-                    if isinstance(response_part, tuple):
-                        msg = email.message_from_bytes(response_part[1])
-                        
-                        # 获取邮件信息
-                        subject = decode_email_subject(msg['Subject'])
-                        sender = msg['From']
-                        date = get_email_date(msg)
-                        
-                        # 检查邮件是否已存在
-                        if is_email_exists(account, subject, date):
-                            fetch_progress['message'] = f'跳过已存在的邮件: {subject}'
-                            continue
-                        
-                        # 生成唯一ID
-                        email_uuid = str(uuid.uuid4())
-                        
-                        # 获取邮件内容
-                        content = get_email_content(msg)
-                        
-                        # 保存附件
-                        attachments = save_attachments(msg, email_uuid)
-                        
-                        # 保存邮件数据
-                        email_data = {
-                            'id': email_uuid,
-                            'account': account,
-                            'subject': subject,
-                            'from': sender,
-                            'date': date,
-                            'content': content,
-                            'attachments': attachments
-                        }
-                        
-                        with open(os.path.join(account_dir, f"{email_uuid}.json"), 'w', encoding='utf-8') as f:
-                            json.dump(email_data, f, ensure_ascii=False, indent=2)
-            except Exception as e:
-                error_msg = f'处理邮件时出错: {str(e)}'
-                fetch_progress['message'] = error_msg
-                add_notification(f'账号 {account} 处理邮件时出错: {str(e)}', 'error')
-                # 继续处理下一封邮件，不中断整个过程
-                continue
+                try:
+                    if headers_only:
+                        email_data, subject = save_fetched_headers(account, account_index, email_uid, uidvalidity, fetched)
+                    else:
+                        email_data, subject = save_fetched_email(account, account_index, fetched['RFC822'])
+                    if email_data is None:
+                        report_progress(account, message=f'跳过已存在的邮件: {subject}')
+                    retry.pop(email_uid, None)
+                except Exception as e:
+                    error_msg = f'处理邮件时出错: {str(e)}'
+                    report_progress(account, message=error_msg)
+                    # 出错的邮件下次收取时单独重试，连续失败 FETCH_RETRY_LIMIT 次后放弃
+                    attempts = retry.get(email_uid, 0) + 1
+                    if attempts >= config.FETCH_RETRY_LIMIT:
+                        retry.pop(email_uid, None)
+                        add_notification(f'账号 {account} 的邮件（UID {email_uid}）已连续 {attempts} 次处理失败，不再重试: {str(e)}', 'error')
+                    else:
+                        retry[email_uid] = attempts
+                        add_notification(f'账号 {account} 处理邮件时出错，下次收取时重试: {str(e)}', 'error')
+                    # 继续处理下一封邮件，不中断整个过程
+                    continue
+            
+            if retrying:
+                # 重试时服务器没有返回的邮件已经被删除，不再重试
+                for email_uid in batch:
+                    if email_uid not in received:
+                        retry.pop(email_uid, None)
+            elif received:
+                last_uid = max(last_uid, max(received))
+            
+            # 每批结束后记录同步位置和需要重试的邮件，中途失败后下次从这里继续
+            sync_state.save(account, uidvalidity, last_uid, retry)
         
+        # 没有新邮件时也要记录 UIDVALIDITY，避免下次误判为需要全量同步
+        if not batches:
+            sync_state.save(account, uidvalidity, last_uid, retry)
+        
+        # 关闭邮箱后连接放回连接池，下次收取时复用
         mail.close()
-        mail.logout()
+        imap_pool.release(server, account, mail)
+        mail = None
         
-        # 更新账号邮件数量
-        accounts_data = update_account_email_count(account)
+        # 记录同步完成时间（结束同步时写入文件），邮件数量和占用空间已在保存邮件时更新
+        account_stats.mark_synced(account)
         
         # 设置状态为已完成
+        report_progress(account, status='completed', percentage=100, message=f'账号 {account} 邮件获取完成')
         if not is_batching:
-            fetch_progress['status'] = 'completed'
-        fetch_progress['message'] = f'账号 {account} 邮件获取完成'
-        fetch_progress['percentage'] = 100
+            finish_fetch_progress(status='completed')
         
         return True
+    except JobCancelled:
+        # 已处理的批次已经记录了同步位置，下次从这里继续
+        report_progress(account, status='cancelled', message=f'账号 {account} 已取消获取')
+        if not is_batching:
+            finish_fetch_progress(status='cancelled', message='已取消获取邮件')
+            reset_fetch_progress_later(3)
+        raise
     except Exception as e:
         error_msg = f'获取邮件失败: {str(e)}'
-        fetch_progress['message'] = error_msg
+        report_progress(account, status='error', message=error_msg)
         if not is_batching:
-            fetch_progress['status'] = 'error'
+            finish_fetch_progress(status='error')
         add_notification(f'账号 {account} 获取邮件失败: {str(e)}', 'error')
         
         # 3秒后自动重置状态
-        def reset_status():
-            global fetch_progress
-            time.sleep(3)
-            fetch_progress = {
-                'status': 'idle',
-                'current_account': '',
-                'total_accounts': 0,
-                'current_account_index': 0,
-                'current_email_index': 0,
-                'total_emails': 0,
-                'message': '',
-                'percentage': 0
-            }
-        
         if not is_batching:
-            threading.Thread(target=reset_status).start()
+            reset_fetch_progress_later(3)
         return False
+    finally:
+        # 出错或取消时连接的状态未知，不放回连接池
+        if mail is not None:
+            imap_pool.discard(mail)
+        account_stats.end_sync(account)
+        sync_lock.release()
 
-# 辅助函数：获取所有账号的邮件
-def fetch_all_emails():
-    global fetch_progress
-    
-    fetch_progress = {
-        'status': 'fetching',
-        'current_account': '',
-        'total_accounts': 0,
-        'current_account_index': 0,
-        'current_email_index': 0,
-        'total_emails': 0,
-        'message': '正在准备获取邮件...',
-        'percentage': 0
-    }
-    
+# 辅助函数：在工作线程中获取单个账号的邮件，同一服务器的并发连接数受限
+def fetch_account_worker(server, account, password, job=None):
+    with get_host_semaphore(server):
+        if job is not None:
+            job.check_cancelled()
+        return fetch_account_emails(server, account, password, True, job=job)
+
+# 辅助函数：获取所有账号的邮件，job 为所属的收取任务
+def fetch_all_emails(job=None):
     # 获取账号列表
-    accounts_data = get_accounts()
+    accounts_data = load_accounts()
     server = accounts_data.get('server', '')
     emails = accounts_data.get('emails', [])
     
-    fetch_progress['total_accounts'] = len(emails)
+    set_fetch_progress(new_fetch_progress('fetching', '正在准备获取邮件...', [email_data.get('user', '') for email_data in emails]))
     
     if not server or not emails:
-        fetch_progress = {
-            'status': 'error',
-            'message': '没有找到账号信息',
-            'percentage': 0
-        }
+        set_fetch_progress(new_fetch_progress('error', '没有找到账号信息'))
         add_notification('没有找到账号信息', 'error')
         
         # 3秒后自动重置状态
-        def reset_status():
-            global fetch_progress
-            time.sleep(3)
-            fetch_progress = {
-                'status': 'idle',
-                'current_account': '',
-                'total_accounts': 0,
-                'current_account_index': 0,
-                'current_email_index': 0,
-                'total_emails': 0,
-                'message': '',
-                'percentage': 0
-            }
-        
-        threading.Thread(target=reset_status).start()
+        reset_fetch_progress_later(3)
         return
     
-    # 获取每个账号的邮件
+    # 并发获取每个账号的邮件，单个账号出错不影响其他账号
     has_error = False
-    for i, email_data in enumerate(emails):
-        account = email_data.get('user', '')
-        password = email_data.get('password', '')
-        
-        fetch_progress['current_account_index'] = i + 1
-        fetch_progress['percentage'] = int((i + 1) / len(emails) * 100)
+    with ThreadPoolExecutor(max_workers=max(1, config.FETCH_WORKERS)) as executor:
+        futures = {
+            executor.submit(fetch_account_worker, server, email_data.get('user', ''), email_data.get('password', ''), job): email_data
+            for email_data in emails
+        }
         
-        try:
-            success = fetch_account_emails(server, account, password, True)
-            if not success:
-                has_error = True
-                # add_notification(f'账号 {account} 获取邮件失败', 'error')
-                # 继续处理下一个账号，不中断整个过程
+        for future in as_completed(futures):
+            email_data = futures[future]
+            account = email_data.get('user', '')
+            
+            # 任务被取消后不再开始还在排队的账号
+            if job is not None and job.cancelled:
+                for pending in futures:
+                    pending.cancel()
+            
+            if future.cancelled():
                 continue
-        except Exception as e:
-            has_error = True
-            error_msg = f'账号 {account} 获取邮件失败: {str(e)}'
-            add_notification(error_msg, 'error')
-            # 继续处理下一个账号，不中断整个过程
-            continue
-        
-        # 更新账号邮件数量
-        email_data['email_count'] = get_account_email_count(account)
+            try:
+                success = future.result()
+                if not success:
+                    has_error = True
+            except JobCancelled:
+                continue
+            except Exception as e:
+                has_error = True
+                error_msg = f'账号 {account} 获取邮件失败: {str(e)}'
+                update_account_progress(account, status='error', message=error_msg)
+                add_notification(error_msg, 'error')
     
     # 设置最终状态
+    if job is not None and job.cancelled:
+        finish_fetch_progress(status='cancelled', message='已取消获取邮件')
+        reset_fetch_progress_later(3)
+        raise JobCancelled()
+    
     if has_error:
-        fetch_progress['status'] = 'completed'
-        fetch_progress['message'] = '邮件获取完成，但有部分账号出错'
+        finish_fetch_progress(status='completed', message='邮件获取完成，但有部分账号出错', percentage=100)
     else:
-        fetch_progress['status'] = 'completed'
-        fetch_progress['message'] = '所有邮件获取完成'
-    
-    fetch_progress['percentage'] = 100
+        finish_fetch_progress(status='completed', message='所有邮件获取完成', percentage=100)
     
     # 5秒后自动重置状态
-    def reset_status():
-        global fetch_progress
-        time.sleep(5)
-        fetch_progress = {
-            'status': 'idle',
-            'current_account': '',
-            'total_accounts': 0,
-            'current_account_index': 0,
-            'current_email_index': 0,
-            'total_emails': 0,
-            'message': '',
-            'percentage': 0
-        }
-    
-    threading.Thread(target=reset_status).start()
+    reset_fetch_progress_later(5)
+    return not has_error
+
+# 辅助函数：在任务中获取单个账号的邮件
+def run_fetch_account_job(job, server, account, password):
+    set_fetch_progress(new_fetch_progress('fetching', '正在准备获取邮件...', [account]))
+    return fetch_account_emails(server, account, password, job=job)
+
+# 辅助函数：在任务中搜索，结果只保留邮件 id 和账号，获取结果时再读取邮件
+def run_search_job(job, query, limit=None):
+    try:
+        return search_email_ids(query, job, limit)
+    except JobCancelled:
+        report_search_progress(job, new_search_progress('cancelled', '搜索已取消'))
+        raise
+
+# 辅助函数：提交收取任务，account 为 None 时收取所有账号；已经在收取时抛出 JobConflict
+def submit_fetch_job(account=None):
+    source = lambda: progress_bus.get('fetch')
+    if account is None:
+        return job_manager.submit('fetch', fetch_all_emails, key='fetch', params={}, progress_source=source)
+    
+    server, password = get_account_login(account)
+    return job_manager.submit('fetch', run_fetch_account_job, server, account, password,
+                              key='fetch', params={'account': account}, progress_source=source)
+
+# 辅助函数：提交搜索任务，多个搜索任务可以同时进行，各自记录进度和结果
+def submit_search_job(query, limit=None):
+    params = {'q': query} if limit is None else {'q': query, 'limit': limit}
+    return job_manager.submit('search', run_search_job, query, limit, params=params,
+                              progress=new_search_progress('searching', '等待搜索...'))
+
+# 辅助函数：解析搜索结果数上限，没有指定时返回 None，不是正整数时抛出 ValueError
+def parse_search_limit(value):
+    if value is None or value == '':
+        return None
+    limit = int(value)
+    if limit < 1:
+        raise ValueError('invalid limit')
+    return limit
+
+# 辅助函数：读取搜索任务的结果邮件
+def iter_job_emails(job):
+    return iter_emails_by_ids(job.result or [])
+
+# 辅助函数：提交任务失败时的响应
+def job_error_response(error):
+    if isinstance(error, JobConflict):
+        return jsonify({'error': '正在获取邮件，请稍后再试', 'job_id': error.job.id}), 400
+    return jsonify({'error': '任务过多，请稍后再试'}), 503
 
 # API路由：获取账号列表
 @app.route('/api/accounts', methods=['GET'])
@@ -648,7 +1149,7 @@ def api_get_account_emails(account):
     if not verify_access_key():
         return jsonify({'error': 'Unauthorized'}), 401
     
-    return jsonify(get_account_emails(account))
+    return list_emails_response(account)
 
 # API路由：获取所有邮件
 @app.route('/api/emails', methods=['GET'])
@@ -656,7 +1157,7 @@ def api_get_all_emails():
     if not verify_access_key():
         return jsonify({'error': 'Unauthorized'}), 401
     
-    return jsonify(get_all_emails())
+    return list_emails_response(None)
 
 # API路由：获取邮件详情
 @app.route('/api/email/<email_id>', methods=['GET'])
@@ -666,6 +1167,11 @@ def api_get_email_detail(email_id):
     
     email_data = get_email_detail(email_id)
     if email_data:
+        # 只收取了邮件头的邮件，第一次查看时下载正文
+        try:
+            email_data = ensure_email_body(email_data)
+        except Exception as e:
+            add_notification(f'账号 {email_data.get("account", "")} 下载邮件正文失败: {str(e)}', 'error')
         return jsonify(email_data)
     else:
         return jsonify({'error': 'Email not found'}), 404
@@ -673,8 +1179,19 @@ def api_get_email_detail(email_id):
 # API路由：获取附件 - 不需要验证访问秘钥
 @app.route('/api/attachments/<email_id>/<filename>', methods=['GET'])
 def api_get_attachment(email_id, filename):
+    # 迁移到附件存储之前保存的附件仍在邮件自己的附件目录中
     file_path = os.path.join(ATTACHMENTS_DIR, email_id, filename)
-    if os.path.exists(file_path):
+    if not os.path.exists(file_path):
+        # 从附件存储中查找，只收取了邮件头的邮件第一次下载附件时从服务器获取
+        email_data = get_email_detail(email_id)
+        if email_data:
+            try:
+                file_path = ensure_attachment(email_data, filename)
+            except Exception as e:
+                add_notification(f'账号 {email_data.get("account", "")} 下载附件失败: {str(e)}', 'error')
+                file_path = None
+    
+    if file_path and os.path.exists(file_path):
         return send_file(file_path, as_attachment=True, download_name=filename)
     else:
         return jsonify({'error': 'Attachment not found'}), 404
@@ -685,14 +1202,8 @@ def api_fetch_account_emails(account):
     if not verify_access_key():
         return jsonify({'error': 'Unauthorized'}), 401
     
-    global fetch_progress
-    
-    # 如果已经在获取邮件，则返回错误
-    if fetch_progress['status'] == 'fetching':
-        return jsonify({'error': '正在获取邮件，请稍后再试'}), 400
-    
     # 获取账号信息
-    accounts_data = get_accounts()
+    accounts_data = load_accounts()
     server = accounts_data.get('server', '')
     emails = accounts_data.get('emails', [])
     
@@ -706,22 +1217,13 @@ def api_fetch_account_emails(account):
     if not server or not account_data:
         return jsonify({'error': 'Account not found'}), 404
     
-    # 设置进度信息
-    fetch_progress = {
-        'status': 'fetching',
-        'current_account': account,
-        'total_accounts': 1,
-        'current_account_index': 1,
-        'current_email_index': 0,
-        'total_emails': 0,
-        'message': '正在准备获取邮件...',
-        'percentage': 0
-    }
-    
-    # 启动异步任务获取邮件
-    threading.Thread(target=fetch_account_emails, args=(server, account, account_data.get('password', ''))).start()
+    # 提交收取任务，如果已经在获取邮件，则返回错误
+    try:
+        job = submit_fetch_job(account)
+    except (JobConflict, JobQueueFull) as e:
+        return job_error_response(e)
     
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'job_id': job.id})
 
 # API路由：获取所有账号的邮件
 @app.route('/api/fetch/all', methods=['POST'])
@@ -729,16 +1231,13 @@ def api_fetch_all_emails():
     if not verify_access_key():
         return jsonify({'error': 'Unauthorized'}), 401
     
-    global fetch_progress
-    
-    # 如果已经在获取邮件，则返回错误
-    if fetch_progress['status'] == 'fetching':
-        return jsonify({'error': '正在获取邮件，请稍后再试'}), 400
-    
-    # 启动异步任务获取所有邮件
-    threading.Thread(target=fetch_all_emails).start()
+    # 提交收取任务，如果已经在获取邮件，则返回错误
+    try:
+        job = submit_fetch_job()
+    except (JobConflict, JobQueueFull) as e:
+        return job_error_response(e)
     
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'job_id': job.id})
 
 # API路由：获取获取邮件进度
 @app.route('/api/fetch/progress', methods=['GET'])
@@ -746,7 +1245,7 @@ def api_get_fetch_progress():
     if not verify_access_key():
         return jsonify({'error': 'Unauthorized'}), 401
     
-    return jsonify(fetch_progress)
+    return jsonify(progress_bus.get('fetch'))
 
 # API路由：搜索邮件
 @app.route('/api/search', methods=['GET'])
@@ -758,10 +1257,51 @@ def api_search_emails():
     if not query:
         return jsonify({'error': 'Query parameter is required'}), 400
     
-    # 启动异步任务搜索邮件
-    threading.Thread(target=search_emails, args=(query,)).start()
+    try:
+        limit = parse_search_limit(request.args.get('limit'))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
     
-    return jsonify({'success': True})
+    try:
+        parse_query(query)
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # 提交搜索任务，通过返回的任务 id 获取进度和结果
+    try:
+        job = submit_search_job(query, limit)
+    except JobQueueFull as e:
+        return job_error_response(e)
+    
+    return jsonify({'success': True, 'job_id': job.id})
+
+# API路由：查看查询的解析结果和执行计划，全文索引建立前或关键词中没有可以在索引中查找的词时返回扫描搜索
+@app.route('/api/search/explain', methods=['GET'])
+def api_explain_search():
+    if not verify_access_key():
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    query = request.args.get('q', '')
+    if not query:
+        return jsonify({'error': 'Query parameter is required'}), 400
+    
+    try:
+        parsed = parse_query(query)
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    result = {
+        'query': str(parsed),
+        'text': parsed.text,
+        'predicates': [{'field': p.field, 'value': p.raw, 'negated': p.negated} for p in parsed.predicates],
+        'accounts': parsed.accounts()
+    }
+    if search_index.is_ready() and not parsed.needs_scan:
+        result['mode'] = 'index'
+        result['plan'] = search_index.explain(parsed)
+    else:
+        result['mode'] = 'scan'
+    return jsonify(result)
 
 # API路由：获取搜索进度
 @app.route('/api/search/progress', methods=['GET'])
@@ -769,23 +1309,130 @@ def api_get_search_progress():
     if not verify_access_key():
         return jsonify({'error': 'Unauthorized'}), 401
     
-    return jsonify(search_progress)
+    return jsonify(progress_bus.get('search'))
 
-# API路由：获取搜索结果
+# API路由：获取搜索结果，带 job_id 时返回该搜索任务的结果
 @app.route('/api/search/results', methods=['GET'])
 def api_get_search_results():
     if not verify_access_key():
         return jsonify({'error': 'Unauthorized'}), 401
     
+    job_id = request.args.get('job_id')
+    if job_id:
+        job = job_manager.get(job_id)
+        if job is None or job.kind != 'search':
+            return jsonify({'error': 'Job not found'}), 404
+        return job_result_response(job)
+    
     query = request.args.get('q', '')
     if not query:
         return jsonify({'error': 'Query parameter is required'}), 400
     
-    if search_progress['status'] != 'completed':
+    try:
+        parse_query(query)
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if progress_bus.get('search')['status'] != 'completed':
         return jsonify([])
     
+    stream = request.args.get('stream')
+    if stream in ('ndjson', 'json'):
+        return stream_emails_response(iter_search_results(query), stream)
+    
     return jsonify(search_emails(query))
 
+# 辅助函数：任务结果的响应，搜索任务返回邮件列表，支持 stream 参数；未完成时返回空列表
+def job_result_response(job):
+    if job.kind != 'search':
+        return jsonify(job.result)
+    
+    if job.status != 'completed':
+        return jsonify([])
+    
+    stream = request.args.get('stream')
+    if stream in ('ndjson', 'json'):
+        return stream_emails_response(iter_job_emails(job), stream)
+    
+    return jsonify(list(iter_job_emails(job)))
+
+# API路由：获取任务列表
+@app.route('/api/jobs', methods=['GET'])
+def api_get_jobs():
+    if not verify_access_key():
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return jsonify([job.snapshot() for job in job_manager.list()])
+
+# API路由：提交任务，{"type": "fetch", "account": 可选} 或 {"type": "search", "q": 关键词}
+@app.route('/api/jobs', methods=['POST'])
+def api_submit_job():
+    if not verify_access_key():
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    job_type = data.get('type')
+    try:
+        if job_type == 'fetch':
+            account = data.get('account')
+            if account and get_account_login(account)[0] is None:
+                return jsonify({'error': 'Account not found'}), 404
+            job = submit_fetch_job(account or None)
+        elif job_type == 'search':
+            if not data.get('q'):
+                return jsonify({'error': 'Query parameter is required'}), 400
+            try:
+                limit = parse_search_limit(data.get('limit'))
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Invalid limit'}), 400
+            try:
+                parse_query(data['q'])
+            except QueryError as e:
+                return jsonify({'error': str(e)}), 400
+            job = submit_search_job(data['q'], limit)
+        else:
+            return jsonify({'error': 'Unknown job type'}), 400
+    except (JobConflict, JobQueueFull) as e:
+        return job_error_response(e)
+    
+    return jsonify(job.snapshot()), 202
+
+# API路由：获取任务状态和进度
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def api_get_job(job_id):
+    if not verify_access_key():
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(job.snapshot())
+
+# API路由：获取任务结果
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def api_get_job_result(job_id):
+    if not verify_access_key():
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return job_result_response(job)
+
+# API路由：取消任务
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def api_cancel_job(job_id):
+    if not verify_access_key():
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify({'success': job_manager.cancel(job_id), 'status': job.status})
+
 # API路由：获取通知
 @app.route('/api/notifications', methods=['GET'])
 def api_get_notifications():
@@ -803,6 +1450,80 @@ def api_clear_notifications():
     clear_notifications()
     return jsonify({'success': True})
 
+# API路由：订阅进度事件（Server-Sent Events），推送收取进度、搜索进度和通知
+# 连接后先推送每个频道的当前状态，之后状态变化时推送，没有变化时定期发送心跳
+@app.route('/api/events', methods=['GET'])
+def api_events():
+    if not verify_access_key(allow_query=True):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    def generate():
+        for event in progress_bus.listen(config.EVENT_HEARTBEAT_INTERVAL):
+            if event is None:
+                yield ': keepalive\n\n'
+                continue
+            channel, state = event
+            yield f'event: {channel}\ndata: {json.dumps(state, ensure_ascii=False)}\n\n'
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# API路由：获取新邮件监听状态
+@app.route('/api/idle', methods=['GET'])
+def api_get_idle_status():
+    if not verify_access_key():
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return jsonify({'enabled': config.IDLE_ENABLED, 'accounts': idle_listener.status()})
+
+# 新邮件监听：服务器通知有新邮件时只收取该账号的新邮件
+def on_new_mail(account):
+    server, password = get_account_login(account)
+    if not server:
+        return
+    
+    before = get_account_email_count(account)
+    with get_host_semaphore(server):
+        fetch_account_emails(server, account, password, True, background=True)
+    new_emails = get_account_email_count(account) - before
+    
+    if new_emails > 0:
+        add_notification(f'账号 {account} 收到 {new_emails} 封新邮件', 'info')
+        progress_bus.publish('mail', {
+            'account': account,
+            'new_emails': new_emails,
+            'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }, force=True)
+
+idle_listener = IdleListener(
+    on_new_mail,
+    max_connections=config.IDLE_MAX_CONNECTIONS,
+    idle_timeout=config.IDLE_TIMEOUT,
+    poll_interval=config.IDLE_POLL_INTERVAL,
+    reconnect_delay=config.IDLE_RECONNECT_DELAY,
+    reconnect_max_delay=config.IDLE_RECONNECT_MAX_DELAY
+)
+
+def start_idle_listener():
+    accounts_data = load_accounts()
+    accounts = [(email_data.get('user', ''), email_data.get('password', '')) for email_data in accounts_data.get('emails', [])]
+    if accounts_data.get('server') and accounts:
+        idle_listener.start(accounts_data['server'], accounts)
+
+if config.IDLE_ENABLED:
+    start_idle_listener()
+
+# 运行指标，Prometheus 文本格式；抓取时可以用 access_key 查询参数传递访问秘钥
+@app.route('/metrics', methods=['GET'])
+def api_metrics():
+    if not metrics.registry.enabled:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    
+    if not verify_access_key(allow_query=True):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return Response(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # 健康检查
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -0,0 +1,175 @@
+"""
+附件存储：附件按内容的 SHA-256 保存为 data/attachment_blobs/<前两位>/<sha256>，相同的附件只保存一份，
+引用计数保存在同目录的 refs.db 中，引用数归零时删除文件；每个文件的占用空间计入第一次保存它的账号
+"""
+import os
+import hashlib
+import sqlite3
+import threading
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+# 计算文件的 SHA-256 和大小
+def hash_file(file_path):
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+class AttachmentStore:
+    def __init__(self, blobs_dir):
+        self.blobs_dir = blobs_dir
+        os.makedirs(blobs_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(blobs_dir, 'refs.db'), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                refcount INTEGER NOT NULL,
+                account TEXT
+            )
+        ''')
+        # 旧的引用表没有 account 列，之前保存的附件不计入任何账号的占用空间
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(blobs)')]
+        if 'account' not in columns:
+            self._conn.execute('ALTER TABLE blobs ADD COLUMN account TEXT')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS blobs_account ON blobs (account)')
+        self._conn.commit()
+
+    def blob_path(self, sha256):
+        return os.path.join(self.blobs_dir, sha256[:2], sha256)
+
+    # 把文件加入存储并增加引用计数，返回 (附件的存储路径, 新占用的字节数)
+    # 已有相同内容时直接删除 file_path，新占用的字节数为 0；否则把它移动到存储目录，
+    # 文件的占用空间计入 account（第一次保存这个附件的账号）
+    def add(self, file_path, sha256=None, size=None, account=None):
+        if sha256 is None or size is None:
+            sha256, size = hash_file(file_path)
+
+        blob_path = self.blob_path(sha256)
+        with self._lock:
+            row = self._conn.execute('SELECT refcount, account FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+            if row and os.path.exists(blob_path):
+                os.remove(file_path)
+                self._conn.execute('UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = ?', (sha256,))
+                stored = 0
+            elif row:
+                # 引用记录还在但文件丢失：恢复文件，保留其他邮件的引用；占用空间仍然计入原来的账号
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(file_path, blob_path)
+                self._conn.execute('UPDATE blobs SET refcount = refcount + 1, size = ?, account = COALESCE(account, ?) WHERE sha256 = ?',
+                                   (size, account, sha256))
+                stored = size if row[1] is None else 0
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(file_path, blob_path)
+                self._conn.execute('INSERT INTO blobs (sha256, size, refcount, account) VALUES (?, ?, ?, ?)',
+                                   (sha256, size, 1, account))
+                stored = size
+            self._conn.commit()
+        return blob_path, stored
+
+    # 已经在存储中的附件再增加一次引用
+    def retain(self, sha256):
+        with self._lock:
+            self._conn.execute('UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = ?', (sha256,))
+            self._conn.commit()
+
+    # 减少引用计数，没有引用时删除文件
+    def release(self, sha256):
+        with self._lock:
+            row = self._conn.execute('SELECT refcount FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+            if row is None:
+                return
+            if row[0] > 1:
+                self._conn.execute('UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = ?', (sha256,))
+            else:
+                self._conn.execute('DELETE FROM blobs WHERE sha256 = ?', (sha256,))
+                try:
+                    os.remove(self.blob_path(sha256))
+                except FileNotFoundError:
+                    pass
+            self._conn.commit()
+
+    # 还没有所属账号的附件（之前版本保存的）计入 account
+    def claim(self, account, sha256s):
+        sha256s = list(sha256s)
+        with self._lock:
+            for start in range(0, len(sha256s), 500):
+                batch = sha256s[start:start + 500]
+                self._conn.execute(
+                    f'UPDATE blobs SET account = ? WHERE account IS NULL AND sha256 IN ({",".join("?" * len(batch))})',
+                    [account] + batch
+                )
+            self._conn.commit()
+
+    # 计入账号的附件文件占用的字节数
+    def account_size(self, account):
+        with self._lock:
+            return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM blobs WHERE account = ?', (account,)).fetchone()[0]
+
+    # 按邮件存储中实际的引用重新计算引用计数，删除没有邮件引用的附件文件，
+    # 包括引用表中没有记录的文件（例如移动到存储目录后、写入引用表前进程退出）
+    # references 为 {sha256: 引用次数}，返回 (删除的文件数, 释放的字节数, 删除了附件的账号)
+    # 保存邮件的过程中附件已经加入存储、邮件还没有写入，需要在后端停止时运行
+    def collect(self, references):
+        removed = 0
+        freed = 0
+        accounts = set()
+        with self._lock:
+            for sha256, size, refcount, account in self._conn.execute('SELECT sha256, size, refcount, account FROM blobs').fetchall():
+                count = references.get(sha256, 0)
+                if count > 0:
+                    if count != refcount:
+                        self._conn.execute('UPDATE blobs SET refcount = ? WHERE sha256 = ?', (count, sha256))
+                    continue
+                self._conn.execute('DELETE FROM blobs WHERE sha256 = ?', (sha256,))
+                try:
+                    os.remove(self.blob_path(sha256))
+                    removed += 1
+                    freed += size
+                    accounts.add(account)
+                except FileNotFoundError:
+                    pass
+            self._conn.commit()
+
+            known = {row[0] for row in self._conn.execute('SELECT sha256 FROM blobs')}
+            for entry in os.scandir(self.blobs_dir):
+                if not entry.is_dir():
+                    continue
+                for blob in os.scandir(entry.path):
+                    if blob.name in known or not blob.is_file():
+                        continue
+                    count = references.get(blob.name, 0)
+                    if count > 0:
+                        # 文件还在但引用表中没有记录，重新登记
+                        self._conn.execute('INSERT INTO blobs (sha256, size, refcount) VALUES (?, ?, ?)',
+                                           (blob.name, blob.stat().st_size, count))
+                    else:
+                        freed += blob.stat().st_size
+                        os.remove(blob.path)
+                        removed += 1
+            self._conn.commit()
+        accounts.discard(None)
+        return removed, freed, accounts
+
+    # 返回 (附件文件数, 实际占用字节数, 被引用的总次数)
+    def stats(self):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(refcount), 0) FROM blobs'
+            ).fetchone()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,164 @@
+"""
+正文压缩基准测试：比较不压缩、zlib、zstd 以及使用共享字典时的磁盘占用、列表读取和详情读取耗时
+
+用法（在 backend 目录下）: python benchmarks/bench_body_compression.py [--emails 5000] [--backend json sqlite]
+没有安装 zstandard 时只测试 zlib
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from body_codec import BodyCodec, train_dictionary, zstandard
+from storage import JsonEmailStore, SqliteEmailStore
+
+BRANDS = ['ShopMall', '优品商城', 'TravelNow', 'BookHouse', 'FreshMart', 'TechZone']
+PRODUCTS = ['无线耳机', 'Running Shoes', '机械键盘', 'Coffee Maker', '双肩背包', 'Smart Watch', '保温杯', 'Desk Lamp']
+
+
+# 模拟营销邮件：同一品牌的邮件共用大段样式和模板，只有商品、价格和跟踪链接不同
+def make_html(rng, brand):
+    style = ''.join(
+        f'.{brand.lower()}-c{i} {{ font-family: Helvetica, Arial, sans-serif; font-size: {12 + i % 6}px; color: #{i * 2654435761 % 0xffffff:06x}; padding: {i % 9}px; }}\n'
+        for i in range(40)
+    )
+    items = ''.join(
+        f'<tr><td class="item"><a href="https://click.{brand.lower()}.com/t/{uuid.UUID(int=rng.getrandbits(128)).hex}">'
+        f'<img src="https://img.{brand.lower()}.com/p/{rng.randint(1, 99999)}.jpg" width="120" alt="{product}"></a></td>'
+        f'<td class="name">{product}</td><td class="price">￥{rng.randint(9, 999)}.{rng.randint(0, 99):02d}</td></tr>\n'
+        for product in rng.sample(PRODUCTS, rng.randint(3, 6))
+    )
+    return (
+        f'<!DOCTYPE html><html><head><meta charset="utf-8"><style>\n{style}</style></head>\n'
+        f'<body><table width="600" align="center" cellpadding="0" cellspacing="0" border="0">\n'
+        f'<tr><td><img src="https://img.{brand.lower()}.com/logo.png" alt="{brand}"></td></tr>\n'
+        f'<tr><td><h1>{brand} 本周精选 Weekly picks</h1><p>亲爱的会员，以下是为您挑选的商品：</p></td></tr>\n'
+        f'{items}'
+        f'<tr><td class="footer">您收到这封邮件是因为您订阅了 {brand} 的促销信息。'
+        f'<a href="https://{brand.lower()}.com/unsubscribe?u={rng.getrandbits(64):x}">退订</a> | '
+        f'<a href="https://{brand.lower()}.com/privacy">隐私政策</a></td></tr>\n'
+        f'</table></body></html>\n'
+    )
+
+
+def make_email(rng, i):
+    brand = BRANDS[i % len(BRANDS)]
+    return {
+        'id': str(uuid.UUID(int=rng.getrandbits(128))),
+        'account': f'user{i % 5}@example.com',
+        'message_id': f'<bench-{i}@{brand.lower()}.com>',
+        'subject': f'{brand} 本周精选 #{i}',
+        'from': f'news@{brand.lower()}.com',
+        'date': f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d} 10:{i % 60:02d}:00',
+        'content': make_html(rng, brand),
+        'attachments': []
+    }
+
+
+# 目录或数据库文件实际占用的磁盘空间（按块计算）和文件内容的总字节数
+def disk_usage(path):
+    paths = []
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            paths.extend(os.path.join(root, name) for name in files)
+    else:
+        paths = [path]
+    allocated = sum(os.stat(p).st_blocks * 512 for p in paths if os.path.exists(p))
+    apparent = sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+    return allocated, apparent
+
+
+def open_store(backend, data_dir, codec):
+    if backend == 'sqlite':
+        return SqliteEmailStore(os.path.join(data_dir, 'emails.db'), codec)
+    return JsonEmailStore(os.path.join(data_dir, 'emails'), os.path.join(data_dir, 'email_locations.idx'), codec)
+
+
+def run(label, backend, emails, codec, reads, rng):
+    data_dir = tempfile.mkdtemp(prefix='mmm-bench-')
+    try:
+        store = open_store(backend, data_dir, codec)
+        start = time.perf_counter()
+        if backend == 'sqlite':
+            store.save_many(emails)
+        else:
+            for email_data in emails:
+                store.save(email_data)
+        write_time = time.perf_counter() - start
+        store.close()
+
+        path = os.path.join(data_dir, 'emails.db' if backend == 'sqlite' else 'emails')
+        allocated, apparent = disk_usage(path)
+
+        # 重新打开存储，避免写入时的缓存影响读取
+        store = open_store(backend, data_dir, codec)
+        store.list_page(None, 1)
+
+        start = time.perf_counter()
+        pages = 0
+        cursor = None
+        while pages < 20:
+            page, cursor = store.list_page(None, 50, cursor, summary=True)
+            pages += 1
+            if cursor is None:
+                break
+        list_time = (time.perf_counter() - start) / pages
+
+        ids = [(email_data['id'], email_data['account']) for email_data in rng.sample(emails, min(reads, len(emails)))]
+        start = time.perf_counter()
+        for email_id, account in ids:
+            store.get(email_id, account)
+        detail_time = (time.perf_counter() - start) / len(ids)
+        store.close()
+
+        print(f'{backend:<7} {label:<12} {allocated / 1024 / 1024:>9.1f} {apparent / 1024 / 1024:>9.1f} '
+              f'{write_time:>8.2f} {list_time * 1000:>10.2f} {detail_time * 1e6:>11.1f}')
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='正文压缩基准测试')
+    parser.add_argument('--emails', type=int, default=5000, help='邮件数')
+    parser.add_argument('--samples', type=int, default=500, help='训练字典使用的邮件数（另外生成，不计入测试邮件）')
+    parser.add_argument('--reads', type=int, default=1000, help='随机读取详情的次数')
+    parser.add_argument('--backend', nargs='+', default=['json', 'sqlite'], choices=['json', 'sqlite'], help='邮件存储方式')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    emails = [make_email(rng, i) for i in range(args.emails)]
+    samples = [make_email(rng, i)['content'] for i in range(args.samples)]
+    body_size = sum(len(email_data['content'].encode('utf-8')) for email_data in emails)
+    print(f'{args.emails} 封邮件，正文共 {body_size / 1024 / 1024:.1f} MB')
+
+    # 每种设置使用单独的字典目录
+    dict_root = tempfile.mkdtemp(prefix='mmm-dict-')
+    codecs = [('none', BodyCodec('none')), ('zlib', BodyCodec('zlib'))]
+    zlib_dict = BodyCodec('zlib', dict_dir=os.path.join(dict_root, 'zlib'))
+    zlib_dict.save_dictionary(train_dictionary(samples, method='zlib'))
+    codecs.append(('zlib+dict', zlib_dict))
+    if zstandard is not None:
+        codecs.append(('zstd', BodyCodec('zstd')))
+        zstd_dict = BodyCodec('zstd', dict_dir=os.path.join(dict_root, 'zstd'))
+        zstd_dict.save_dictionary(train_dictionary(samples, method='zstd'))
+        codecs.append(('zstd+dict', zstd_dict))
+    else:
+        print('没有安装 zstandard，跳过 zstd')
+
+    try:
+        print(f'{"backend":<7} {"codec":<12} {"disk MB":>9} {"data MB":>9} {"write s":>8} {"list ms/页":>10} {"detail us":>11}')
+        for backend in args.backend:
+            for label, codec in codecs:
+                run(label, backend, emails, codec, args.reads, random.Random(1))
+    finally:
+        shutil.rmtree(dict_root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+日期解析基准测试：比较原来逐个尝试 strptime 格式的 get_email_date 和带缓存的 parse_email_date
+
+用法（在 backend 目录下）: python benchmarks/bench_date_parse.py [--headers 100000] [--unique 5000]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from date_utils import parse_email_date
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+# 原来的实现，用于对比
+def legacy_get_email_date(date_str):
+    try:
+        date_formats = [
+            '%a, %d %b %Y %H:%M:%S %z',
+            '%a, %d %b %Y %H:%M:%S %Z',
+            '%d %b %Y %H:%M:%S %z',
+            '%d %b %Y %H:%M:%S %Z',
+            '%a, %d %b %Y %H:%M:%S',
+            '%d %b %Y %H:%M:%S'
+        ]
+
+        for fmt in date_formats:
+            try:
+                dt = datetime.strptime(date_str, fmt)
+                return dt.strftime('%Y-%m-%d %H:%M:%S')
+            except:
+                continue
+
+        match = re.search(r'\d{1,2}\s+\w{3}\s+\d{4}\s+\d{1,2}:\d{1,2}:\d{1,2}', date_str)
+        if match:
+            date_part = match.group(0)
+            dt = datetime.strptime(date_part, '%d %b %Y %H:%M:%S')
+            return dt.strftime('%Y-%m-%d %H:%M:%S')
+
+        return date_str
+    except:
+        return date_str
+
+
+# 常见的几种 Date 头写法，包括带时区注释、没有星期和 GMT 结尾的
+def make_header(rng):
+    day = rng.randint(1, 28)
+    month = rng.choice(MONTHS)
+    year = rng.randint(2015, 2024)
+    clock = f'{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}'
+    offset = rng.choice(['+0800', '+0000', '-0700', '+0530'])
+    style = rng.randint(0, 3)
+    if style == 0:
+        return f'{rng.choice(WEEKDAYS)}, {day} {month} {year} {clock} {offset}'
+    if style == 1:
+        return f'{rng.choice(WEEKDAYS)}, {day} {month} {year} {clock} {offset} (CST)'
+    if style == 2:
+        return f'{day} {month} {year} {clock} {offset}'
+    return f'{rng.choice(WEEKDAYS)}, {day:02d} {month} {year} {clock} GMT'
+
+
+def run(label, func, headers):
+    start = time.perf_counter()
+    for header in headers:
+        func(header)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<24} {elapsed:>8.3f} {elapsed / len(headers) * 1e6:>10.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='日期解析基准测试')
+    parser.add_argument('--headers', type=int, default=100000, help='解析的 Date 头数量')
+    parser.add_argument('--unique', type=int, default=5000, help='其中不同的 Date 头数量')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    unique = [make_header(rng) for _ in range(args.unique)]
+    headers = [rng.choice(unique) for _ in range(args.headers)]
+
+    # 显示字符串应与原来的实现一致
+    mismatches = [header for header in unique if parse_email_date(header)[1] != legacy_get_email_date(header)]
+    print(f'{len(unique)} 种 Date 头中显示字符串不一致的有 {len(mismatches)} 种')
+
+    print(f'{"实现":<24} {"总耗时(s)":>8} {"每次(us)":>10}')
+    run('legacy strptime', legacy_get_email_date, headers)
+    parse_email_date.cache_clear()
+    run('parse_email_date', parse_email_date, headers)
+    parse_email_date.cache_clear()
+    run('parse_email_date 无缓存', parse_email_date.__wrapped__, headers)
+
+
+if __name__ == '__main__':
+    main()
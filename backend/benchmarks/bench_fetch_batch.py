@@ -0,0 +1,74 @@
+"""
+批量 UID FETCH 基准测试：在本地模拟 IMAP 服务器上比较不同批次大小的收取速度
+
+用法（在 backend 目录下）: python benchmarks/bench_fetch_batch.py [--messages 2000] [--latency 0.005]
+"""
+import argparse
+import imaplib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_imap import FakeIMAPServer, FakeMailbox
+from imap_stream import iter_uid_batches, uid_fetch_stream
+
+
+def make_message(i, body_size):
+    body = ('这是一封测试邮件 benchmark message %d\r\n' % i) * max(1, body_size // 40)
+    return (
+        f'From: sender{i % 50}@example.com\r\n'
+        f'To: user@example.com\r\n'
+        f'Subject: Benchmark message {i}\r\n'
+        f'Date: Mon, 01 Jan 2024 10:{i % 60:02d}:00 +0800\r\n'
+        f'Message-ID: <bench-{i}@example.com>\r\n'
+        f'Content-Type: text/plain; charset=utf-8\r\n'
+        f'\r\n'
+        f'{body}'
+    ).encode('utf-8')
+
+
+def run(port, uids, batch_size):
+    mail = imaplib.IMAP4('127.0.0.1', port)
+    mail.login('bench@example.com', 'password')
+    mail.select('INBOX')
+
+    received = 0
+    received_bytes = 0
+    start = time.perf_counter()
+    for batch in iter_uid_batches(uids, batch_size):
+        for uid, fetched in uid_fetch_stream(mail, batch):
+            received += 1
+            received_bytes += len(fetched['RFC822'])
+    elapsed = time.perf_counter() - start
+
+    mail.logout()
+    return received, received_bytes, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量 UID FETCH 基准测试')
+    parser.add_argument('--messages', type=int, default=2000, help='邮箱中的邮件数')
+    parser.add_argument('--body-size', type=int, default=4000, help='每封邮件正文的大致字节数')
+    parser.add_argument('--latency', type=float, default=0.005, help='模拟的每条命令往返延迟（秒）')
+    parser.add_argument('--batch-sizes', default='1,10,50,100,200', help='要比较的批次大小，逗号分隔')
+    args = parser.parse_args()
+
+    mailbox = FakeMailbox([make_message(i, args.body_size) for i in range(args.messages)])
+    server = FakeIMAPServer({'bench@example.com': mailbox}, latency=args.latency)
+    server.start()
+
+    uids = [uid for uid, _ in mailbox.snapshot()]
+    print(f'{args.messages} 封邮件，模拟往返延迟 {args.latency * 1000:.1f} ms')
+    print(f'{"batch":>8} {"msgs/s":>10} {"MB/s":>8} {"seconds":>8}')
+    try:
+        for batch_size in [int(size) for size in args.batch_sizes.split(',')]:
+            received, received_bytes, elapsed = run(server.port, uids, batch_size)
+            print(f'{batch_size:>8} {received / elapsed:>10.1f} {received_bytes / elapsed / 1024 / 1024:>8.2f} {elapsed:>8.2f}')
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
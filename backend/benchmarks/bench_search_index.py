@@ -0,0 +1,116 @@
+"""
+全文索引查询基准测试：在合成邮件建立的索引上测量带 limit 的查询延迟，比较按得分上界提前停止和给所有候选邮件打分两种方式，
+并检查两种方式的结果相同
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_search_index.py [--emails 100000] [--limit 50] [--repeat 5] [--index-file /tmp/index.db]
+                                           [--target-ms 100] [--no-full]
+
+建立索引需要较长时间（100 万封邮件约半小时），指定 --index-file 时索引保存在这个文件中，
+下次运行时如果邮件数相同就直接使用。任意查询的最大延迟超过 --target-ms 时返回值为 1
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import search_index
+from search_index import SearchIndex
+from search_query import parse_query
+from synthetic import make_record
+
+QUERIES = [
+    '对账单',
+    'com',
+    '会议',
+    'shopmall',
+    '本周 精选',
+    '报销 has:attachment',
+    'from:alice 会议',
+    'account:user1@example.com 报销',
+    '对账单 after:2023-01-10'
+]
+
+
+# 打开或建立索引，已有的索引邮件数不同时重建
+def open_index(index_file, emails, seed):
+    index = SearchIndex(index_file)
+    if index.is_ready() and index.count() == emails:
+        return index, 0.0
+    print(f'正在为 {emails} 封邮件建立索引...')
+    start = time.perf_counter()
+    index.rebuild(make_record(i, seed=seed) for i in range(emails))
+    return index, time.perf_counter() - start
+
+
+# 运行 repeat 次查询，返回 (结果, 每次的耗时)
+def run_query(index, query, limit, repeat):
+    timings = []
+    results = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = index.query(query, limit)
+        timings.append(time.perf_counter() - start)
+    return results, sorted(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='全文索引查询基准测试')
+    parser.add_argument('--emails', type=int, default=100000, help='邮件数')
+    parser.add_argument('--limit', type=int, default=50, help='每次查询的结果数')
+    parser.add_argument('--repeat', type=int, default=5, help='每个查询的重复次数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--index-file', help='索引文件，默认使用临时目录并在结束后删除')
+    parser.add_argument('--target-ms', type=float, default=100, help='查询延迟的目标（毫秒）')
+    parser.add_argument('--no-full', action='store_true', help='不测量给所有候选邮件打分的方式（邮件很多时较慢）')
+    parser.add_argument('queries', nargs='*', default=QUERIES, help='查询，默认使用内置的查询')
+    args = parser.parse_args()
+
+    temp_dir = None
+    index_file = args.index_file
+    if index_file is None:
+        temp_dir = tempfile.mkdtemp(prefix='mmm-index-')
+        index_file = os.path.join(temp_dir, 'search_index.db')
+
+    try:
+        index, build_seconds = open_index(index_file, args.emails, args.seed)
+        if build_seconds:
+            print(f'建立索引用时 {build_seconds:.1f} 秒，索引文件 {os.path.getsize(index_file) / 1024 / 1024:.0f} MB')
+
+        print(f'{args.emails} 封邮件，limit={args.limit}，每个查询 {args.repeat} 次')
+        print(f'{"query":<34} {"results":>7} {"p50 ms":>9} {"max ms":>9} {"full p50 ms":>12} {"speedup":>8}')
+        slowest = 0.0
+        minimum = search_index.TOP_K_MIN_CANDIDATES
+        for text in args.queries:
+            query = parse_query(text)
+            results, timings = run_query(index, query, args.limit, args.repeat)
+            slowest = max(slowest, timings[-1])
+            line = f'{text:<34} {len(results):>7} {timings[len(timings) // 2] * 1000:>9.1f} {timings[-1] * 1000:>9.1f}'
+            if not args.no_full:
+                # 关闭提前停止，给所有候选邮件打分
+                search_index.TOP_K_MIN_CANDIDATES = 2 ** 62
+                try:
+                    expected, full_timings = run_query(index, query, args.limit, 1)
+                finally:
+                    search_index.TOP_K_MIN_CANDIDATES = minimum
+                if expected != results:
+                    raise RuntimeError(f'{text}: 提前停止的结果与给所有候选邮件打分的结果不同')
+                line += f' {full_timings[0] * 1000:>12.1f} {full_timings[0] / timings[len(timings) // 2]:>8.1f}'
+            print(line)
+        index.close()
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if slowest * 1000 > args.target_ms:
+        print(f'最慢的查询用时 {slowest * 1000:.1f} ms，超过目标 {args.target_ms:.0f} ms')
+        raise SystemExit(1)
+    print(f'所有查询都在 {args.target_ms:.0f} ms 以内')
+
+
+if __name__ == '__main__':
+    main()
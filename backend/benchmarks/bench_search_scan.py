@@ -0,0 +1,83 @@
+"""
+扫描搜索基准测试：比较不同进程数下全文索引建立前的扫描搜索吞吐量
+
+用法（在 backend 目录下）: python benchmarks/bench_search_scan.py [--emails 50000] [--backend json] [--workers 1 2 4 8 16]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from bench_body_compression import make_email
+from scan_pool import make_partitions, match_record, parallel_available, parallel_scan
+from search_query import parse_query
+from storage import create_email_store
+
+
+def scan_single(store, accounts, matcher):
+    results = []
+    for account in accounts:
+        for email_data in store.iter_emails(account, with_body=matcher.needs_body):
+            if matcher(email_data):
+                results.append(match_record(email_data, account))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='扫描搜索基准测试')
+    parser.add_argument('--emails', type=int, default=50000, help='邮件数')
+    parser.add_argument('--accounts', type=int, default=5, help='账号数')
+    parser.add_argument('--backend', default='json', choices=['json', 'sqlite'], help='邮件存储方式')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='测试的进程数')
+    parser.add_argument('--query', default='shopmall', help='搜索的查询，可以使用 search_query 中的查询语法')
+    args = parser.parse_args()
+
+    if not parallel_available():
+        print('当前系统不支持多进程，无法并行扫描')
+        return
+
+    data_dir = tempfile.mkdtemp(prefix='mmm-bench-')
+    config.STORAGE_BACKEND = args.backend
+    try:
+        store = create_email_store(data_dir)
+        rng = random.Random(0)
+        emails = []
+        for i in range(args.emails):
+            email_data = make_email(rng, i)
+            email_data['account'] = f'user{i % args.accounts}@example.com'
+            emails.append(email_data)
+        if args.backend == 'sqlite':
+            store.save_many(emails)
+        else:
+            for email_data in emails:
+                store.save(email_data)
+        del emails
+        counts = {account: store.count(account) for account in store.accounts()}
+        matcher = parse_query(args.query)
+
+        print(f'{args.emails} 封邮件，{len(counts)} 个账号，存储方式 {args.backend}，CPU 核心数 {os.cpu_count()}')
+        print(f'{"workers":>7} {"seconds":>8} {"emails/s":>10} {"speedup":>8} {"matches":>8}')
+        start = time.perf_counter()
+        expected = sorted(scan_single(store, list(counts), matcher))
+        baseline = time.perf_counter() - start
+        print(f'{"single":>7} {baseline:>8.2f} {args.emails / baseline:>10.0f} {1:>8.2f} {len(expected):>8}')
+
+        for workers in args.workers:
+            start = time.perf_counter()
+            results = parallel_scan(data_dir, make_partitions(counts, workers), matcher, workers)
+            elapsed = time.perf_counter() - start
+            assert sorted(results) == expected
+            print(f'{workers:>7} {elapsed:>8.2f} {args.emails / elapsed:>10.0f} {baseline / elapsed:>8.2f} {len(results):>8}')
+        store.close()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+流式输出内存基准测试：比较 jsonify 一次性返回全部邮件和流式返回的峰值内存
+
+用法（在 backend 目录下）: python benchmarks/bench_stream_memory.py [--emails 20000] [--backend sqlite]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+
+def make_email(i, account, body_size):
+    return {
+        'id': str(uuid.uuid4()),
+        'account': account,
+        'message_id': f'<bench-{i}@example.com>',
+        'subject': f'基准测试邮件 Benchmark message {i}',
+        'from': f'sender{i % 50}@example.com',
+        'date': f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d} 10:{i % 60:02d}:00',
+        'content': '<p>这是一封测试邮件 benchmark body</p>' * max(1, body_size // 40),
+        'attachments': []
+    }
+
+
+def measure(label, func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = func()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{label:<16} {peak / 1024 / 1024:>10.1f} {elapsed:>8.2f} {size / 1024 / 1024:>10.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='流式输出内存基准测试')
+    parser.add_argument('--emails', type=int, default=20000, help='邮件数')
+    parser.add_argument('--body-size', type=int, default=4000, help='每封邮件正文的大致字节数')
+    parser.add_argument('--backend', default='sqlite', choices=['json', 'sqlite'], help='邮件存储方式')
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='mmm-bench-')
+    config.DATA_DIR = data_dir
+    config.STORAGE_BACKEND = args.backend
+    import app
+
+    try:
+        emails = [make_email(i, f'user{i % 20}@example.com', args.body_size) for i in range(args.emails)]
+        if args.backend == 'sqlite':
+            app.email_store.save_many(emails)
+        else:
+            for email_data in emails:
+                app.email_store.save(email_data)
+        del emails
+
+        # 预先建立 json 后端的排序键缓存，两种方式都不计入这部分内存
+        app.email_store.list_page(None, 1)
+
+        with app.app.test_request_context():
+            def jsonify_all():
+                response = app.jsonify(app.get_all_emails())
+                return len(response.get_data())
+
+            def stream_all(mode):
+                def run():
+                    size = 0
+                    for chunk in app.iter_json_chunks(app.email_store.iter_sorted(), mode):
+                        size += len(chunk.encode('utf-8'))
+                    return size
+                return run
+
+            print(f'{args.emails} 封邮件，存储方式 {args.backend}')
+            print(f'{"mode":<16} {"peak MB":>10} {"seconds":>8} {"output MB":>10}')
+            measure('jsonify', jsonify_all)
+            measure('stream json', stream_all('json'))
+            measure('stream ndjson', stream_all('ndjson'))
+    finally:
+        app.email_store.close()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
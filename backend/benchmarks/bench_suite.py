@@ -0,0 +1,396 @@
+"""
+基准测试套件：在本地模拟的 IMAPS 服务器上运行完整的后端，测量收取、去重、邮件列表、邮件详情、搜索和账号邮件数接口的
+吞吐量、延迟分位数和峰值内存（RSS）；结果可以保存为 JSON，并与之前保存的结果比较，发现性能退化
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_suite.py [--emails 5000] [--accounts 5] [--preload 0] [--backend json] [--fetch-mode full]
+                                     [--requests 300] [--scan-workers 1 4] [--output result.json] [--baseline old.json]
+                                     [--threshold 0.2]
+
+--emails 为模拟服务器上的邮件数，通过收取接口下载；--preload 在后端启动前直接生成这么多封邮件到邮件存储中，
+用于在更大的数据规模上测试列表、详情和搜索（例如 --emails 2000 --preload 1000000）。
+后端代码中的 imaplib.IMAP4_SSL 被替换为连接到模拟服务器，收取过程与真实服务器相同（包括 TLS）。
+扫描搜索（全文索引建立前使用）按 --scan-workers 中的每个进程数各测一次，结果为 scan_w<进程数>，吞吐量为每秒扫描的邮件数，
+峰值内存只包含主进程。
+与基准结果比较时，吞吐量下降、p99 延迟或峰值内存增加超过 --threshold 的项目视为退化，返回值为 1
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from fake_imap import FakeIMAPServer, GeneratedMailbox, make_ssl_contexts, redirect_imap4_ssl
+from search_query import parse_query
+from synthetic import account_name, generate_store, make_rfc822, write_accounts_file
+
+SEARCH_QUERIES = [
+    'shopmall',
+    '对账单',
+    'from:alice',
+    'has:attachment larger:40k',
+    'after:2023-01-10 before:2023-01-20',
+    'subject:会议 -has:attachment',
+    'account:user1@example.com 报销'
+]
+
+POLL_INTERVAL = 0.0005  # 等待任务完成时的检查间隔（秒）
+
+# 与基准结果比较的指标：(字段, 数值越大越好)
+COMPARED_FIELDS = [('throughput', True), ('p99_ms', False), ('peak_rss_mb', False)]
+
+# 影响结果的参数，与基准结果不同时给出提示
+WORKLOAD_PARAMS = ('emails', 'accounts', 'preload', 'backend', 'fetch_mode', 'latency', 'requests', 'page_size', 'scan_workers')
+
+
+# 重置进程的峰值 RSS（Linux 4.0 以上），之后读取的峰值只包含当前阶段；不支持时返回 False，峰值从进程启动开始计算
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 上的单位是字节，Linux 上是 KB
+    return peak / 1024 / 1024 if platform.system() == 'Darwin' else peak / 1024
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+# 一个测试阶段的结果：count 为处理的数量（邮件数或请求数），latencies 为每个请求（或每批邮件）的耗时
+def make_result(name, unit, count, elapsed, latencies, extra=None):
+    latencies = sorted(latencies)
+    result = {
+        'name': name,
+        'unit': unit,
+        'count': count,
+        'seconds': round(elapsed, 3),
+        'throughput': round(count / elapsed, 1) if elapsed > 0 else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p90_ms': round(percentile(latencies, 0.90) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round((latencies[-1] if latencies else 0) * 1000, 2),
+        'peak_rss_mb': round(peak_rss_mb(), 1)
+    }
+    result.update(extra or {})
+    return result
+
+
+def print_header():
+    print(f'{"benchmark":<16} {"count":>8} {"throughput":>16} {"p50 ms":>9} {"p90 ms":>9} {"p99 ms":>9} {"max ms":>9} {"peak RSS MB":>12}')
+
+
+def print_result(result):
+    throughput = f'{result["throughput"]:.1f} {result["unit"]}/s'
+    print(f'{result["name"]:<16} {result["count"]:>8} {throughput:>16} {result["p50_ms"]:>9.2f} {result["p90_ms"]:>9.2f} '
+          f'{result["p99_ms"]:>9.2f} {result["max_ms"]:>9.2f} {result["peak_rss_mb"]:>12.1f}')
+
+
+# 模拟服务器上的邮箱：第 i 封邮件属于第 i % accounts 个账号，内容在收取时生成
+def make_mailboxes(emails, accounts, seed, served_bytes):
+    mailboxes = {}
+    for index in range(accounts):
+        account = account_name(index)
+        count = len(range(index, emails, accounts))
+
+        def factory(position, index=index, account=account):
+            raw = make_rfc822(position * accounts + index, accounts, seed)
+            # raw() 在持有邮箱锁时调用，同一个账号的计数不会同时修改
+            served_bytes[account] = served_bytes.get(account, 0) + len(raw)
+            return raw
+
+        mailboxes[account] = GeneratedMailbox(count, factory)
+    return mailboxes
+
+
+class Suite:
+    def __init__(self, app, args, mailboxes, served_bytes):
+        self.app = app
+        self.args = args
+        self.client = app.app.test_client()
+        self.mailboxes = mailboxes
+        self.served_bytes = served_bytes
+        self.rng = random.Random(args.seed)
+        self.accounts = [account_name(index) for index in range(args.accounts)]
+
+        # 记录每批 UID FETCH 从发出请求到处理完最后一封邮件的耗时
+        self.batch_latencies = []
+        original = app.uid_fetch_stream
+
+        def timed_uid_fetch_stream(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                yield from original(*args, **kwargs)
+            finally:
+                self.batch_latencies.append(time.perf_counter() - start)
+
+        app.uid_fetch_stream = timed_uid_fetch_stream
+
+    def wait_job(self, job_id):
+        while True:
+            job = self.client.get(f'/api/jobs/{job_id}').get_json()
+            if job['status'] not in ('queued', 'running'):
+                return job
+            time.sleep(POLL_INTERVAL)
+
+    def total_emails(self):
+        return sum(self.app.get_account_email_count(account) for account in self.accounts)
+
+    # 收取所有账号的邮件，吞吐量按模拟服务器上的邮件数计算
+    def fetch(self, name):
+        self.batch_latencies.clear()
+        self.served_bytes.clear()
+        before = self.total_emails()
+        start = time.perf_counter()
+        job = self.wait_job(self.client.post('/api/fetch/all').get_json()['job_id'])
+        elapsed = time.perf_counter() - start
+        if job['status'] != 'completed':
+            raise RuntimeError(f'{name} 失败: {job}')
+
+        messages = sum(mailbox.count() for mailbox in self.mailboxes.values())
+        megabytes = sum(self.served_bytes.values()) / 1024 / 1024
+        return make_result(name, 'msg', messages, elapsed, self.batch_latencies, {
+            'new_emails': self.total_emails() - before,
+            'mb_per_second': round(megabytes / elapsed, 2) if elapsed > 0 else 0.0
+        })
+
+    # UIDVALIDITY 变化后重新同步全部邮件，所有邮件都已存在，测量去重跳过的速度
+    def dedup(self):
+        for mailbox in self.mailboxes.values():
+            mailbox.uidvalidity += 1
+        result = self.fetch('dedup')
+        if result['new_emails']:
+            raise RuntimeError(f'去重后仍然保存了 {result["new_emails"]} 封新邮件')
+        return result
+
+    # 依次翻页读取各个账号的邮件列表，读完一个账号后从第一页重新开始
+    def list_pages(self):
+        cursors = dict.fromkeys(self.accounts)
+        latencies = []
+        start = time.perf_counter()
+        for i in range(self.args.requests):
+            account = self.accounts[i % len(self.accounts)]
+            url = f'/api/emails/{account}?limit={self.args.page_size}'
+            if cursors[account]:
+                url += f'&cursor={cursors[account]}'
+            request_start = time.perf_counter()
+            page = self.client.get(url).get_json()
+            latencies.append(time.perf_counter() - request_start)
+            cursors[account] = page['next_cursor']
+        return make_result('list', 'req', self.args.requests, time.perf_counter() - start, latencies)
+
+    # 随机读取邮件详情，邮件数远多于详情缓存时大部分请求需要读取存储
+    def detail(self):
+        email_ids = []
+        seen = 0
+        for email_data in self.app.email_store.iter_emails(with_body=False):
+            seen += 1
+            if len(email_ids) < 10000:
+                email_ids.append(email_data['id'])
+            else:
+                index = self.rng.randrange(seen)
+                if index < len(email_ids):
+                    email_ids[index] = email_data['id']
+
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(self.args.requests):
+            email_id = self.rng.choice(email_ids)
+            request_start = time.perf_counter()
+            response = self.client.get(f'/api/email/{email_id}')
+            latencies.append(time.perf_counter() - request_start)
+            if response.status_code != 200:
+                raise RuntimeError(f'读取邮件 {email_id} 失败: {response.status_code}')
+        return make_result('detail', 'req', self.args.requests, time.perf_counter() - start, latencies)
+
+    # 提交搜索任务并等待完成；cached 为 False 时每次搜索前清空结果缓存
+    def search(self, cached):
+        latencies = []
+        results = 0
+        requests = max(len(SEARCH_QUERIES), self.args.requests // 10)
+        if cached:
+            for query in SEARCH_QUERIES:
+                self.wait_job(self.client.get('/api/search', query_string={'q': query}).get_json()['job_id'])
+
+        start = time.perf_counter()
+        for i in range(requests):
+            query = SEARCH_QUERIES[i % len(SEARCH_QUERIES)]
+            if not cached:
+                self.app.search_cache.clear()
+            request_start = time.perf_counter()
+            job_id = self.client.get('/api/search', query_string={'q': query}).get_json()['job_id']
+            job = self.wait_job(job_id)
+            latencies.append(time.perf_counter() - request_start)
+            if job['status'] != 'completed':
+                raise RuntimeError(f'搜索 {query} 失败: {job}')
+            results += len(self.app.job_manager.get(job_id).result or [])
+        return make_result('search_cached' if cached else 'search', 'req', requests, time.perf_counter() - start, latencies,
+                           {'mode': 'index' if self.app.search_index.is_ready() else 'scan', 'results': results})
+
+    # 不使用全文索引，用 workers 个进程逐封扫描，每个查询扫描一遍邮件存储
+    def scan(self, workers):
+        saved = config.SEARCH_SCAN_WORKERS, config.SEARCH_SCAN_PARALLEL_MIN
+        config.SEARCH_SCAN_WORKERS = workers
+        config.SEARCH_SCAN_PARALLEL_MIN = 0
+        latencies = []
+        scanned = 0
+        results = 0
+        try:
+            start = time.perf_counter()
+            for text in SEARCH_QUERIES:
+                query = parse_query(text)
+                accounts = query.accounts()
+                scanned += sum(self.app.get_account_email_count(account) for account in self.accounts
+                               if accounts is None or account in accounts)
+                query_start = time.perf_counter()
+                results += len(self.app.scan_emails(query))
+                latencies.append(time.perf_counter() - query_start)
+            elapsed = time.perf_counter() - start
+        finally:
+            config.SEARCH_SCAN_WORKERS, config.SEARCH_SCAN_PARALLEL_MIN = saved
+        return make_result(f'scan_w{workers}', 'msg', scanned, elapsed, latencies, {'workers': workers, 'results': results})
+
+    # 账号列表和每个账号的邮件数
+    def accounts_count(self):
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(self.args.requests):
+            request_start = time.perf_counter()
+            self.client.get('/api/accounts')
+            latencies.append(time.perf_counter() - request_start)
+        return make_result('accounts', 'req', self.args.requests, time.perf_counter() - start, latencies)
+
+
+# 与基准结果比较，返回退化的项目
+def compare(results, baseline, threshold):
+    baseline_results = {result['name']: result for result in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        old = baseline_results.get(result['name'])
+        if old is None:
+            continue
+        for field, higher_is_better in COMPARED_FIELDS:
+            before, after = old.get(field), result.get(field)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if (higher_is_better and change < -threshold) or (not higher_is_better and change > threshold):
+                regressions.append(f'{result["name"]}.{field}: {before} -> {after} ({change:+.0%})')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='后端基准测试套件')
+    parser.add_argument('--emails', type=int, default=5000, help='模拟服务器上的邮件数（通过收取接口下载）')
+    parser.add_argument('--accounts', type=int, default=5, help='账号数')
+    parser.add_argument('--preload', type=int, default=0, help='后端启动前直接写入邮件存储的邮件数')
+    parser.add_argument('--backend', choices=['json', 'sqlite'], default=config.STORAGE_BACKEND, help='邮件存储方式')
+    parser.add_argument('--fetch-mode', choices=['full', 'headers'], default=config.FETCH_MODE, help='收取模式')
+    parser.add_argument('--latency', type=float, default=0, help='模拟服务器每条命令的往返延迟（秒）')
+    parser.add_argument('--requests', type=int, default=300, help='列表、详情和账号接口的请求数，搜索为其十分之一')
+    parser.add_argument('--page-size', type=int, default=50, help='邮件列表每页的邮件数')
+    parser.add_argument('--scan-workers', type=int, nargs='+', default=sorted({1, os.cpu_count() or 1}),
+                        help='扫描搜索测试的进程数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--data-dir', help='数据目录，默认使用临时目录并在结束后删除')
+    parser.add_argument('--output', help='把结果保存为 JSON 文件')
+    parser.add_argument('--baseline', help='与之前保存的结果比较')
+    parser.add_argument('--threshold', type=float, default=0.2, help='视为退化的变化比例')
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='mmm-suite-')
+    config.DATA_DIR = data_dir
+    config.STORAGE_BACKEND = args.backend
+    config.FETCH_MODE = args.fetch_mode
+    config.IDLE_ENABLED = False
+    config.ACCESS_KEY = ''
+
+    server = None
+    try:
+        os.makedirs(data_dir, exist_ok=True)
+        if args.preload:
+            print(f'正在生成 {args.preload} 封邮件...')
+            # 与模拟服务器上的邮件使用不同的种子，收取时不会被当作重复邮件
+            generate_store(data_dir, args.preload, args.accounts, args.seed + 1)
+        else:
+            write_accounts_file(os.path.join(data_dir, config.ACCOUNTS_FILE), args.accounts)
+
+        served_bytes = {}
+        mailboxes = make_mailboxes(args.emails, args.accounts, args.seed, served_bytes)
+        server_context, client_context = make_ssl_contexts(os.path.join(data_dir, 'bench_cert'))
+        server = FakeIMAPServer(mailboxes, latency=args.latency, idle=False, ssl_context=server_context)
+        server.start()
+
+        with redirect_imap4_ssl(server, client_context):
+            import app
+
+            # 等待后台从已有邮件建立全文索引
+            while not app.search_index.is_ready():
+                time.sleep(0.1)
+
+            suite = Suite(app, args, mailboxes, served_bytes)
+            print(f'{args.emails} 封邮件（模拟服务器）+ {args.preload} 封预先生成的邮件，{args.accounts} 个账号，'
+                  f'存储方式 {args.backend}，收取模式 {args.fetch_mode}')
+            if not reset_peak_rss():
+                print('无法重置峰值 RSS，每项的峰值从进程启动开始计算')
+            print_header()
+
+            results = []
+            for run in (lambda: suite.fetch('fetch'), suite.dedup, suite.list_pages, suite.detail,
+                        lambda: suite.search(False), lambda: suite.search(True), suite.accounts_count,
+                        *[lambda workers=workers: suite.scan(workers) for workers in args.scan_workers]):
+                reset_peak_rss()
+                result = run()
+                print_result(result)
+                results.append(result)
+    finally:
+        if server is not None:
+            server.stop()
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'params': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        changed = [name for name in WORKLOAD_PARAMS if baseline.get('params', {}).get(name) != getattr(args, name)]
+        if changed:
+            print(f'注意：参数 {", ".join(changed)} 与基准结果不同，结果不能直接比较')
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('性能退化:')
+            for item in regressions:
+                print(f'  {item}')
+            raise SystemExit(1)
+        print(f'与 {args.baseline} 相比没有超过 {args.threshold:.0%} 的退化')
+
+
+if __name__ == '__main__':
+    main()
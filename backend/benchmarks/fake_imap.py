@@ -0,0 +1,408 @@
+"""
+用于基准测试的本地 IMAP4 模拟服务器，只实现收取邮件需要的命令
+
+传入 ssl_context 时使用 TLS（IMAPS），配合 redirect_imap4_ssl 可以让后端代码中的 imaplib.IMAP4_SSL
+直接连接到模拟服务器；GeneratedMailbox 在收取时才生成邮件内容，可以模拟上百万封邮件的邮箱
+"""
+import bisect
+import email
+import email.utils
+import imaplib
+import os
+import re
+import select
+import socketserver
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+
+
+class FakeMailbox:
+    def __init__(self, messages=None, uidvalidity=1):
+        self.uidvalidity = uidvalidity
+        self.messages = []  # [(uid, raw_bytes)]
+        self.next_uid = 1
+        self.lock = threading.Lock()
+        self._uids = []     # 与 messages 对应的 UID，按从小到大排列
+        for raw in messages or []:
+            self.append(raw)
+
+    def append(self, raw):
+        with self.lock:
+            self.messages.append((self.next_uid, raw))
+            self._uids.append(self.next_uid)
+            self.next_uid += 1
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.messages)
+
+    def count(self):
+        return len(self._uids)
+
+    def uids(self):
+        with self.lock:
+            return list(self._uids)
+
+    def _raw(self, index):
+        return self.messages[index][1]
+
+    # 按序号集合或 UID 集合（例如 1:100,205）选出邮件，返回 [(序号, UID)]
+    def select(self, message_set, by_uid):
+        with self.lock:
+            uids = self._uids
+            indexes = set()
+            for start, end in _parse_ranges(message_set, (uids[-1] if uids else 0) if by_uid else len(uids)):
+                if by_uid:
+                    indexes.update(range(bisect.bisect_left(uids, start), bisect.bisect_right(uids, end)))
+                else:
+                    indexes.update(range(max(start, 1) - 1, min(end, len(uids))))
+            return [(index + 1, uids[index]) for index in sorted(indexes)]
+
+    # 序号从 1 开始
+    def raw(self, seq):
+        with self.lock:
+            return self._raw(seq - 1)
+
+
+# 邮件内容由 factory(序号) 在收取时生成，不保存在内存中，UID 与序号相同
+class GeneratedMailbox(FakeMailbox):
+    def __init__(self, count, factory, uidvalidity=1):
+        super().__init__(uidvalidity=uidvalidity)
+        self.factory = factory
+        self._uids = range(1, count + 1)
+        self.next_uid = count + 1
+
+    def append(self, raw):
+        raise NotImplementedError('GeneratedMailbox 不支持添加邮件')
+
+    def snapshot(self):
+        return [(uid, self.factory(uid - 1)) for uid in self._uids]
+
+    def _raw(self, index):
+        return self.factory(index)
+
+
+# 把序号集合或 UID 集合解析为 [(起点, 终点)]，* 表示 max_value
+def _parse_ranges(message_set, max_value):
+    ranges = []
+    for item in message_set.split(','):
+        if ':' in item:
+            start, end = item.split(':', 1)
+            start = max_value if start == '*' else int(start)
+            end = max_value if end == '*' else int(end)
+            if start > end:
+                start, end = end, start
+            ranges.append((start, end))
+        else:
+            value = max_value if item == '*' else int(item)
+            ranges.append((value, value))
+    return ranges
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+    wbufsize = 65536  # 响应写入缓冲区，每条命令处理完后再发送，TLS 下不会每行一个记录
+
+    def setup(self):
+        # TLS 握手在处理连接的线程中进行，不阻塞接受新连接
+        if isinstance(self.request, ssl.SSLSocket):
+            self.request.do_handshake()
+        super().setup()
+
+    def send(self, line):
+        if isinstance(line, str):
+            line = line.encode('utf-8')
+        self.wfile.write(line + b'\r\n')
+
+    # 邮件数变化时报告新的 EXISTS，与真实服务器一样在命令响应或 IDLE 期间发送
+    def report_exists(self, mailbox):
+        count = mailbox.count()
+        if count != self.known_exists:
+            self.known_exists = count
+            self.send(f'* {count} EXISTS')
+            return True
+        return False
+
+    # IDLE：等待客户端发送 DONE，期间有新邮件时发送 EXISTS
+    def handle_idle(self, tag, mailbox):
+        self.send('+ idling')
+        self.wfile.flush()
+        while True:
+            readable, _, _ = select.select([self.connection], [], [], 0.05)
+            if readable:
+                line = self.rfile.readline()
+                if not line:
+                    return False
+                if line.strip().upper() == b'DONE':
+                    self.send(f'{tag} OK IDLE terminated')
+                    return True
+                self.send(f'{tag} BAD expected DONE')
+                return True
+            if mailbox is not None and self.report_exists(mailbox):
+                self.wfile.flush()
+
+    def handle(self):
+        server = self.server
+        mailbox = None
+        self.known_exists = 0
+        self.send('* OK FakeIMAP ready')
+        self.wfile.flush()
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            line = line.rstrip(b'\r\n').decode('utf-8', errors='replace')
+            if not line:
+                continue
+
+            # 模拟网络往返延迟
+            if server.latency:
+                time.sleep(server.latency)
+
+            parts = line.split(' ', 2)
+            tag = parts[0]
+            command = parts[1].upper() if len(parts) > 1 else ''
+            args = parts[2] if len(parts) > 2 else ''
+
+            if command == 'CAPABILITY':
+                self.send('* CAPABILITY IMAP4rev1 IDLE' if server.idle else '* CAPABILITY IMAP4rev1')
+                self.send(f'{tag} OK CAPABILITY completed')
+            elif command == 'LOGIN':
+                user = args.split(' ', 1)[0].strip('"')
+                mailbox = server.mailboxes.get(user)
+                if mailbox is None:
+                    self.send(f'{tag} NO LOGIN failed')
+                else:
+                    self.send(f'{tag} OK LOGIN completed')
+            elif command in ('SELECT', 'EXAMINE'):
+                self.known_exists = mailbox.count()
+                self.send(f'* {self.known_exists} EXISTS')
+                self.send('* 0 RECENT')
+                self.send(f'* OK [UIDVALIDITY {mailbox.uidvalidity}] UIDs valid')
+                self.send(f'* OK [UIDNEXT {mailbox.next_uid}] Predicted next UID')
+                self.send(f'{tag} OK [READ-WRITE] {command} completed')
+            elif command == 'STATUS':
+                self.send(f'* STATUS INBOX (MESSAGES {mailbox.count()} UIDVALIDITY {mailbox.uidvalidity} UIDNEXT {mailbox.next_uid})')
+                self.send(f'{tag} OK STATUS completed')
+            elif command == 'NOOP':
+                if mailbox is not None:
+                    self.report_exists(mailbox)
+                self.send(f'{tag} OK NOOP completed')
+            elif command == 'IDLE' and server.idle:
+                if not self.handle_idle(tag, mailbox):
+                    return
+            elif command == 'UID':
+                self.handle_uid(tag, args, mailbox)
+            elif command == 'FETCH':
+                self.handle_fetch(tag, args, mailbox, by_uid=False)
+            elif command == 'SEARCH':
+                ids = ' '.join(str(i + 1) for i in range(mailbox.count()))
+                self.send(f'* SEARCH {ids}'.rstrip())
+                self.send(f'{tag} OK SEARCH completed')
+            elif command == 'CLOSE':
+                self.send(f'{tag} OK CLOSE completed')
+            elif command == 'LOGOUT':
+                self.send('* BYE logging out')
+                self.send(f'{tag} OK LOGOUT completed')
+                return
+            else:
+                self.send(f'{tag} BAD unknown command')
+            self.wfile.flush()
+
+    def handle_uid(self, tag, args, mailbox):
+        sub, _, rest = args.partition(' ')
+        sub = sub.upper()
+        if sub == 'SEARCH':
+            match = re.search(r'UID\s+(\S+)', rest, re.I)
+            if match:
+                uids = [uid for seq, uid in mailbox.select(match.group(1), by_uid=True)]
+                # 与真实服务器一致：n:* 至少返回最大的 UID
+                if not uids and mailbox.count() and match.group(1).endswith('*'):
+                    uids = [mailbox.uids()[-1]]
+            else:
+                uids = mailbox.uids()
+            self.send(('* SEARCH ' + ' '.join(str(uid) for uid in uids)).rstrip())
+            self.send(f'{tag} OK UID SEARCH completed')
+        elif sub == 'FETCH':
+            self.handle_fetch(tag, rest, mailbox, by_uid=True)
+        else:
+            self.send(f'{tag} BAD unknown UID command')
+
+    def handle_fetch(self, tag, args, mailbox, by_uid):
+        message_set, _, items = args.partition(' ')
+        names = FETCH_ITEM_RE.findall(items.upper())
+        for seq, uid in mailbox.select(message_set, by_uid):
+            raw = mailbox.raw(seq)
+            self.wfile.write(f'* {seq} FETCH (UID {uid}'.encode('ascii'))
+            for name in names:
+                if name == 'UID':
+                    continue
+                if name == 'RFC822.SIZE':
+                    self.wfile.write(f' RFC822.SIZE {len(raw)}'.encode('ascii'))
+                elif name == 'BODYSTRUCTURE':
+                    self.wfile.write(b' BODYSTRUCTURE ' + _bodystructure(email.message_from_bytes(raw)))
+                else:
+                    section = name[name.index('[') + 1:-1] if '[' in name else ''
+                    data = raw if name == 'RFC822' else _section(raw, section)
+                    response_name = name if name == 'RFC822' else f'BODY[{section}]'
+                    self.wfile.write(f' {response_name} {{{len(data)}}}\r\n'.encode('ascii') + data)
+            self.send(')')
+        self.send(f'{tag} OK FETCH completed')
+
+
+FETCH_ITEM_RE = re.compile(r'BODY(?:\.PEEK)?\[[^\]]*\]|RFC822\.SIZE|RFC822|BODYSTRUCTURE|UID|FLAGS')
+
+
+def _quote(value):
+    if value is None:
+        return b'NIL'
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return b'"' + value.encode('utf-8') + b'"'
+
+
+def _params(pairs):
+    if not pairs:
+        return b'NIL'
+
+    items = []
+    for key, value in pairs:
+        # RFC 2231 编码的参数按 key*=charset''value 的形式返回
+        if isinstance(value, tuple):
+            charset = value[0] or 'utf-8'
+            text = email.utils.collapse_rfc2231_value(value)
+            key = key + '*'
+            value = f"{charset}''{urllib.parse.quote(text, encoding=charset)}"
+        items.append(_quote(key.upper()) + b' ' + _quote(value))
+    return b'(' + b' '.join(items) + b')'
+
+
+def _payload_bytes(part):
+    if part.get_content_maintype() == 'message':
+        return part.get_payload(0).as_bytes()
+    payload = part.get_payload()
+    return payload.encode('utf-8', errors='surrogateescape') if isinstance(payload, str) else payload
+
+
+# 按 RFC 3501 生成 BODYSTRUCTURE
+def _bodystructure(part):
+    if part.get_content_maintype() == 'multipart':
+        children = b''.join(_bodystructure(child) for child in part.get_payload())
+        return b'(' + children + b' ' + _quote(part.get_content_subtype().upper()) + b')'
+
+    params = [(key, value) for key, value in part.get_params(header='content-type') or []][1:]
+    body = _payload_bytes(part)
+    fields = [
+        _quote(part.get_content_maintype().upper()),
+        _quote(part.get_content_subtype().upper()),
+        _params(params),
+        b'NIL',
+        b'NIL',
+        _quote((part.get('Content-Transfer-Encoding') or '7BIT').upper()),
+        str(len(body)).encode('ascii')
+    ]
+    if part.get_content_maintype() == 'text':
+        fields.append(str(body.count(b'\n')).encode('ascii'))
+    elif part.get_content_type() == 'message/rfc822':
+        fields.extend([b'NIL', _bodystructure(part.get_payload(0)), str(body.count(b'\n')).encode('ascii')])
+
+    disposition = b'NIL'
+    if part.get('Content-Disposition'):
+        disposition_params = part.get_params(header='content-disposition') or []
+        disposition = b'(' + _quote(disposition_params[0][0].upper()) + b' ' + _params(disposition_params[1:]) + b')'
+    fields.extend([b'NIL', disposition, b'NIL', b'NIL'])
+    return b'(' + b' '.join(fields) + b')'
+
+
+# 取出 BODY[section] 对应的原始内容
+def _section(raw, section):
+    if section == '':
+        return raw
+    if section in ('HEADER', 'TEXT'):
+        head, sep, body = raw.partition(b'\r\n\r\n')
+        if not sep:
+            head, sep, body = raw.partition(b'\n\n')
+        return head + sep if section == 'HEADER' else body
+
+    part = email.message_from_bytes(raw)
+    for number in section.split('.'):
+        if part.get_content_maintype() == 'multipart':
+            part = part.get_payload(int(number) - 1)
+        elif part.get_content_type() == 'message/rfc822':
+            part = part.get_payload(0)
+    return _payload_bytes(part)
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mailboxes, host='127.0.0.1', port=0, latency=0, idle=True, ssl_context=None):
+        self.mailboxes = mailboxes
+        self.latency = latency
+        self.idle = idle
+        self.ssl_context = ssl_context
+        super().__init__((host, port), _Handler)
+
+    def get_request(self):
+        sock, address = super().get_request()
+        if self.ssl_context is not None:
+            sock = self.ssl_context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+        return sock, address
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+# 用 openssl 命令生成 localhost 的自签名证书，返回 (服务器的 SSLContext, 信任该证书的客户端 SSLContext)
+def make_ssl_contexts(cert_dir=None):
+    cert_dir = cert_dir or tempfile.mkdtemp(prefix='fake-imap-cert-')
+    os.makedirs(cert_dir, exist_ok=True)
+    cert_file = os.path.join(cert_dir, 'cert.pem')
+    key_file = os.path.join(cert_dir, 'key.pem')
+    if not os.path.exists(cert_file):
+        try:
+            subprocess.run(
+                ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                 '-keyout', key_file, '-out', cert_file, '-subj', '/CN=localhost',
+                 '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1'],
+                check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise RuntimeError(f'无法用 openssl 生成测试证书: {e}')
+
+    server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_context.load_cert_chain(cert_file, key_file)
+    client_context = ssl.create_default_context(cafile=cert_file)
+    return server_context, client_context
+
+
+# 在 with 块中把 imaplib.IMAP4_SSL 的连接指向模拟服务器，忽略后端传入的服务器地址
+@contextmanager
+def redirect_imap4_ssl(server, client_context):
+    original = imaplib.IMAP4_SSL
+
+    class RedirectedIMAP4_SSL(original):
+        def __init__(self, host='', port=imaplib.IMAP4_SSL_PORT, **kwargs):
+            kwargs['ssl_context'] = client_context
+            super().__init__('localhost', server.port, **kwargs)
+
+    imaplib.IMAP4_SSL = RedirectedIMAP4_SSL
+    try:
+        yield
+    finally:
+        imaplib.IMAP4_SSL = original
@@ -0,0 +1,272 @@
+"""
+合成邮件数据：按指定规模生成邮件存储（与后端保存的格式相同的 data 目录）和 RFC822 原始邮件，用于基准测试
+
+邮件混合了营销 HTML（同一品牌共用模板）、中文纯文本和带附件的邮件，每封邮件的内容只由随机种子和序号决定，
+同样的参数每次生成相同的数据，也可以只生成其中任意一封（模拟 IMAP 服务器按需生成邮件时使用）
+
+用法（在 backend 目录下）:
+    python benchmarks/synthetic.py store --emails 100000 --accounts 5 --data-dir /tmp/mail-data [--backend sqlite]
+    python benchmarks/synthetic.py rfc822 --emails 10000 --output /tmp/corpus [--mbox]
+"""
+import argparse
+import base64
+import email.utils
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from email.header import Header
+from functools import lru_cache
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from attachment_store import AttachmentStore
+from bench_body_compression import BRANDS, make_html
+from date_utils import parse_email_date
+from storage import create_email_store
+
+SERVER = 'imap.bench.local'
+PASSWORD = 'password'
+
+# 邮件类型的比例（每 10 封）：5 封营销 HTML，3 封中文纯文本，2 封带附件
+HTML_SHARE = 5
+TEXT_SHARE = 3
+
+ATTACHMENT_POOL_SIZE = 32  # 附件从固定的内容中选取，与真实邮箱一样有很多重复的附件
+START_TIME = datetime(2023, 1, 1, tzinfo=timezone.utc)
+TIMEZONES = [timezone(timedelta(hours=8)), timezone.utc, timezone(timedelta(hours=-5))]
+
+PHRASES = [
+    '请查收本月的对账单', '会议改到下周三下午两点', '附件是项目进度报告', '您的订单已经发货',
+    '发票已开具，请注意查收', '关于季度预算的说明', '明天的评审材料已经更新', '感谢您的支持与配合',
+    '请在周五前确认合同条款', 'Please review the attached document', 'Weekly sync notes and action items',
+    'Your password will expire soon', '服务器维护通知', '新员工入职安排', '报销流程有调整'
+]
+SENDERS = ['张伟', '王芳', '李娜', 'Alice Chen', 'Bob Smith', '刘洋', 'Carol Wu', '陈静']
+ATTACHMENT_NAMES = ['报告.pdf', 'invoice.pdf', '合同草案.docx', 'data.xlsx', 'photo.jpg', 'notes.txt']
+
+
+def account_name(index):
+    return f'user{index}@example.com'
+
+
+# 第 i 封邮件所属的账号
+def message_account(i, accounts):
+    return account_name(i % accounts)
+
+
+# 附件内容：按序号生成的伪随机字节，大小 2KB 到 64KB
+@lru_cache(maxsize=ATTACHMENT_POOL_SIZE * 2)
+def attachment_content(index, seed=0):
+    rng = random.Random(f'attachment-{seed}-{index}')
+    return rng.randbytes(rng.randint(2, 64) * 1024)
+
+
+# 第 i 封邮件的字段，rfc822 和 store 两种格式都由它生成
+def message_fields(i, accounts=5, seed=0):
+    rng = random.Random(f'message-{seed}-{i}')
+    kind = i % 10
+    sent = START_TIME + timedelta(seconds=i * 600 + rng.randint(0, 599))
+    sent = sent.astimezone(TIMEZONES[i % len(TIMEZONES)])
+
+    fields = {
+        'account': message_account(i, accounts),
+        'message_id': f'<synthetic-{seed}-{i}@bench.local>',
+        'date': email.utils.format_datetime(sent),
+        'text': None,
+        'html': None,
+        'attachments': []
+    }
+    if kind < HTML_SHARE:
+        brand = BRANDS[i % len(BRANDS)]
+        fields['subject'] = f'{brand} 本周精选 #{i}'
+        # 邮件地址只能使用 ASCII，中文品牌名使用序号作为域名
+        domain = brand.lower() if brand.isascii() else f'brand{BRANDS.index(brand)}'
+        fields['sender'] = (brand, f'news@{domain}.com')
+        fields['html'] = make_html(rng, brand)
+        fields['text'] = f'{brand} 本周精选，请使用支持 HTML 的邮件客户端查看。'
+    else:
+        sender = rng.choice(SENDERS)
+        fields['subject'] = f'{rng.choice(PHRASES)} ({i})'
+        fields['sender'] = (sender, f'sender{i % 97}@corp.example.com')
+        paragraphs = ['，'.join(rng.choice(PHRASES) for _ in range(rng.randint(3, 8))) + '。' for _ in range(rng.randint(2, 12))]
+        fields['text'] = f'{sender}您好：\n\n' + '\n\n'.join(paragraphs) + '\n\n祝好\n'
+        if kind >= HTML_SHARE + TEXT_SHARE:
+            for _ in range(rng.randint(1, 2)):
+                index = rng.randrange(ATTACHMENT_POOL_SIZE)
+                fields['attachments'].append((f'{index}-{rng.choice(ATTACHMENT_NAMES)}', index))
+    return fields
+
+
+# base64 编码，每行 76 个字符，CRLF 换行
+def encode_base64(data):
+    return base64.encodebytes(data).replace(b'\n', b'\r\n')
+
+
+@lru_cache(maxsize=ATTACHMENT_POOL_SIZE * 2)
+def encoded_attachment(index, seed=0):
+    return encode_base64(attachment_content(index, seed))
+
+
+def text_part(subtype, text):
+    return (f'Content-Type: text/{subtype}; charset="utf-8"\r\n'
+            f'Content-Transfer-Encoding: base64\r\n\r\n').encode('ascii') + encode_base64(text.encode('utf-8'))
+
+
+def attachment_part(filename, index, seed):
+    encoded_name = email.utils.encode_rfc2231(filename, 'utf-8')
+    return (f'Content-Type: application/octet-stream; name*={encoded_name}\r\n'
+            f'Content-Disposition: attachment; filename*={encoded_name}\r\n'
+            f'Content-Transfer-Encoding: base64\r\n\r\n').encode('ascii') + encoded_attachment(index, seed)
+
+
+def multipart(subtype, boundary, parts):
+    body = b''.join(b'--' + boundary.encode('ascii') + b'\r\n' + part + b'\r\n' for part in parts)
+    return (f'Content-Type: multipart/{subtype}; boundary="{boundary}"\r\n\r\n').encode('ascii') + body + f'--{boundary}--\r\n'.encode('ascii')
+
+
+# 第 i 封邮件的 RFC822 原始内容（CRLF 换行）；直接拼接 MIME 结构，比 email.message 快得多，生成百万封邮件时也不会太慢
+def make_rfc822(i, accounts=5, seed=0):
+    fields = message_fields(i, accounts, seed)
+    name, address = fields['sender']
+    headers = (
+        f'Subject: {Header(fields["subject"], "utf-8").encode()}\r\n'
+        f'From: {email.utils.formataddr((name, address))}\r\n'
+        f'To: {fields["account"]}\r\n'
+        f'Date: {fields["date"]}\r\n'
+        f'Message-ID: {fields["message_id"]}\r\n'
+        f'MIME-Version: 1.0\r\n'
+    ).encode('ascii')
+
+    body = text_part('plain', fields['text'])
+    if fields['html']:
+        body = multipart('alternative', f'=_alt_{seed}_{i}', [body, text_part('html', fields['html'])])
+    if fields['attachments']:
+        attachments = [attachment_part(filename, index, seed) for filename, index in fields['attachments']]
+        body = multipart('mixed', f'=_mixed_{seed}_{i}', [body] + attachments)
+    return headers + body
+
+
+# 第 i 封邮件保存到邮件存储中的记录，附件引用 attachment_store 中的文件（attachment_store 为 None 时只记录大小）
+def make_record(i, accounts=5, seed=0, attachment_store=None, staging_dir=None):
+    fields = message_fields(i, accounts, seed)
+    timestamp, date = parse_email_date(fields['date'])
+    email_id = str(uuid.UUID(int=random.Random(f'id-{seed}-{i}').getrandbits(128)))
+
+    attachments = []
+    for filename, index in fields['attachments']:
+        data = attachment_content(index, seed)
+        item = {'filename': filename, 'path': f'/api/attachments/{email_id}/{filename}', 'size': len(data)}
+        if attachment_store is not None:
+            sha256 = hashlib.sha256(data).hexdigest()
+            tmp_path = os.path.join(staging_dir, uuid.uuid4().hex)
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            attachment_store.add(tmp_path, sha256, len(data), fields['account'])
+            item['sha256'] = sha256
+        attachments.append(item)
+
+    return {
+        'id': email_id,
+        'account': fields['account'],
+        'message_id': fields['message_id'],
+        'subject': fields['subject'],
+        'from': f'{fields["sender"][0]} <{fields["sender"][1]}>',
+        'date': date,
+        'timestamp': timestamp,
+        'content': fields['html'] or fields['text'],
+        'attachments': attachments
+    }
+
+
+# 账号配置文件，所有账号使用同一个模拟服务器
+def write_accounts_file(accounts_file, accounts):
+    with open(accounts_file, 'w', encoding='utf-8') as f:
+        json.dump({'server': SERVER, 'emails': [{'user': account_name(i), 'password': PASSWORD} for i in range(accounts)]}, f, indent=2)
+
+
+# 生成 data 目录：邮件存储、附件存储和账号配置；去重索引、账号统计和全文索引由后端启动时从邮件重建
+def generate_store(data_dir, emails, accounts=5, seed=0, batch_size=1000, progress=None):
+    os.makedirs(data_dir, exist_ok=True)
+    write_accounts_file(os.path.join(data_dir, config.ACCOUNTS_FILE), accounts)
+    email_store = create_email_store(data_dir)
+    attachment_store = AttachmentStore(os.path.join(data_dir, config.ATTACHMENT_BLOBS_DIR))
+    staging_dir = tempfile.mkdtemp(prefix='synthetic-', dir=data_dir)
+    save_many = getattr(email_store, 'save_many', None)
+    try:
+        for start in range(0, emails, batch_size):
+            batch = [make_record(i, accounts, seed, attachment_store, staging_dir) for i in range(start, min(start + batch_size, emails))]
+            if save_many is not None:
+                save_many(batch)
+            else:
+                for email_data in batch:
+                    email_store.save(email_data)
+            if progress is not None:
+                progress(start + len(batch))
+    finally:
+        email_store.close()
+        os.rmdir(staging_dir)
+
+
+# 生成 RFC822 语料：每封邮件一个 .eml 文件（每 1000 封一个子目录），或者一个 mbox 文件
+def generate_rfc822(output, emails, accounts=5, seed=0, mbox=False, progress=None):
+    os.makedirs(output, exist_ok=True)
+    mbox_file = open(os.path.join(output, 'corpus.mbox'), 'wb') if mbox else None
+    try:
+        for i in range(emails):
+            raw = make_rfc822(i, accounts, seed)
+            if mbox_file is not None:
+                # mboxrd：正文中以 From 开头的行加上 >
+                body = raw.replace(b'\r\n', b'\n').replace(b'\nFrom ', b'\n>From ')
+                mbox_file.write(b'From synthetic@bench.local Thu Jan  1 00:00:00 2023\n' + body + b'\n')
+            else:
+                directory = os.path.join(output, f'{i // 1000:04d}')
+                os.makedirs(directory, exist_ok=True)
+                with open(os.path.join(directory, f'{i:07d}.eml'), 'wb') as f:
+                    f.write(raw)
+            if progress is not None and (i + 1) % 1000 == 0:
+                progress(i + 1)
+    finally:
+        if mbox_file is not None:
+            mbox_file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成合成邮件数据')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    store_parser = subparsers.add_parser('store', help='生成邮件存储（data 目录）')
+    store_parser.add_argument('--data-dir', required=True, help='输出的 data 目录，可以直接作为后端的 DATA_DIR')
+    store_parser.add_argument('--backend', choices=['json', 'sqlite'], help='邮件存储方式，默认使用 config.py 中的设置')
+
+    rfc822_parser = subparsers.add_parser('rfc822', help='生成 RFC822 原始邮件')
+    rfc822_parser.add_argument('--output', required=True, help='输出目录')
+    rfc822_parser.add_argument('--mbox', action='store_true', help='输出为一个 mbox 文件，而不是每封邮件一个 .eml 文件')
+
+    for subparser in (store_parser, rfc822_parser):
+        subparser.add_argument('--emails', type=int, default=1000, help='邮件数（1k 到 1M）')
+        subparser.add_argument('--accounts', type=int, default=5, help='账号数，邮件依次分配给各个账号')
+        subparser.add_argument('--seed', type=int, default=0, help='随机种子，相同的种子生成相同的邮件')
+    args = parser.parse_args()
+
+    start = time.time()
+    def progress(count):
+        print(f'已生成 {count}/{args.emails} 封邮件（{count / (time.time() - start):.0f} 封/秒）', end='\r', flush=True)
+
+    if args.command == 'store':
+        if args.backend:
+            config.STORAGE_BACKEND = args.backend
+        generate_store(args.data_dir, args.emails, args.accounts, args.seed, progress=progress)
+    else:
+        generate_rfc822(args.output, args.emails, args.accounts, args.seed, args.mbox, progress=progress)
+    print(f'\n完成，共 {args.emails} 封邮件，用时 {time.time() - start:.1f} 秒')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+邮件正文压缩：正文压缩后保存，只有读取邮件详情（以及搜索扫描）时才解压，邮件列表只读取未压缩的元数据
+
+压缩后的格式为 MAGIC + 算法（1 字节）+ 字典 id（4 字节，0 表示不使用字典）+ 压缩数据，
+读取时按头部选择算法和字典，不同设置下保存的邮件可以混在一起。安装了 zstandard 时可以使用 zstd，
+否则使用标准库的 zlib；用已有邮件训练的共享字典保存在 data/body_dicts/ 中，
+营销邮件之间重复的 HTML 模板只需要在字典中保存一份
+"""
+import os
+import struct
+import threading
+import zlib
+from collections import Counter
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b'MB'
+HEADER = struct.Struct('>2sBI')
+
+ZLIB = 1
+ZSTD = 2
+METHODS = {'zlib': ZLIB, 'zstd': ZSTD}
+
+ZLIB_MAX_DICT_SIZE = 32 * 1024  # zlib 只使用预设字典的最后 32KB
+CURRENT_DICT_FILE = 'current'   # 字典目录中记录压缩时使用的字典 id 的文件
+
+
+# 字典 id 由内容计算，0 保留给不使用字典的数据
+def dictionary_id(data):
+    return zlib.crc32(data) or 1
+
+
+# 用已有的正文训练共享字典；安装了 zstandard 时使用 zstd 的训练算法，
+# 否则把多封邮件中重复出现的行拼接为字典，最常用的内容放在最后（zlib 对距离近的内容编码更短）
+def train_dictionary(samples, size=112640, method='zstd'):
+    samples = [sample.encode('utf-8') if isinstance(sample, str) else sample for sample in samples]
+    if method == 'zstd' and zstandard is not None:
+        try:
+            return zstandard.train_dictionary(size, samples).as_bytes()
+        except zstandard.ZstdError:
+            # 样本太少时 zstd 无法训练，使用下面的方法
+            pass
+
+    if method == 'zlib':
+        size = min(size, ZLIB_MAX_DICT_SIZE)
+    counts = Counter()
+    for sample in samples:
+        counts.update(set(line.strip() for line in sample.splitlines() if len(line.strip()) >= 8))
+
+    chosen = []
+    total = 0
+    for line, count in sorted(counts.items(), key=lambda item: item[1] * len(item[0]), reverse=True):
+        if count < 2 or total + len(line) + 1 > size:
+            continue
+        chosen.append(line)
+        total += len(line) + 1
+    return b'\n'.join(reversed(chosen))
+
+
+class BodyCodec:
+    def __init__(self, method='none', level=None, dict_dir=None):
+        if method == 'auto':
+            method = 'zstd' if zstandard is not None else 'zlib'
+        if method not in ('none', 'zlib', 'zstd'):
+            raise ValueError(f'未知的正文压缩方式: {method}')
+        if method == 'zstd' and zstandard is None:
+            raise RuntimeError('正文压缩方式为 zstd，但没有安装 zstandard（pip install zstandard）')
+
+        self.method = method
+        self.level = level
+        self.dict_dir = dict_dir
+        self._dicts = {}      # 字典 id -> 字典内容
+        self._dict_id = 0     # 压缩时使用的字典，0 表示不使用
+        self._local = threading.local()  # zstd 的压缩器不能在线程间共享
+        self.load_dictionaries()
+
+    @property
+    def enabled(self):
+        return self.method != 'none'
+
+    @property
+    def dictionary_id(self):
+        return self._dict_id
+
+    # 读取字典目录中的所有字典，解压旧数据时可能用到不是当前使用的字典
+    def load_dictionaries(self):
+        if not self.dict_dir or not os.path.isdir(self.dict_dir):
+            return
+        dicts = {}
+        for filename in os.listdir(self.dict_dir):
+            if filename.endswith('.dict'):
+                with open(os.path.join(self.dict_dir, filename), 'rb') as f:
+                    data = f.read()
+                dicts[dictionary_id(data)] = data
+
+        current = 0
+        try:
+            with open(os.path.join(self.dict_dir, CURRENT_DICT_FILE), 'r', encoding='utf-8') as f:
+                current = int(f.read().strip() or '0', 16)
+        except (OSError, ValueError):
+            pass
+
+        self._dicts = dicts
+        self._dict_id = current if current in dicts else 0
+        self._local = threading.local()
+
+    # 保存新字典并在之后的压缩中使用，旧字典保留用于解压已有的数据
+    def save_dictionary(self, data):
+        dict_id = dictionary_id(data)
+        os.makedirs(self.dict_dir, exist_ok=True)
+        with open(os.path.join(self.dict_dir, f'{dict_id:08x}.dict'), 'wb') as f:
+            f.write(data)
+        tmp_file = os.path.join(self.dict_dir, f'{CURRENT_DICT_FILE}.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(f'{dict_id:08x}')
+        os.replace(tmp_file, os.path.join(self.dict_dir, CURRENT_DICT_FILE))
+        self.load_dictionaries()
+        return dict_id
+
+    # 不压缩时原样返回字符串，否则返回带头部的压缩数据
+    def compress(self, text):
+        if not self.enabled or text is None:
+            return text
+        data = text.encode('utf-8')
+        method = METHODS[self.method]
+        if method == ZSTD:
+            compressed = self._zstd_compressor().compress(data)
+        else:
+            level = self.level if self.level is not None else 6
+            if self._dict_id:
+                compressor = zlib.compressobj(level, zdict=self._dicts[self._dict_id][-ZLIB_MAX_DICT_SIZE:])
+            else:
+                compressor = zlib.compressobj(level)
+            compressed = compressor.compress(data) + compressor.flush()
+        return HEADER.pack(MAGIC, method, self._dict_id) + compressed
+
+    # 字符串（未压缩保存的正文）原样返回
+    def decompress(self, data):
+        if data is None or isinstance(data, str):
+            return data
+        data = bytes(data)
+        magic, method, dict_id = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError('不是压缩的正文数据')
+        if dict_id and dict_id not in self._dicts:
+            raise ValueError(f'找不到正文压缩字典 {dict_id:08x}')
+        payload = memoryview(data)[HEADER.size:]
+
+        if method == ZSTD:
+            if zstandard is None:
+                raise RuntimeError('正文使用 zstd 压缩，需要安装 zstandard（pip install zstandard）')
+            raw = self._zstd_decompressor(dict_id).decompress(payload)
+        elif method == ZLIB:
+            if dict_id:
+                decompressor = zlib.decompressobj(zdict=self._dicts[dict_id][-ZLIB_MAX_DICT_SIZE:])
+            else:
+                decompressor = zlib.decompressobj()
+            raw = decompressor.decompress(payload) + decompressor.flush()
+        else:
+            raise ValueError(f'未知的正文压缩算法: {method}')
+        return raw.decode('utf-8')
+
+    def _zstd_dict(self, dict_id):
+        return zstandard.ZstdCompressionDict(self._dicts[dict_id]) if dict_id else None
+
+    def _zstd_compressor(self):
+        compressor = getattr(self._local, 'compressor', None)
+        if compressor is None:
+            level = self.level if self.level is not None else 3
+            compressor = zstandard.ZstdCompressor(level=level, dict_data=self._zstd_dict(self._dict_id))
+            self._local.compressor = compressor
+        return compressor
+
+    def _zstd_decompressor(self, dict_id):
+        decompressors = getattr(self._local, 'decompressors', None)
+        if decompressors is None:
+            decompressors = self._local.decompressors = {}
+        if dict_id not in decompressors:
+            decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=self._zstd_dict(dict_id))
+        return decompressors[dict_id]
@@ -0,0 +1,89 @@
+"""
+按当前的 BODY_COMPRESSION 设置重新保存已有邮件的正文，可以先用已有邮件训练共享字典
+
+用法（在 backend 目录下）: python compress_bodies.py [--train-dictionary] [--samples 2000] [--dict-size 112640]
+运行前先停止后端服务，并把 config.py 中的 BODY_COMPRESSION 改为 'zlib'、'zstd' 或 'auto'；完成后重新统计各账号的占用空间
+"""
+import argparse
+import os
+import random
+import time
+import config
+from body_codec import train_dictionary
+from storage import create_email_store, SqliteEmailStore
+from attachment_store import AttachmentStore
+from account_stats import rebuild_accounts
+
+BATCH_SIZE = 1000
+
+
+# 从所有邮件中均匀抽取样本（蓄水池抽样），只保留较长的正文
+def sample_bodies(email_store, count):
+    samples = []
+    seen = 0
+    rng = random.Random(0)
+    for email_data in email_store.iter_emails():
+        content = email_data.get('content') or ''
+        if len(content) < 64:
+            continue
+        seen += 1
+        if len(samples) < count:
+            samples.append(content)
+        else:
+            index = rng.randrange(seen)
+            if index < count:
+                samples[index] = content
+    return samples
+
+
+# 逐个账号先取出邮件 id，再分批读取并重新保存，避免边读边写同一张表
+def recompress(email_store):
+    count = 0
+    save_many = getattr(email_store, 'save_many', None)
+    for account in email_store.accounts():
+        email_ids = [email_data['id'] for email_data in email_store.iter_emails(account, with_body=False)]
+        for start in range(0, len(email_ids), BATCH_SIZE):
+            batch = [email_store.get(email_id, account) for email_id in email_ids[start:start + BATCH_SIZE]]
+            batch = [email_data for email_data in batch if email_data is not None]
+            if save_many is not None:
+                save_many(batch)
+            else:
+                for email_data in batch:
+                    email_store.save(email_data)
+            count += len(batch)
+            print(f'已处理 {count} 封邮件...')
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='压缩已有邮件的正文')
+    parser.add_argument('--train-dictionary', action='store_true', help='先用已有邮件训练共享字典')
+    parser.add_argument('--samples', type=int, default=2000, help='训练字典使用的邮件数')
+    parser.add_argument('--dict-size', type=int, default=112640, help='字典大小（字节），zlib 最多使用 32KB')
+    args = parser.parse_args()
+
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), config.DATA_DIR)
+    email_store = create_email_store(data_dir)
+    codec = email_store.codec
+    if not codec.enabled:
+        print("config.py 中的 BODY_COMPRESSION 为 'none'，请先改为 'zlib'、'zstd' 或 'auto'")
+        raise SystemExit(1)
+
+    start = time.time()
+    if args.train_dictionary:
+        samples = sample_bodies(email_store, args.samples)
+        dictionary = train_dictionary(samples, args.dict_size, codec.method)
+        if dictionary:
+            dict_id = codec.save_dictionary(dictionary)
+            print(f'已用 {len(samples)} 封邮件训练字典 {dict_id:08x}（{len(dictionary)} 字节）')
+        else:
+            print('邮件太少，没有训练出字典')
+
+    count = recompress(email_store)
+    if isinstance(email_store, SqliteEmailStore):
+        email_store.vacuum()
+    attachment_store = AttachmentStore(os.path.join(data_dir, config.ATTACHMENT_BLOBS_DIR))
+    rebuild_accounts(data_dir, email_store, attachment_store, email_store.accounts())
+    attachment_store.close()
+    email_store.close()
+    print(f'完成，共 {count} 封邮件，用时 {time.time() - start:.1f} 秒')
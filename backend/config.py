@@ -14,3 +14,50 @@ DATA_DIR = 'data'                # 数据目录
 ACCOUNTS_FILE = 'accounts.json'  # 账号配置文件
 EMAILS_DIR = 'emails'            # 邮件存储目录
 ATTACHMENTS_DIR = 'attachments'  # 附件存储目录
+ATTACHMENT_BLOBS_DIR = 'attachment_blobs'  # 按内容保存的附件目录，相同的附件只保存一份
+SYNC_STATE_DIR = 'sync_state'    # 增量同步状态目录
+DEDUP_INDEX_DIR = 'dedup_index'  # 邮件去重索引目录
+SEARCH_INDEX_FILE = 'search_index.db'  # 全文索引文件
+STORAGE_BACKEND = 'json'         # 邮件存储方式：json 每封邮件一个文件，sqlite 使用 SQLite 数据库
+SQLITE_STORE_FILE = 'emails.db'  # SQLite 邮件数据库文件
+MAX_PAGE_SIZE = 500              # 分页获取邮件列表时每页最多的邮件数
+ACCOUNT_STATS_FILE = 'account_stats.json'  # 账号统计文件（邮件数量、最后同步时间、占用空间）
+EMAIL_LOCATIONS_FILE = 'email_locations.idx'  # 邮件位置索引文件（json 存储使用）
+EMAIL_CACHE_SIZE = 200           # 内存中缓存的最近打开的邮件数
+MAX_NOTIFICATIONS = 100          # 最多保留的通知数，相同的通知合并为一条
+SEARCH_CACHE_SIZE = 100          # 缓存结果的搜索数，账号收到新邮件时该账号相关的结果失效
+SEARCH_CACHE_MAX_RESULTS = 200000  # 所有缓存的搜索结果的总邮件数
+SEARCH_SCAN_WORKERS = 0          # 全文索引建立前扫描搜索使用的进程数，0 表示使用全部 CPU 核心，1 表示在后端进程中扫描
+SEARCH_SCAN_PARALLEL_MIN = 5000  # 邮件总数达到这个数量时才使用多个进程扫描
+BODY_COMPRESSION = 'none'        # 正文压缩：none 不压缩，zlib，zstd（需要安装 zstandard），auto 安装了 zstandard 时用 zstd 否则用 zlib
+BODY_COMPRESSION_LEVEL = None    # 压缩级别，None 使用默认级别（zlib 6，zstd 3）
+BODY_DICT_DIR = 'body_dicts'     # 正文压缩共享字典目录，用 compress_bodies.py --train-dictionary 生成
+
+# 进度推送配置
+PROGRESS_EVENT_INTERVAL = 0.5    # 同一类进度两次推送之间的最短间隔（秒），期间的更新合并为一次
+EVENT_HEARTBEAT_INTERVAL = 15    # 没有进度更新时发送心跳的间隔（秒）
+
+# 邮件收取配置
+FETCH_WORKERS = 4            # 同时收取的账号数
+MAX_CONNECTIONS_PER_HOST = 4 # 每个邮件服务器的最大并发连接数
+FETCH_BATCH_SIZE = 100       # 每次 UID FETCH 请求的邮件数
+FETCH_MODE = 'full'          # 收取模式：full 下载完整邮件，headers 只下载邮件头，正文和附件在查看时下载
+FETCH_RETRY_LIMIT = 3        # 处理失败的邮件最多尝试的次数，之后不再重试
+IMAP_POOL_SIZE = 8           # 连接池中最多保留的空闲 IMAP 连接数，0 表示每次收取后断开
+IMAP_POOL_IDLE_TIMEOUT = 300 # 空闲连接的最长保留时间（秒），超时后下次收取时重新登录
+
+# 运行指标配置
+METRICS_ENABLED = True       # 是否记录运行指标并通过 /metrics 输出，关闭后计时和计数几乎没有开销
+
+# 后台任务配置
+JOB_WORKERS = 4              # 同时执行的收取和搜索任务数
+JOB_QUEUE_SIZE = 100         # 最多排队的任务数，超出时提交任务返回 503
+JOB_RESULT_TTL = 600         # 任务结束后保留进度和结果的时间（秒）
+
+# 新邮件监听配置
+IDLE_ENABLED = False         # 是否在后台监听新邮件（IMAP IDLE），有新邮件时自动收取
+IDLE_MAX_CONNECTIONS = 10    # 最多保持的监听连接数，超出的账号定期用 STATUS 检查
+IDLE_TIMEOUT = 1500          # 每次 IDLE 的最长时间（秒），到时重新发送 IDLE，RFC 2177 要求不超过 29 分钟
+IDLE_POLL_INTERVAL = 60      # 服务器不支持 IDLE 或超出连接数时的检查间隔（秒）
+IDLE_RECONNECT_DELAY = 5     # 连接断开后第一次重连的等待时间（秒），之后每次加倍
+IDLE_RECONNECT_MAX_DELAY = 300  # 重连等待时间的上限（秒）
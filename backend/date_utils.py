@@ -0,0 +1,59 @@
+"""
+邮件日期解析：按 RFC 5322 解析 Date 头，返回 UTC 时间戳和显示用的时间字符串，
+排序和按时间范围查询都使用时间戳
+"""
+import re
+import calendar
+from datetime import datetime
+from email.utils import parsedate_tz
+from functools import lru_cache
+
+DISPLAY_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 同一批邮件中大量 Date 头是重复的，缓存解析结果
+DATE_CACHE_SIZE = 8192
+
+# 无法按 RFC 5322 解析时，只提取 "日 月 年 时:分:秒" 部分
+FALLBACK_RE = re.compile(r'\d{1,2}\s+\w{3}\s+\d{4}\s+\d{1,2}:\d{1,2}:\d{1,2}')
+DISPLAY_RE = re.compile(r'^(\d{4})-(\d{2})-(\d{2}) (\d{2}):(\d{2}):(\d{2})$')
+
+
+# 解析 Date 头，返回 (UTC 时间戳, 显示字符串)
+# 显示字符串是发件人所在时区的时间，与以前保存的邮件一致；无法解析时返回 (None, 原始字符串)
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_email_date(date_str):
+    parsed = parsedate_tz(date_str)
+    if parsed is None:
+        match = FALLBACK_RE.search(date_str)
+        parsed = parsedate_tz(match.group(0)) if match else None
+        if parsed is None:
+            return None, date_str
+
+    try:
+        dt = datetime(*parsed[:6])
+    except ValueError:
+        return None, date_str
+
+    # 没有时区信息时按 UTC 处理
+    timestamp = calendar.timegm(dt.timetuple()) - (parsed[9] or 0)
+    return timestamp, dt.strftime(DISPLAY_FORMAT)
+
+
+# 把以前保存的显示字符串转换为时间戳，时区信息已经丢失，按 UTC 处理
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def display_date_timestamp(date):
+    match = DISPLAY_RE.match(date or '')
+    if not match:
+        return 0
+    try:
+        return calendar.timegm(datetime(*map(int, match.groups())).timetuple())
+    except ValueError:
+        return 0
+
+
+# 邮件的排序时间戳，以前保存的没有 timestamp 字段的邮件从 date 字段计算
+def email_timestamp(email_data):
+    timestamp = email_data.get('timestamp')
+    if timestamp is None:
+        return display_date_timestamp(email_data.get('date'))
+    return timestamp
@@ -0,0 +1,100 @@
+"""
+邮件去重索引：每个账号一个索引文件，按 Message-ID 或（标题、日期、发件人）哈希判断邮件是否已存在
+"""
+import os
+import re
+import hashlib
+import threading
+
+
+# 生成邮件的去重键，有 Message-ID 时优先使用
+def make_dedup_keys(message_id, subject, date, sender):
+    keys = []
+    if message_id:
+        keys.append('mid:' + message_id.strip().lower())
+
+    fingerprint = '\x00'.join([subject or '', date or '', sender or ''])
+    keys.append('hash:' + hashlib.sha1(fingerprint.encode('utf-8')).hexdigest())
+    return keys
+
+
+class AccountDedupIndex:
+    def __init__(self, index_file, keys):
+        self.index_file = index_file
+        self._keys = keys
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def contains(self, keys):
+        return any(key in self._keys for key in keys)
+
+    # 追加新的去重键，每次只追加一行，不会重写整个索引
+    def add(self, keys):
+        with self._lock:
+            new_keys = [key for key in keys if key not in self._keys]
+            if not new_keys:
+                return
+            with open(self.index_file, 'a', encoding='utf-8') as f:
+                f.write(''.join(key + '\n' for key in new_keys))
+            self._keys.update(new_keys)
+
+
+class DedupIndex:
+    def __init__(self, index_dir, email_store):
+        self.index_dir = index_dir
+        self.email_store = email_store
+        os.makedirs(index_dir, exist_ok=True)
+
+    def _index_file(self, account):
+        safe_name = re.sub(r'[^\w\.@-]', '_', account)
+        return os.path.join(self.index_dir, f'{safe_name}.idx')
+
+    # 加载账号的去重索引，索引不存在时从已保存的邮件重建
+    def open(self, account):
+        index_file = self._index_file(account)
+        if not os.path.exists(index_file):
+            return self.rebuild(account)
+
+        keys = set()
+        with open(index_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    keys.add(line)
+        return AccountDedupIndex(index_file, keys)
+
+    # 读取账号已保存的所有邮件重建索引
+    def rebuild(self, account):
+        keys = set()
+        for email_data in self.email_store.iter_emails(account, with_body=False):
+            keys.update(make_dedup_keys(
+                email_data.get('message_id'),
+                email_data.get('subject'),
+                email_data.get('date'),
+                email_data.get('from')
+            ))
+
+        index_file = self._index_file(account)
+        tmp_file = f'{index_file}.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(''.join(key + '\n' for key in sorted(keys)))
+        os.replace(tmp_file, index_file)
+        return AccountDedupIndex(index_file, keys)
+
+
+if __name__ == '__main__':
+    import sys
+    import config
+    from storage import create_email_store
+
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), config.DATA_DIR)
+    email_store = create_email_store(data_dir)
+    dedup_index = DedupIndex(os.path.join(data_dir, config.DEDUP_INDEX_DIR), email_store)
+
+    # 用法: python dedup_index.py [账号 ...]，不指定账号时重建全部
+    accounts = sys.argv[1:] or email_store.accounts()
+    for account in accounts:
+        index = dedup_index.rebuild(account)
+        print(f'{account}: {len(index)} 个去重键')
@@ -0,0 +1,38 @@
+"""
+清理附件存储：按邮件存储中实际引用的附件重新计算引用计数，删除没有邮件引用的附件文件，
+例如保存邮件失败或进程中途退出后留下的文件；删除了附件的账号重新统计占用空间
+
+用法（在 backend 目录下）: python gc_attachments.py
+清理前请先停止后端服务
+"""
+import os
+import time
+from collections import Counter
+import config
+from storage import create_email_store
+from attachment_store import AttachmentStore
+from account_stats import rebuild_accounts
+from migrate_attachments import format_size
+
+
+# 统计邮件存储中每个附件被引用的次数，只读取元数据，不读取正文
+def count_references(email_store):
+    references = Counter()
+    for email_data in email_store.iter_emails(with_body=False):
+        for item in email_data.get('attachments', []):
+            if item.get('sha256'):
+                references[item['sha256']] += 1
+    return references
+
+
+if __name__ == '__main__':
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), config.DATA_DIR)
+    email_store = create_email_store(data_dir)
+    attachment_store = AttachmentStore(os.path.join(data_dir, config.ATTACHMENT_BLOBS_DIR))
+
+    start = time.time()
+    removed, freed, accounts = attachment_store.collect(count_references(email_store))
+    rebuild_accounts(data_dir, email_store, attachment_store, accounts)
+    attachment_store.close()
+    email_store.close()
+    print(f'清理完成，删除 {removed} 个附件文件，释放 {format_size(freed)}，用时 {time.time() - start:.1f} 秒')
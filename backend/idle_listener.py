@@ -0,0 +1,313 @@
+"""
+新邮件监听：为每个账号保持一个 IMAP IDLE 连接，收到 EXISTS 通知时回调收取新邮件
+
+服务器不支持 IDLE 时在同一连接上定期发送 NOOP；保持的连接数超过上限后，
+其余账号由一个线程定期用短连接发送 STATUS 检查。连接断开后按指数退避重连；
+连接的读取超时略长于重新发送 IDLE 和 NOOP 的间隔，半开的连接在超时后同样重连
+"""
+import imaplib
+import re
+import socket
+import threading
+import time
+
+EXISTS_RE = re.compile(rb'^\* (\d+) EXISTS')
+UIDNEXT_RE = re.compile(rb'UIDNEXT\s+(\d+)')
+
+# 读取超时比重新发送 IDLE 或 NOOP 的间隔多等这么多秒，留给服务器响应
+READ_TIMEOUT_MARGIN = 60
+
+
+class IdleListener:
+    def __init__(self, on_new_mail, max_connections=10, idle_timeout=1500, poll_interval=60,
+                 reconnect_delay=5, reconnect_max_delay=300):
+        # on_new_mail(account) 在监听线程中调用，返回后才继续监听该账号
+        self.on_new_mail = on_new_mail
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        # 正常情况下服务器在这段时间内一定会响应（IDLE 到时发送 DONE 或 NOOP），超过时认为连接已断开
+        self.read_timeout = max(idle_timeout, poll_interval) + READ_TIMEOUT_MARGIN
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._sessions = {}  # 账号 -> 正在进行的 IDLE 会话
+        self._status = {}    # 账号 -> 监听状态
+
+    # 开始监听，accounts 为 [(账号, 密码)]；前 max_connections 个账号保持连接，其余定期检查
+    def start(self, server, accounts):
+        self.stop()
+        self._stop = threading.Event()
+        held = accounts[:max(0, self.max_connections)]
+        polled = accounts[len(held):]
+
+        for account, password in held:
+            self._set_status(account, mode='connecting')
+            self._spawn(self._run_connection, server, account, password)
+        if polled:
+            for account, password in polled:
+                self._set_status(account, mode='status')
+            self._spawn(self._run_status_poller, server, polled)
+
+    def _spawn(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    # 停止监听，结束正在进行的 IDLE 并等待线程退出
+    def stop(self, timeout=5):
+        self._stop.set()
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            session.done()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        with self._lock:
+            self._status = {}
+
+    # 每个账号的监听状态
+    def status(self):
+        with self._lock:
+            return {account: dict(status) for account, status in self._status.items()}
+
+    def _set_status(self, account, **fields):
+        with self._lock:
+            self._status.setdefault(account, {'mode': 'connecting', 'error': None, 'retry_in': None, 'last_new_mail': None}).update(fields)
+
+    def _notify(self, account):
+        self._set_status(account, last_new_mail=time.strftime('%Y-%m-%d %H:%M:%S'))
+        try:
+            self.on_new_mail(account)
+        except Exception as e:
+            self._set_status(account, error=f'收取新邮件失败: {str(e)}')
+
+    # 重连等待时间：reconnect_delay * 2^(失败次数 - 1)，不超过 reconnect_max_delay
+    def _backoff(self, failures):
+        return min(self.reconnect_max_delay, self.reconnect_delay * (2 ** (failures - 1)))
+
+    # 保持一个账号的连接，断开后退避重连
+    def _run_connection(self, server, account, password):
+        stop = self._stop
+        known = None
+        failures = 0
+        while not stop.is_set():
+            mail = None
+            timed_out = False
+            try:
+                mail = imaplib.IMAP4_SSL(server, timeout=self.read_timeout)
+                mail.login(account, password)
+                typ, data = mail.select('INBOX', readonly=True)
+                if typ != 'OK':
+                    raise imaplib.IMAP4.error(f'SELECT failed: {data}')
+                failures = 0
+                count = int(data[0])
+                _pop_exists(mail)
+
+                # 断线期间收到的邮件在重连后补收
+                if known is not None and count > known:
+                    self._notify(account)
+                known = count
+
+                if 'IDLE' in mail.capabilities:
+                    self._set_status(account, mode='idle', error=None, retry_in=None)
+                    known = self._idle_loop(mail, account, known)
+                else:
+                    self._set_status(account, mode='poll', error=None, retry_in=None)
+                    known = self._noop_loop(mail, account, known)
+            except Exception as e:
+                if stop.is_set():
+                    break
+                failures += 1
+                delay = self._backoff(failures)
+                if isinstance(e, socket.timeout):
+                    timed_out = True
+                    error = f'{self.read_timeout} 秒内没有收到服务器的响应，连接可能已断开'
+                else:
+                    error = str(e)
+                self._set_status(account, mode='reconnecting', error=error, retry_in=delay)
+                stop.wait(delay)
+            finally:
+                with self._lock:
+                    self._sessions.pop(account, None)
+                if mail is not None:
+                    # 读取超时的连接不再发送 LOGOUT，否则又要等待一次读取超时才能重连
+                    try:
+                        if timed_out:
+                            mail.shutdown()
+                        else:
+                            mail.logout()
+                    except Exception:
+                        pass
+
+    # 反复进入 IDLE，邮件数增加时退出 IDLE 收取新邮件；返回最后已知的邮件数
+    def _idle_loop(self, mail, account, known):
+        stop = self._stop
+        while not stop.is_set():
+            session = IdleSession(mail, self.idle_timeout)
+            with self._lock:
+                self._sessions[account] = session
+            if stop.is_set():
+                break
+            count = session.run(known)
+            with self._lock:
+                self._sessions.pop(account, None)
+
+            if count is not None and count > known:
+                known = count
+                self._notify(account)
+                # 收取期间到达的邮件在下一个命令的响应中报告，有新邮件时再收取一次
+                mail.noop()
+                count = _pop_exists(mail)
+                if count is not None and count > known:
+                    self._notify(account)
+            if count is not None:
+                known = count
+        return known
+
+    # 不支持 IDLE 时定期发送 NOOP，服务器在响应中报告新的邮件数
+    def _noop_loop(self, mail, account, known):
+        stop = self._stop
+        while not stop.wait(self.poll_interval):
+            mail.noop()
+            count = _pop_exists(mail)
+            if count is None:
+                continue
+            if count > known:
+                self._notify(account)
+            known = count
+        return known
+
+    # 超过连接上限的账号：每个检查周期用短连接查询 UIDNEXT，变化时收取新邮件
+    def _run_status_poller(self, server, accounts):
+        stop = self._stop
+        uidnext = {}
+        failures = {}
+        next_check = {}
+        while not stop.is_set():
+            for account, password in accounts:
+                if stop.is_set():
+                    break
+                if next_check.get(account, 0) > time.monotonic():
+                    continue
+                try:
+                    value = _status_uidnext(server, account, password, self.read_timeout)
+                    failures[account] = 0
+                    self._set_status(account, mode='status', error=None, retry_in=None)
+                    if account in uidnext and value != uidnext[account]:
+                        self._notify(account)
+                    uidnext[account] = value
+                except Exception as e:
+                    failures[account] = failures.get(account, 0) + 1
+                    delay = self._backoff(failures[account])
+                    self._set_status(account, error=str(e), retry_in=delay)
+                    next_check[account] = time.monotonic() + delay
+            stop.wait(self.poll_interval)
+
+
+# 一次 IDLE 命令：等待服务器的 EXISTS 通知，超时或收到通知后发送 DONE 结束
+# 其他线程可以调用 done() 提前结束，读取响应的线程随后收到服务器的完成响应
+class IdleSession:
+    def __init__(self, mail, timeout):
+        self.mail = mail
+        self.timeout = timeout
+        self.last_exists = None
+        self._done_lock = threading.Lock()
+        self._idling = False
+        self._done_requested = False
+        self._done_sent = False
+
+    # 结束 IDLE；在服务器接受 IDLE 之前调用时，接受后立即结束
+    def done(self):
+        with self._done_lock:
+            self._done_requested = True
+            if not self._idling or self._done_sent:
+                return
+            self._done_sent = True
+        self._send_done()
+
+    def _start_idling(self):
+        with self._done_lock:
+            self._idling = True
+            if not self._done_requested or self._done_sent:
+                return
+            self._done_sent = True
+        self._send_done()
+
+    def _send_done(self):
+        try:
+            self.mail.send(b'DONE\r\n')
+        except Exception:
+            pass
+
+    # 返回 IDLE 期间服务器报告的最新邮件数，没有报告时返回 None
+    def run(self, known):
+        mail = self.mail
+        tag = mail._new_tag()
+        mail.send(tag + b' IDLE\r\n')
+
+        # 有些服务器在继续响应之前先发送未标记响应
+        while True:
+            line = mail._get_line()
+            if line.startswith(b'+'):
+                self._start_idling()
+                break
+            if line.startswith(tag):
+                raise imaplib.IMAP4.error(f'IDLE rejected: {line.decode(errors="replace")}')
+            self._check_exists(line, known)
+
+        # RFC 2177 要求客户端至少每 29 分钟重新发送一次 IDLE
+        timer = threading.Timer(self.timeout, self.done)
+        timer.daemon = True
+        timer.start()
+        try:
+            if self.last_exists is not None and self.last_exists > known:
+                self.done()
+            while True:
+                line = mail._get_line()
+                if line.startswith(tag):
+                    if not line[len(tag):].lstrip().upper().startswith(b'OK'):
+                        raise imaplib.IMAP4.error(f'IDLE failed: {line.decode(errors="replace")}')
+                    return self.last_exists
+                if line.startswith(b'* BYE'):
+                    raise imaplib.IMAP4.abort(line.decode(errors='replace'))
+                if self._check_exists(line, known):
+                    self.done()
+        finally:
+            timer.cancel()
+
+    def _check_exists(self, line, known):
+        match = EXISTS_RE.match(line)
+        if not match:
+            return False
+        self.last_exists = int(match.group(1))
+        return self.last_exists > known
+
+
+# 取出 imaplib 保存的最新 EXISTS 响应
+def _pop_exists(mail):
+    typ, data = mail.response('EXISTS')
+    values = [int(value) for value in data or [] if value]
+    return values[-1] if values else None
+
+
+# 用短连接查询 INBOX 的 UIDNEXT
+def _status_uidnext(server, account, password, timeout=None):
+    mail = imaplib.IMAP4_SSL(server, timeout=timeout)
+    try:
+        mail.login(account, password)
+        typ, data = mail.status('INBOX', '(MESSAGES UIDNEXT)')
+        if typ != 'OK' or not data or not data[0]:
+            raise imaplib.IMAP4.error(f'STATUS failed: {data}')
+        match = UIDNEXT_RE.search(data[0])
+        if not match:
+            raise imaplib.IMAP4.error(f'STATUS without UIDNEXT: {data[0]!r}')
+        return int(match.group(1))
+    finally:
+        try:
+            mail.logout()
+        except Exception:
+            pass
@@ -0,0 +1,133 @@
+"""
+IMAP 会话池：按 (服务器, 账号) 保存已登录的连接，下次收取时直接复用，省去 TCP/TLS 握手和 LOGIN
+
+取出连接时先发送 NOOP 检查连接是否可用，不可用或空闲超过 idle_timeout 秒的连接直接关闭并重新登录；
+使用过程中出错的连接不放回池中
+"""
+import imaplib
+import threading
+import time
+from contextlib import contextmanager
+import metrics
+
+
+class IMAPSessionPool:
+    def __init__(self, max_size=8, idle_timeout=300):
+        self.max_size = max_size          # 池中最多保留的空闲连接数
+        self.idle_timeout = idle_timeout  # 空闲连接的最长保留时间（秒）
+        self._lock = threading.Lock()
+        self._idle = {}  # (服务器, 账号) -> [(连接, 放回时间)]，最近放回的在最后
+        self._stats = {'created': 0, 'reused': 0, 'discarded': 0}
+
+    # 取出一个已登录的连接，with 块正常结束后放回池中，出错时关闭
+    @contextmanager
+    def session(self, server, account, password):
+        mail = self.acquire(server, account, password)
+        try:
+            yield mail
+        except BaseException:
+            self.discard(mail)
+            raise
+        self.release(server, account, mail)
+
+    # 取出一个已登录（未选择邮箱）的连接，没有可用的空闲连接时新建
+    def acquire(self, server, account, password):
+        key = (server, account)
+        while True:
+            with self._lock:
+                sessions = self._idle.get(key)
+                if not sessions:
+                    break
+                mail, released = sessions.pop()
+                if not sessions:
+                    del self._idle[key]
+
+            if time.monotonic() - released > self.idle_timeout:
+                self.discard(mail)
+                continue
+            try:
+                mail.noop()
+            except Exception:
+                self.discard(mail)
+                continue
+            with self._lock:
+                self._stats['reused'] += 1
+            return mail
+
+        with metrics.imap_connect_seconds.time(server=server):
+            mail = imaplib.IMAP4_SSL(server)
+        try:
+            with metrics.imap_login_seconds.time(server=server):
+                mail.login(account, password)
+        except Exception:
+            self.discard(mail)
+            raise
+        with self._lock:
+            self._stats['created'] += 1
+        return mail
+
+    # 使用完毕的连接放回池中，调用方需要保证连接处于正常状态（没有未读完的响应）
+    def release(self, server, account, mail):
+        if self.max_size <= 0:
+            self._logout(mail)
+            return
+
+        with self._lock:
+            self._idle.setdefault((server, account), []).append((mail, time.monotonic()))
+            expired = self._evict()
+        for item in expired:
+            self._logout(item)
+
+    # 在持有锁时调用：取出超时的连接和超过容量时最久没有使用的连接
+    def _evict(self):
+        now = time.monotonic()
+        removed = []
+        entries = []
+        for key, sessions in self._idle.items():
+            for mail, released in sessions:
+                if now - released > self.idle_timeout:
+                    removed.append(mail)
+                else:
+                    entries.append((released, key, mail))
+
+        entries.sort(key=lambda entry: entry[0])
+        overflow = max(0, len(entries) - self.max_size)
+        removed.extend(mail for released, key, mail in entries[:overflow])
+
+        if removed:
+            removed_ids = set(map(id, removed))
+            for key in list(self._idle):
+                self._idle[key] = [(mail, released) for mail, released in self._idle[key] if id(mail) not in removed_ids]
+                if not self._idle[key]:
+                    del self._idle[key]
+        return removed
+
+    # 出错或状态未知的连接直接断开，不再放回池中
+    def discard(self, mail):
+        with self._lock:
+            self._stats['discarded'] += 1
+        try:
+            mail.shutdown()
+        except Exception:
+            pass
+
+    def _logout(self, mail):
+        try:
+            mail.logout()
+        except Exception:
+            pass
+
+    # 空闲连接数和累计的新建、复用、丢弃次数
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = sum(len(sessions) for sessions in self._idle.values())
+        return stats
+
+    # 关闭所有空闲连接，例如账号密码修改后或退出时
+    def close_all(self):
+        with self._lock:
+            sessions = [mail for items in self._idle.values() for mail, released in items]
+            self._idle.clear()
+        for mail in sessions:
+            self._logout(mail)
@@ -0,0 +1,313 @@
+"""
+IMAP 批量收取：按 UID 区间分批发送 UID FETCH，并逐封读取服务器的多邮件响应
+"""
+import base64
+import binascii
+import quopri
+import re
+import urllib.parse
+from email.utils import decode_rfc2231
+
+FETCH_LINE_RE = re.compile(rb'^\* (\d+) FETCH ')
+LITERAL_RE = re.compile(rb'\{(\d+)\}$')
+
+# 交给 literal_consumer 的字面量每次读取的字节数
+LITERAL_CHUNK_SIZE = 65536
+
+
+# 把 UID 列表压缩成 IMAP 消息集，例如 [1, 2, 3, 7] -> '1:3,7'
+def compress_uid_set(uids):
+    ranges = []
+    for uid in sorted(uids):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+
+    return ','.join(str(start) if start == end else f'{start}:{end}' for start, end in ranges)
+
+
+# 把 UID 列表按批次大小切分
+def iter_uid_batches(uids, batch_size):
+    batch_size = max(1, batch_size)
+    for i in range(0, len(uids), batch_size):
+        yield uids[i:i + batch_size]
+
+
+# 字面量前面的数据项名称，例如 b'(UID 12 RFC822 ' -> 'RFC822'
+def _literal_name(text):
+    return text.rstrip().rsplit(b' ', 1)[-1].lstrip(b'(').decode('ascii', errors='replace').upper()
+
+
+# 读取一条完整的 FETCH 响应（可能包含多个字面量），返回 (文本片段列表, 字面量列表)
+# literal_consumer(数据项名称) 返回带 feed 方法的对象时，字面量分块交给它处理，不在内存中保留
+def _read_fetch_response(mail, line, literal_consumer=None):
+    texts = []
+    literals = []
+    while True:
+        match = LITERAL_RE.search(line)
+        if not match:
+            texts.append(line)
+            return texts, literals
+
+        text = line[:match.start()]
+        size = int(match.group(1))
+        texts.append(text)
+        consumer = literal_consumer(_literal_name(text)) if literal_consumer else None
+        if consumer is None:
+            literals.append(mail.read(size))
+        else:
+            while size > 0:
+                chunk = mail.read(min(size, LITERAL_CHUNK_SIZE))
+                if not chunk:
+                    raise mail.abort('connection closed while reading literal')
+                consumer.feed(chunk)
+                size -= len(chunk)
+            literals.append(consumer)
+        line = mail._get_line()
+
+
+# 把 FETCH 响应切分成词法单元：括号、原子、字符串和字面量，NIL 解析为 None
+_OPEN = object()
+_CLOSE = object()
+
+def _tokenize(texts, literals):
+    for i, text in enumerate(texts):
+        pos = 0
+        length = len(text)
+        while pos < length:
+            char = text[pos:pos + 1]
+            if char == b' ':
+                pos += 1
+            elif char == b'(':
+                yield _OPEN
+                pos += 1
+            elif char == b')':
+                yield _CLOSE
+                pos += 1
+            elif char == b'"':
+                value = bytearray()
+                pos += 1
+                while pos < length and text[pos:pos + 1] != b'"':
+                    if text[pos:pos + 1] == b'\\':
+                        pos += 1
+                    value += text[pos:pos + 1]
+                    pos += 1
+                pos += 1
+                yield bytes(value)
+            else:
+                start = pos
+                while pos < length and text[pos:pos + 1] not in (b' ', b'(', b')'):
+                    # BODY[HEADER.FIELDS (SUBJECT)] 这类原子的方括号内可以有空格和括号
+                    if text[pos:pos + 1] == b'[':
+                        end = text.find(b']', pos)
+                        pos = length if end < 0 else end
+                    pos += 1
+                atom = text[start:pos]
+                yield None if atom.upper() == b'NIL' else atom
+        if i < len(literals):
+            yield literals[i]
+
+
+# 把词法单元组装成嵌套列表
+def _parse_tokens(tokens):
+    stack = [[]]
+    for token in tokens:
+        if token is _OPEN:
+            stack.append([])
+        elif token is _CLOSE:
+            if len(stack) > 1:
+                value = stack.pop()
+                stack[-1].append(value)
+        else:
+            stack[-1].append(token)
+    return stack[0]
+
+
+# 解析一条 FETCH 响应，返回 {数据项名称: 值}，例如 {'UID': b'12', 'RFC822': b'...'}
+def parse_fetch_items(texts, literals):
+    texts = [FETCH_LINE_RE.sub(b'', texts[0], count=1)] + texts[1:]
+    values = _parse_tokens(_tokenize(texts, literals))
+    if not values or not isinstance(values[0], list):
+        return {}
+
+    pairs = values[0]
+    items = {}
+    for i in range(0, len(pairs) - 1, 2):
+        if isinstance(pairs[i], bytes):
+            items[pairs[i].decode('ascii', errors='replace').upper()] = pairs[i + 1]
+    return items
+
+
+# 把 BODYSTRUCTURE 的参数列表转换成字典，键名为小写
+def _params_to_dict(params):
+    result = {}
+    if not isinstance(params, list):
+        return result
+
+    for i in range(0, len(params) - 1, 2):
+        key = _to_str(params[i]).lower()
+        value = _to_str(params[i + 1])
+        # RFC 2231 编码的参数，例如 filename*=utf-8''%E4%BD%A0
+        if key.endswith('*'):
+            charset, language, value = decode_rfc2231(value)
+            value = urllib.parse.unquote(value, encoding=charset or 'utf-8', errors='replace')
+            key = key[:-1]
+        result[key] = value
+    return result
+
+
+def _to_str(value):
+    if value is None:
+        return ''
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return str(value)
+
+
+# 解析单个非 multipart 部分
+def _parse_leaf(node, section):
+    maintype = _to_str(node[0]).lower()
+    subtype = _to_str(node[1]).lower() if len(node) > 1 else ''
+    params = _params_to_dict(node[2]) if len(node) > 2 else {}
+    encoding = _to_str(node[5]).lower() if len(node) > 5 else '7bit'
+    try:
+        size = int(node[6]) if len(node) > 6 else 0
+    except (TypeError, ValueError):
+        size = 0
+
+    # 扩展字段的位置取决于类型：text 多一个行数，message/rfc822 多信封、结构和行数
+    extension_index = 7
+    if maintype == 'text':
+        extension_index += 1
+    elif maintype == 'message' and subtype == 'rfc822':
+        extension_index += 3
+
+    disposition = ''
+    disposition_params = {}
+    disposition_node = node[extension_index + 1] if len(node) > extension_index + 1 else None
+    if isinstance(disposition_node, list) and disposition_node:
+        disposition = _to_str(disposition_node[0]).lower()
+        disposition_params = _params_to_dict(disposition_node[1]) if len(disposition_node) > 1 else {}
+
+    return {
+        'section': section,
+        'type': f'{maintype}/{subtype}',
+        'charset': params.get('charset', ''),
+        'encoding': encoding,
+        'size': size,
+        'disposition': disposition,
+        'filename': disposition_params.get('filename') or params.get('name') or ''
+    }
+
+
+def _walk_bodystructure(node, prefix, leaves):
+    if not isinstance(node, list) or not node:
+        return
+
+    if isinstance(node[0], list):
+        # multipart：子部分依次编号，最后是子类型和扩展字段
+        index = 0
+        while index < len(node) and isinstance(node[index], list):
+            section = f'{prefix}.{index + 1}' if prefix else str(index + 1)
+            _walk_bodystructure(node[index], section, leaves)
+            index += 1
+    else:
+        leaves.append(_parse_leaf(node, prefix or '1'))
+
+
+# 解析 BODYSTRUCTURE，返回 (正文部分列表, 附件部分列表)
+# 与完整收取时的规则一致：有文件名的部分是附件，其他 text/plain、text/html 部分是正文
+def parse_bodystructure(structure):
+    leaves = []
+    _walk_bodystructure(structure, '', leaves)
+
+    text_parts = []
+    attachment_parts = []
+    for leaf in leaves:
+        if leaf['filename']:
+            attachment_parts.append(leaf)
+        elif leaf['type'] in ('text/plain', 'text/html') and leaf['disposition'] != 'attachment':
+            text_parts.append(leaf)
+    return text_parts, attachment_parts
+
+
+# 按 BODYSTRUCTURE 中编码后的大小估算解码后的大小：base64 去掉每行（76 个字符）的 CRLF 后按 3/4 计算，
+# 其他编码按原大小
+def estimate_decoded_size(size, encoding):
+    if (encoding or '').lower() == 'base64':
+        lines = (size + 77) // 78
+        return max(0, (size - 2 * lines) * 3 // 4)
+    return size
+
+
+# 按 Content-Transfer-Encoding 解码部分内容
+def decode_transfer_encoding(data, encoding):
+    if data is None:
+        return b''
+
+    encoding = (encoding or '').lower()
+    if encoding == 'base64':
+        try:
+            return base64.b64decode(data)
+        except binascii.Error:
+            return binascii.a2b_base64(data)
+    if encoding == 'quoted-printable':
+        return quopri.decodestring(data)
+    return data
+
+
+# 发送一次 UID FETCH，逐封返回 (uid, {数据项名称: 值})
+# 不经过 imaplib 的响应缓存，同一时间只在内存中保留一封邮件
+# 指定 literal_consumer 时，它接收的字面量在结果中的值是 literal_consumer 返回的对象
+def uid_fetch_stream(mail, uids, items='(UID RFC822)', literal_consumer=None):
+    if not uids:
+        return
+
+    tag = mail._new_tag()
+    mail.send(tag + b' UID FETCH ' + compress_uid_set(uids).encode('ascii') + b' ' + items.encode('ascii') + b'\r\n')
+
+    completed = False
+    try:
+        while True:
+            line = mail._get_line()
+
+            # 命令结束
+            if line.startswith(tag + b' '):
+                completed = True
+                result = line[len(tag) + 1:]
+                if not result.startswith(b'OK'):
+                    raise mail.error(f'UID FETCH failed: {result.decode("utf-8", errors="replace")}')
+                return
+
+            if not FETCH_LINE_RE.match(line):
+                # 其他未标记响应（如 EXISTS）在这里忽略
+                if line.startswith(b'* BYE'):
+                    completed = True
+                    raise mail.abort(line.decode('utf-8', errors='replace'))
+                continue
+
+            texts, literals = _read_fetch_response(mail, line, literal_consumer)
+            fetched = parse_fetch_items(texts, literals)
+
+            # 只有 UID 的 FETCH 响应（例如服务器主动推送的 FLAGS 变化）不是请求的数据
+            if 'UID' not in fetched or not set(fetched) - {'UID', 'FLAGS'}:
+                continue
+
+            yield int(fetched['UID']), fetched
+    finally:
+        # 调用方提前停止读取时，读完剩余响应，保证连接还能继续使用
+        if not completed:
+            _drain(mail, tag)
+        mail.tagged_commands.pop(tag, None)
+
+
+def _drain(mail, tag):
+    try:
+        while True:
+            line = mail._get_line()
+            if line.startswith(tag + b' '):
+                return
+            _read_fetch_response(mail, line)
+    except Exception:
+        pass
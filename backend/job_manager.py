@@ -0,0 +1,229 @@
+"""
+后台任务管理：收取和搜索作为任务提交到有界线程池中执行，每个任务有自己的 id、状态、进度和结果
+
+同一个 key 同时只能有一个排队或运行中的任务；运行中的任务通过 job.cancelled 检查是否被取消；
+结束的任务保留 result_ttl 秒后删除
+"""
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED = (COMPLETED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# 同一个 key 已经有排队或运行中的任务
+class JobConflict(Exception):
+    def __init__(self, job):
+        super().__init__(f'job {job.id} is already {job.status}')
+        self.job = job
+
+
+# 排队的任务数达到上限
+class JobQueueFull(Exception):
+    pass
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class Job:
+    def __init__(self, kind, params=None, key=None, progress_source=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.key = key
+        self.status = QUEUED
+        self.error = None
+        self.result = None
+        self.created_at = _now()
+        self.started_at = None
+        self.finished_at = None
+        self.finished_time = None  # 结束时的 time.monotonic()，用于计算保留时间
+        self._progress = {}
+        # 运行中从 progress_source() 读取进度，例如收取任务使用全局收取进度
+        self._progress_source = progress_source
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._future = None
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    # 任务函数在可以安全停止的位置调用，已被取消时抛出 JobCancelled
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def set_progress(self, progress):
+        with self._lock:
+            self._progress = dict(progress)
+
+    @property
+    def progress(self):
+        with self._lock:
+            source = self._progress_source if self.status == RUNNING else None
+            progress = self._progress
+        return source() if source is not None else dict(progress)
+
+    def _finish(self, status, result=None, error=None):
+        with self._lock:
+            if self._progress_source is not None:
+                self._progress = self._progress_source()
+                self._progress_source = None
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = _now()
+            self.finished_time = time.monotonic()
+
+    # 任务信息，不包含结果
+    def snapshot(self):
+        return {
+            'id': self.id,
+            'type': self.kind,
+            'params': self.params,
+            'status': self.status,
+            'progress': self.progress,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+class JobManager:
+    def __init__(self, max_workers=4, max_queued=100, result_ttl=600):
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._active_keys = {}  # key -> 排队或运行中的任务
+
+        # 延迟执行的函数和过期任务的清理由同一个后台线程处理
+        self._timer_cond = threading.Condition()
+        self._timers = []
+        self._timer_seq = itertools.count()
+        self._timer_thread = None
+        self._closed = False
+
+    # 提交任务，func(job, *args) 的返回值作为任务结果；progress 为开始执行前的进度
+    def submit(self, kind, func, *args, key=None, params=None, progress=None, progress_source=None):
+        job = Job(kind, params, key, progress_source)
+        if progress is not None:
+            job.set_progress(progress)
+        with self._lock:
+            if key is not None and key in self._active_keys:
+                raise JobConflict(self._active_keys[key])
+            queued = sum(1 for item in self._jobs.values() if item.status == QUEUED)
+            if queued >= self.max_queued:
+                raise JobQueueFull()
+            self._jobs[job.id] = job
+            if key is not None:
+                self._active_keys[key] = job
+        job._future = self._executor.submit(self._run, job, func, args)
+        return job
+
+    def _run(self, job, func, args):
+        with self._lock:
+            if job.status != QUEUED:
+                return
+            job.status = RUNNING
+            job.started_at = _now()
+
+        try:
+            result = func(job, *args)
+        except JobCancelled:
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            self._finish(job, FAILED, error=str(e))
+        else:
+            self._finish(job, CANCELLED if job.cancelled else COMPLETED, result)
+
+    def _finish(self, job, status, result=None, error=None):
+        job._finish(status, result, error)
+        with self._lock:
+            if job.key is not None and self._active_keys.get(job.key) is job:
+                del self._active_keys[job.key]
+        self.call_later(self.result_ttl, self._expire, job.id)
+
+    def _expire(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status in FINISHED and time.monotonic() - job.finished_time >= self.result_ttl:
+                del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    # 所有保留中的任务，最新提交的在前面
+    def list(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return list(reversed(jobs))
+
+    # 正在排队或运行的任务
+    def active(self, key):
+        with self._lock:
+            return self._active_keys.get(key)
+
+    # 取消任务：排队中的任务直接取消，运行中的任务在下一次检查时停止；返回任务是否还在进行
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED:
+            return False
+        job._cancel.set()
+        if job._future is not None and job._future.cancel():
+            self._finish(job, CANCELLED)
+        return True
+
+    # 在 delay 秒后于后台线程中调用 func(*args)
+    def call_later(self, delay, func, *args):
+        with self._timer_cond:
+            if self._closed:
+                return
+            heapq.heappush(self._timers, (time.monotonic() + delay, next(self._timer_seq), func, args))
+            if self._timer_thread is None:
+                self._timer_thread = threading.Thread(target=self._run_timers, daemon=True)
+                self._timer_thread.start()
+            self._timer_cond.notify()
+
+    def _run_timers(self):
+        while True:
+            with self._timer_cond:
+                while not self._closed and (not self._timers or self._timers[0][0] > time.monotonic()):
+                    timeout = self._timers[0][0] - time.monotonic() if self._timers else None
+                    self._timer_cond.wait(timeout)
+                if self._closed:
+                    return
+                when, seq, func, args = heapq.heappop(self._timers)
+            try:
+                func(*args)
+            except Exception:
+                pass
+
+    def shutdown(self, wait=False):
+        with self._timer_cond:
+            self._closed = True
+            self._timer_cond.notify()
+        for job in self.list():
+            self.cancel(job.id)
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,64 @@
+"""
+线程安全的 LRU 缓存：超过容量时淘汰最久没有使用的条目
+
+指定 weigher 时按条目的权重（例如结果数量）限制总量，单个条目超过 max_weight 时不缓存
+"""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, max_size, max_weight=None, weigher=None):
+        self.max_size = max_size
+        self.max_weight = max_weight
+        self.weigher = weigher
+        self._items = OrderedDict()
+        self._weights = {}
+        self._total_weight = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    # 所有条目的权重之和
+    @property
+    def total_weight(self):
+        return self._total_weight
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        weight = self.weigher(value) if self.weigher else 0
+        with self._lock:
+            self._remove(key)
+            if self.max_weight is not None and weight > self.max_weight:
+                return
+            self._items[key] = value
+            self._weights[key] = weight
+            self._total_weight += weight
+            while len(self._items) > self.max_size or (self.max_weight is not None and self._total_weight > self.max_weight):
+                self._remove(next(iter(self._items)))
+
+    def pop(self, key, default=None):
+        with self._lock:
+            value = self._items.get(key, default)
+            self._remove(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._weights.clear()
+            self._total_weight = 0
+
+    def _remove(self, key):
+        if key in self._items:
+            del self._items[key]
+            self._total_weight -= self._weights.pop(key)
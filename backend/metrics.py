@@ -0,0 +1,216 @@
+"""
+运行指标：收取、解析、存储、搜索和接口请求的计数器与耗时直方图，/metrics 按 Prometheus 文本格式输出
+
+指标在这里统一定义，其他模块直接导入使用；config.py 中 METRICS_ENABLED 为 False 时，
+计数和计时都在检查开关后直接返回，不读取时钟也不加锁
+"""
+import bisect
+import math
+import threading
+import time
+
+# 耗时直方图的分桶上限（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# 搜索结果数的分桶上限
+COUNT_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+class MetricsRegistry:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labels=()):
+        metric = Counter(self, name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(self, name, documentation, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    # 输出时才取值的指标，例如连接池已有的统计；callback() 返回 [(标签 dict, 值)]
+    def collect(self, name, documentation, callback, kind='gauge'):
+        self._collectors.append((name, documentation, callback, kind))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, documentation, callback, kind in self._collectors:
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in callback():
+                lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + '}'
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class Counter:
+    def __init__(self, registry, name, documentation, labels=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}  # 标签值 -> 计数
+
+    def inc(self, amount=1, **labels):
+        if not self.registry.enabled:
+            return
+        key = tuple(labels.get(label, '') for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f'{self.name}{format_labels(dict(zip(self.labels, key)))} {format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, registry, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}  # 标签值 -> [每个分桶的计数, 总和, 次数]
+
+    def observe(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        key = tuple(labels.get(label, '') for label in self.labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            # 大于所有分桶上限的值只计入 +Inf
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    # 记录 with 块的耗时（秒），关闭指标时返回共用的空计时器，不读取时钟
+    def time(self, **labels):
+        if not self.registry.enabled:
+            return NULL_TIMER
+        return Timer(self, labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            values = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+        for key, (counts, total, count) in values:
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{format_labels(dict(labels, le=format_value(float(bound))))} {cumulative}')
+            lines.append(f'{self.name}_bucket{format_labels(dict(labels, le="+Inf"))} {count}')
+            lines.append(f'{self.name}_sum{format_labels(labels)} {format_value(total)}')
+            lines.append(f'{self.name}_count{format_labels(labels)} {count}')
+        return lines
+
+
+class Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+# 迭代 iterable，把每次在迭代器内部等待的时间（例如等待服务器返回下一封邮件）累计后记录为一次观测
+def timed_iter(iterable, histogram, **labels):
+    if not histogram.registry.enabled:
+        yield from iterable
+        return
+    elapsed = 0.0
+    iterator = iter(iterable)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - start
+                break
+            elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        # 调用方提前停止时也关闭内部的迭代器
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            close()
+        histogram.observe(elapsed, **labels)
+
+
+registry = MetricsRegistry()
+
+# IMAP
+imap_connect_seconds = registry.histogram('multimail_imap_connect_seconds', 'IMAP 连接（TCP 和 TLS 握手）耗时', ('server',))
+imap_login_seconds = registry.histogram('multimail_imap_login_seconds', 'IMAP LOGIN 耗时', ('server',))
+imap_fetch_seconds = registry.histogram('multimail_imap_fetch_seconds', '每批 UID FETCH 等待和接收数据的耗时（含边接收边解析）', ('server',))
+
+# 收取
+fetched_messages_total = registry.counter('multimail_fetched_messages_total', '收取到的邮件数（包括重复的邮件）', ('account',))
+fetched_bytes_total = registry.counter('multimail_fetched_bytes_total', '收取到的邮件字节数', ('account',))
+duplicates_skipped_total = registry.counter('multimail_duplicates_skipped_total', '因为已经存在而跳过的邮件数', ('account',))
+mime_parse_seconds = registry.histogram('multimail_mime_parse_seconds', '每封邮件解析邮件头、结构和正文的耗时', ('mode',))
+attachment_write_seconds = registry.histogram('multimail_attachment_write_seconds', '每封邮件的附件写入附件存储的耗时')
+
+# 存储
+storage_seconds = registry.histogram('multimail_storage_seconds', '邮件存储操作耗时', ('operation',))
+
+# 搜索
+search_seconds = registry.histogram('multimail_search_seconds', '搜索耗时', ('mode',))
+search_results = registry.histogram('multimail_search_results', '搜索结果数', ('mode',), COUNT_BUCKETS)
+
+# 接口
+http_request_seconds = registry.histogram('multimail_http_request_seconds', '接口请求耗时（流式响应只计算到开始发送）', ('method', 'route', 'status'))
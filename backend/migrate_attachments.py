@@ -0,0 +1,82 @@
+"""
+把 data/attachments/<email_id>/ 中的附件一次性迁移到按内容保存的附件存储，相同的附件只保留一份
+
+用法（在 backend 目录下）: python migrate_attachments.py
+迁移前请先停止后端服务，迁移后重新统计各账号的占用空间
+"""
+import os
+import time
+import config
+from storage import create_email_store
+from attachment_store import AttachmentStore, hash_file
+from account_stats import rebuild_accounts
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f'{size:.1f} {unit}' if unit != 'B' else f'{size} B'
+        size /= 1024
+
+
+# 返回 (迁移的附件数, 迁移前占用的字节数, 迁移后新增占用的字节数)
+def migrate(email_store, attachment_store, attachments_dir):
+    files = 0
+    before = 0
+    stored = 0
+    for account in email_store.accounts():
+        # 先只读出需要迁移的邮件 id（不读取正文），避免边遍历边写入；修改前再读取完整的邮件
+        email_ids = [email_data['id'] for email_data in email_store.iter_emails(account, with_body=False)
+                     if any(not item.get('sha256') for item in email_data.get('attachments', []))]
+        for email_id in email_ids:
+            email_data = email_store.get(email_id, account)
+            if email_data is None:
+                continue
+            email_attachment_dir = os.path.join(attachments_dir, email_id)
+            migrated = {}
+            changed = False
+            for item in email_data.get('attachments', []):
+                if item.get('sha256'):
+                    continue
+
+                file_path = os.path.join(email_attachment_dir, item.get('filename', ''))
+                if file_path in migrated:
+                    # 同一封邮件中同名的附件共用一个文件
+                    sha256, size = migrated[file_path]
+                    attachment_store.retain(sha256)
+                elif os.path.isfile(file_path):
+                    sha256, size = hash_file(file_path)
+                    stored += attachment_store.add(file_path, sha256, size, account)[1]
+                    migrated[file_path] = (sha256, size)
+                    files += 1
+                    before += size
+                else:
+                    continue
+
+                item['sha256'] = sha256
+                item['size'] = size
+                changed = True
+
+            if changed:
+                email_store.save(email_data)
+                try:
+                    os.rmdir(email_attachment_dir)
+                except OSError:
+                    pass
+
+        print(f'{account}: 已迁移 {files} 个附件...')
+    return files, before, stored
+
+
+if __name__ == '__main__':
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), config.DATA_DIR)
+    email_store = create_email_store(data_dir)
+    attachment_store = AttachmentStore(os.path.join(data_dir, config.ATTACHMENT_BLOBS_DIR))
+
+    start = time.time()
+    files, before, stored = migrate(email_store, attachment_store, os.path.join(data_dir, config.ATTACHMENTS_DIR))
+    rebuild_accounts(data_dir, email_store, attachment_store, email_store.accounts())
+    attachment_store.close()
+    email_store.close()
+    print(f'迁移完成，共 {files} 个附件，用时 {time.time() - start:.1f} 秒')
+    print(f'迁移前占用 {format_size(before)}，迁移后占用 {format_size(stored)}，节省 {format_size(before - stored)}')
@@ -0,0 +1,48 @@
+"""
+把 data/emails/<account>/*.json 中的邮件一次性导入 SQLite 邮件存储
+
+用法（在 backend 目录下）: python migrate_to_sqlite.py
+导入完成后把 config.py 中的 STORAGE_BACKEND 改为 'sqlite'；导入后按 SQLite 存储重新统计各账号的占用空间
+"""
+import os
+import time
+import config
+from storage import JsonEmailStore, SqliteEmailStore, create_body_codec
+from attachment_store import AttachmentStore
+from account_stats import rebuild_accounts
+
+BATCH_SIZE = 1000
+
+
+def migrate(json_store, sqlite_store):
+    count = 0
+    batch = []
+    for email_data in json_store.iter_emails():
+        batch.append(email_data)
+        if len(batch) >= BATCH_SIZE:
+            sqlite_store.save_many(batch)
+            count += len(batch)
+            batch = []
+            print(f'已导入 {count} 封邮件...')
+
+    if batch:
+        sqlite_store.save_many(batch)
+        count += len(batch)
+    return count
+
+
+if __name__ == '__main__':
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), config.DATA_DIR)
+    # 两种存储使用同样的正文压缩设置
+    codec = create_body_codec(data_dir)
+    json_store = JsonEmailStore(os.path.join(data_dir, config.EMAILS_DIR), os.path.join(data_dir, config.EMAIL_LOCATIONS_FILE), codec)
+    sqlite_store = SqliteEmailStore(os.path.join(data_dir, config.SQLITE_STORE_FILE), codec)
+
+    start = time.time()
+    count = migrate(json_store, sqlite_store)
+    attachment_store = AttachmentStore(os.path.join(data_dir, config.ATTACHMENT_BLOBS_DIR))
+    rebuild_accounts(data_dir, sqlite_store, attachment_store, sqlite_store.accounts())
+    attachment_store.close()
+    sqlite_store.close()
+    print(f'导入完成，共 {count} 封邮件，用时 {time.time() - start:.1f} 秒')
+    print(f"请把 config.py 中的 STORAGE_BACKEND 改为 'sqlite'")
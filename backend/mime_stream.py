@@ -0,0 +1,286 @@
+"""
+流式 MIME 解析：逐块接收原始邮件，每个部分的头交给 BytesFeedParser 解析，
+正文按 MIME 边界逐行切分，附件按传输编码边解码边写入文件，内存中只保留邮件头和正文文本
+"""
+import os
+import re
+import uuid
+import hashlib
+import binascii
+from email.parser import BytesFeedParser
+
+# 没有换行的超长行超过这个长度时先交给当前部分处理，避免缓存整行
+MAX_LINE_BUFFER = 65536
+
+BASE64_IGNORED_RE = re.compile(rb'[^A-Za-z0-9+/=]')
+
+
+class Base64Decoder:
+    def __init__(self):
+        self._carry = b''
+
+    # 只解码凑满 4 个字符的部分，剩余的留到下一块
+    def feed(self, data):
+        data = self._carry + BASE64_IGNORED_RE.sub(b'', data)
+        usable = len(data) - len(data) % 4
+        self._carry = data[usable:]
+        return self._decode(data[:usable])
+
+    def flush(self):
+        data, self._carry = self._carry, b''
+        if len(data) < 2:
+            return b''
+        return self._decode(data + b'=' * (-len(data) % 4))
+
+    def _decode(self, data):
+        try:
+            return binascii.a2b_base64(data)
+        except binascii.Error:
+            return b''
+
+
+class QuotedPrintableDecoder:
+    def __init__(self):
+        self._carry = b''
+
+    # 按行解码，最后不完整的一行留到下一块
+    def feed(self, data):
+        data = self._carry + data
+        end = data.rfind(b'\n') + 1
+        if end == 0 and len(data) > MAX_LINE_BUFFER:
+            # 超长行在不会切开 =XX 的位置截断
+            escape = data.rfind(b'=', len(data) - 2)
+            end = escape if escape >= 0 else len(data)
+        self._carry = data[end:]
+        return binascii.a2b_qp(data[:end]) if end else b''
+
+    def flush(self):
+        data, self._carry = self._carry, b''
+        return binascii.a2b_qp(data) if data else b''
+
+
+class IdentityDecoder:
+    def feed(self, data):
+        return data
+
+    def flush(self):
+        return b''
+
+
+def new_decoder(encoding):
+    encoding = (encoding or '').strip().lower()
+    if encoding == 'base64':
+        return Base64Decoder()
+    if encoding == 'quoted-printable':
+        return QuotedPrintableDecoder()
+    return IdentityDecoder()
+
+
+# 解码一个 MIME 部分的正文，写入文件和/或保存为文本；写入文件时同时计算 SHA-256
+class PartWriter:
+    def __init__(self, encoding, path=None, collect_text=False):
+        self.path = path
+        self.size = 0
+        self.text = bytearray() if collect_text else None
+        self._decoder = new_decoder(encoding)
+        self._file = open(path, 'wb') if path else None
+        self._hash = hashlib.sha256() if path else None
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest() if self._hash is not None else None
+
+    def feed(self, data):
+        self._write(self._decoder.feed(data))
+
+    def _write(self, data):
+        if not data:
+            return
+        self.size += len(data)
+        if self._file is not None:
+            self._file.write(data)
+            self._hash.update(data)
+        if self.text is not None:
+            self.text += data
+
+    def close(self):
+        if self._decoder is not None:
+            self._write(self._decoder.flush())
+            self._decoder = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        return self
+
+    # 放弃已写入的内容，删除文件
+    def discard(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class StreamingMessageParser:
+    def __init__(self, staging_dir):
+        self.staging_dir = staging_dir
+        self.headers = None
+        self.text_parts = []   # [(content_type, charset, bytes)]
+        self.attachments = []  # [{'filename', 'path', 'size', 'sha256'}]，path 为暂存目录中的临时文件
+        self.size = 0          # 已接收的字节数
+
+        self._buffer = b''
+        self._state = 'headers'
+        self._header_lines = []
+        self._boundaries = []
+        self._part = None
+        self._part_info = None
+        self._writers = []
+        self._pending_eol = b''
+        self._continuation = False
+
+    def feed(self, data):
+        self.size += len(data)
+        self._buffer += data
+        if b'\n' in data:
+            lines = self._buffer.split(b'\n')
+            self._buffer = lines.pop()
+
+            # 正文中连续的普通行合并后一次处理，只有以 -- 开头的行需要检查是否为边界
+            run = []
+            for line in lines:
+                if self._state == 'body' and not line.startswith(b'--'):
+                    run.append(line)
+                    continue
+                if run:
+                    self._body_run(run)
+                    run = []
+                self._line(line + b'\n')
+            if run:
+                self._body_run(run)
+
+        # 正文中的超长行直接交给当前部分，边界行不会这么长
+        if len(self._buffer) > MAX_LINE_BUFFER and self._state == 'body':
+            self._body_data(self._buffer, partial=True)
+            self._buffer = b''
+
+    # 所有数据接收完毕，返回自身，解析结果在 headers、text_parts 和 attachments 中
+    def close(self):
+        if self._buffer:
+            self._line(self._buffer)
+            self._buffer = b''
+        if self._state == 'headers' and self._header_lines:
+            self._start_part(b''.join(self._header_lines))
+        if self._part is not None:
+            # 没有结束边界时，最后的换行属于正文
+            self._part.feed(self._pending_eol)
+            self._end_part()
+        if self.headers is None:
+            self.headers = BytesFeedParser().close()
+        return self
+
+    # 删除还留在暂存目录中的附件文件
+    def discard(self):
+        for writer in self._writers:
+            writer.discard()
+
+    def _line(self, line):
+        if self._state == 'headers':
+            self._header_lines.append(line)
+            if line in (b'\n', b'\r\n'):
+                header_bytes = b''.join(self._header_lines)
+                self._header_lines = []
+                self._start_part(header_bytes)
+            return
+
+        continuation = self._continuation
+        self._continuation = False
+        if not continuation and self._boundaries and line.startswith(b'--'):
+            marker = line.rstrip()
+            for i in range(len(self._boundaries) - 1, -1, -1):
+                boundary = self._boundaries[i]
+                if marker == b'--' + boundary:
+                    self._end_part()
+                    del self._boundaries[i + 1:]
+                    self._state = 'headers'
+                    return
+                if marker == b'--' + boundary + b'--':
+                    self._end_part()
+                    del self._boundaries[i:]
+                    self._state = 'epilogue'
+                    return
+
+        # multipart 的前言和结语直接丢弃
+        if self._state == 'body':
+            self._body_data(line)
+
+    def _body_run(self, lines):
+        self._continuation = False
+        lines.append(b'')
+        self._body_data(b'\n'.join(lines))
+
+    # 行尾的换行先不写入，如果下一行是边界，这个换行属于边界
+    def _body_data(self, data, partial=False):
+        if partial:
+            content, eol = data, b''
+            self._continuation = True
+        elif data.endswith(b'\r\n'):
+            content, eol = data[:-2], b'\r\n'
+        elif data.endswith(b'\n'):
+            content, eol = data[:-1], b'\n'
+        else:
+            content, eol = data, b''
+        self._part.feed(self._pending_eol + content)
+        self._pending_eol = eol
+
+    def _start_part(self, header_bytes):
+        parser = BytesFeedParser()
+        parser.feed(header_bytes)
+        headers = parser.close()
+        if self.headers is None:
+            self.headers = headers
+
+        content_type = headers.get_content_type()
+        filename = headers.get_filename()
+        if headers.get_content_maintype() == 'multipart':
+            boundary = headers.get_boundary()
+            if boundary:
+                self._boundaries.append(boundary.encode('ascii', errors='surrogateescape'))
+                self._state = 'preamble'
+                return
+
+        # 内嵌的邮件接着是它自己的邮件头，和 Message.walk() 一样继续解析其中的部分
+        if content_type == 'message/rfc822' and not filename:
+            self._state = 'headers'
+            return
+
+        disposition = str(headers.get('Content-Disposition'))
+        collect_text = content_type in ('text/plain', 'text/html') and 'attachment' not in disposition
+        path = os.path.join(self.staging_dir, uuid.uuid4().hex) if filename else None
+        if path:
+            os.makedirs(self.staging_dir, exist_ok=True)
+
+        self._part = PartWriter(headers.get('Content-Transfer-Encoding'), path, collect_text)
+        self._part_info = (content_type, headers.get_content_charset(), filename)
+        if path:
+            self._writers.append(self._part)
+        self._pending_eol = b''
+        self._state = 'body'
+
+    def _end_part(self):
+        if self._part is None:
+            return
+
+        part = self._part.close()
+        content_type, charset, filename = self._part_info
+        if part.text is not None:
+            self.text_parts.append((content_type, charset, bytes(part.text)))
+        if filename:
+            self.attachments.append({'filename': filename, 'path': part.path, 'size': part.size, 'sha256': part.sha256})
+
+        self._part = None
+        self._part_info = None
+        self._pending_eol = b''
@@ -0,0 +1,87 @@
+"""
+通知缓冲区：最近的通知保存在内存中，相同的通知合并为一条并记录重复次数，
+修改后最多延迟 FLUSH_INTERVAL 秒写入 data/notifications.json
+"""
+import os
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+# 内存中的修改最多延迟这么多秒写入文件
+FLUSH_INTERVAL = 5
+
+
+class NotificationBuffer:
+    def __init__(self, notifications_file, max_size=100):
+        self.notifications_file = notifications_file
+        self.max_size = max(1, max_size)
+        self._lock = threading.Lock()
+        # (类型, 内容) -> 通知，按最后出现的时间排列，最旧的在前面
+        self._items = OrderedDict()
+        self._dirty = False
+        self._timer = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.notifications_file, 'r', encoding='utf-8') as f:
+                notifications = json.load(f)
+        except:
+            return
+
+        for notification in notifications[-self.max_size:]:
+            notification.setdefault('count', 1)
+            key = (notification.get('type', 'info'), notification.get('message', ''))
+            self._items.pop(key, None)
+            self._items[key] = notification
+
+    # 添加通知，与已有的通知相同时只增加重复次数并更新时间
+    def add(self, message, type='info'):
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        key = (type, message)
+        with self._lock:
+            notification = self._items.pop(key, None)
+            if notification is None:
+                notification = {'message': message, 'type': type, 'time': now, 'count': 0}
+            notification['count'] += 1
+            notification['time'] = now
+            self._items[key] = notification
+
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+            self._mark_dirty()
+
+    # 所有通知（副本），最旧的在前面
+    def list(self):
+        with self._lock:
+            return [dict(notification) for notification in self._items.values()]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._write()
+
+    def _mark_dirty(self):
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(FLUSH_INTERVAL, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            self._timer = None
+            if self._dirty:
+                self._write()
+
+    # 先写临时文件再替换，避免中途退出时文件损坏
+    def _write(self):
+        tmp_file = f'{self.notifications_file}.tmp'
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(list(self._items.values()), f, ensure_ascii=False)
+            os.replace(tmp_file, self.notifications_file)
+        except OSError:
+            return
+        self._dirty = False
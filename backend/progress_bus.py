@@ -0,0 +1,103 @@
+"""
+进度消息总线：保存收取进度、搜索进度和通知的最新状态，推送给通过 /api/events 订阅的客户端
+
+同一频道的高频更新（例如逐封邮件的进度）按 min_interval 合并，订阅者只会收到最新的状态；
+发布者传入 lock 时状态只在推送时复制一次
+"""
+import contextlib
+import copy
+import threading
+import time
+
+
+class ProgressBus:
+    def __init__(self, min_interval=0.5):
+        self.min_interval = min_interval
+        self._cond = threading.Condition()
+        self._states = {}        # 频道 -> 最近一次推送的状态
+        self._live = {}          # 频道 -> (发布者持有的状态, 保护它的锁)，推送时才复制
+        self._versions = {}      # 频道 -> 最近一次推送的版本号
+        self._version = 0
+        self._last_notify = {}   # 频道 -> 最近一次推送的时间
+        self._pending = set()    # 已安排延迟推送的频道
+
+    # 频道最近一次推送的状态（副本）
+    def get(self, channel, default=None):
+        with self._cond:
+            if channel not in self._states:
+                return default
+            return copy.deepcopy(self._states[channel])
+
+    # 更新频道状态；距上次推送不足 min_interval 时延迟推送，force 为 True 时立即推送
+    # lock 为 None 时立即保存副本；否则 state 是发布者在 lock 保护下修改的字典（调用时已持有 lock），
+    # 只在推送时复制，合并掉的高频更新不需要复制
+    def publish(self, channel, state, force=False, lock=None):
+        if lock is None:
+            # 保存副本，发布者之后修改自己的字典不会影响已保存的状态
+            state = copy.deepcopy(state)
+        with self._cond:
+            if lock is None:
+                self._live.pop(channel, None)
+                self._states[channel] = state
+            else:
+                self._live[channel] = (state, lock)
+            now = time.monotonic()
+            wait = self.min_interval - (now - self._last_notify.get(channel, float('-inf')))
+            if force or wait <= 0:
+                self._notify(channel, now)
+            elif channel not in self._pending:
+                self._pending.add(channel)
+                timer = threading.Timer(wait, self._flush, (channel,))
+                timer.daemon = True
+                timer.start()
+
+    # 调用时持有 self._cond，频道有发布者持有的状态时还需要持有它的锁
+    def _notify(self, channel, now):
+        if channel in self._live:
+            self._states[channel] = copy.deepcopy(self._live[channel][0])
+        self._pending.discard(channel)
+        self._version += 1
+        self._versions[channel] = self._version
+        self._last_notify[channel] = now
+        self._cond.notify_all()
+
+    def _flush(self, channel):
+        # 与 publish 相同，先取得发布者的锁再取得 self._cond；等待锁期间频道换了锁时重新取得
+        while True:
+            lock = self._live_lock(channel)
+            with lock or contextlib.nullcontext():
+                with self._cond:
+                    if self._live_lock(channel) is not lock:
+                        continue
+                    if channel in self._pending:
+                        self._notify(channel, time.monotonic())
+                    return
+
+    def _live_lock(self, channel):
+        with self._cond:
+            live = self._live.get(channel)
+            return live[1] if live else None
+
+    # 订阅所有频道：先返回每个频道的当前状态，之后每次推送返回 (频道, 状态)
+    # 超过 heartbeat 秒没有推送时返回 None，用于发送心跳保持连接
+    def listen(self, heartbeat=15):
+        seen = {}
+        while True:
+            with self._cond:
+                changed = self._changed(seen)
+                if not changed:
+                    self._cond.wait(heartbeat)
+                    changed = self._changed(seen)
+                events = []
+                for channel in changed:
+                    seen[channel] = self._versions[channel]
+                    # 保存的状态只会被整体替换，不会被修改，可以在锁外序列化
+                    events.append((channel, self._states[channel]))
+
+            if not events:
+                yield None
+            for event in events:
+                yield event
+
+    def _changed(self, seen):
+        return [channel for channel, version in self._versions.items() if seen.get(channel) != version]
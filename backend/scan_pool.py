@@ -0,0 +1,155 @@
+"""
+多进程扫描搜索：全文索引不能使用时，把每个账号的邮件分成若干分区，交给进程池并行扫描
+
+工作进程分批把匹配的邮件和扫描数量发回主进程，由主进程汇总进度；找到的结果数达到 limit
+或任务被取消时，通知工作进程在下一批结束时停止。工作进程各自以只读方式打开邮件存储，不使用主进程中的连接
+
+后端进程中有收取、任务和新邮件监听等线程，直接 fork 时其他线程可能正持有锁（SQLite、日志、连接池），
+子进程中的锁永远不会释放。工作进程由 forkserver（不支持时用 spawn）从单线程的干净进程创建，
+只导入本模块，不重新执行后端的初始化
+"""
+import multiprocessing
+import queue
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import config
+from date_utils import email_timestamp
+from storage import create_email_store
+
+# 工作进程每扫描这么多封邮件报告一次进度，并检查是否需要停止
+REPORT_EVERY = 500
+
+# 每个工作进程平均分到的分区数，分区越多各进程的负载越均衡
+PARTITIONS_PER_WORKER = 4
+
+
+def parallel_available():
+    return bool(multiprocessing.get_all_start_methods())
+
+
+def get_context():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        # forkserver 进程预先导入本模块和邮件存储，之后创建工作进程只需要 fork 这个进程
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+# forkserver 和 spawn 创建的工作进程会重新导入主模块，后端以 python app.py 运行时主模块会启动后台线程、
+# 清理暂存目录；创建工作进程期间把主模块临时换成本模块，工作进程只导入 scan_pool
+@contextmanager
+def _worker_main_module():
+    main_module = sys.modules['__main__']
+    sys.modules['__main__'] = sys.modules[__name__]
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = main_module
+
+
+# 按邮件数把账号分成 (账号, 分区序号, 分区数)，邮件多的账号分成更多分区
+def make_partitions(counts, workers):
+    total = sum(counts.values())
+    target = max(1, workers * PARTITIONS_PER_WORKER)
+    partitions = []
+    for account, count in counts.items():
+        if count <= 0:
+            continue
+        parts = max(1, min(count, round(count / total * target)))
+        partitions.extend((account, part, parts) for part in range(parts))
+    # 大的分区先开始，减少最后只剩一个进程在扫描的时间
+    partitions.sort(key=lambda partition: counts[partition[0]] / partition[2], reverse=True)
+    return partitions
+
+
+# 匹配结果记录为 (时间戳, 邮件 id, 账号)，便于按时间排序
+def match_record(email_data, account):
+    return (email_timestamp(email_data), email_data['id'], email_data.get('account') or account)
+
+
+_worker = {}  # 工作进程中的邮件存储、结果队列和停止标记
+
+# 工作进程重新导入 config，运行时修改过的存储配置（例如基准测试中）需要从主进程传过去
+STORE_SETTINGS = ('STORAGE_BACKEND', 'SQLITE_STORE_FILE', 'EMAILS_DIR', 'EMAIL_LOCATIONS_FILE',
+                  'BODY_COMPRESSION', 'BODY_COMPRESSION_LEVEL', 'BODY_DICT_DIR')
+
+
+def _init_worker(data_dir, settings, results, stop):
+    for name, value in settings.items():
+        setattr(config, name, value)
+    _worker['store'] = create_email_store(data_dir, readonly=True)
+    _worker['results'] = results
+    _worker['stop'] = stop
+
+
+# 在工作进程中扫描一个分区，matcher 为 search_query.Query，结果分批发回；无论是否出错，最后都发送一条结束消息
+def _scan_partition(account, part, parts, matcher):
+    store = _worker['store']
+    results = _worker['results']
+    stop = _worker['stop']
+    processed = 0
+    matches = []
+    try:
+        if stop.is_set():
+            return
+        for email_data in store.iter_partition(account, part, parts, with_body=matcher.needs_body):
+            processed += 1
+            if matcher(email_data):
+                matches.append(match_record(email_data, account))
+            if processed >= REPORT_EVERY:
+                results.put((processed, matches, False))
+                processed = 0
+                matches = []
+                if stop.is_set():
+                    return
+    finally:
+        results.put((processed, matches, True))
+
+
+# 并行扫描所有分区，返回匹配结果列表（未排序）
+# on_progress(已扫描数, 已找到数) 在主进程中调用；should_stop() 返回 True 时提前停止
+def parallel_scan(data_dir, partitions, matcher, workers, limit=None, on_progress=None, should_stop=None):
+    context = get_context()
+    settings = {name: getattr(config, name) for name in STORE_SETTINGS}
+    results = context.Queue()
+    stop = context.Event()
+    found = []
+    processed = 0
+    finished = 0
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(data_dir, settings, results, stop)) as executor:
+        # 工作进程在提交任务时创建
+        with _worker_main_module():
+            futures = [executor.submit(_scan_partition, account, part, parts, matcher) for account, part, parts in partitions]
+        try:
+            while finished < len(futures):
+                if not stop.is_set() and should_stop is not None and should_stop():
+                    stop.set()
+                try:
+                    count, matches, done = results.get(timeout=0.1)
+                except queue.Empty:
+                    # 工作进程异常退出时不会发送结束消息
+                    failed = [future for future in futures if future.done() and future.exception() is not None]
+                    if failed:
+                        raise failed[0].exception()
+                    continue
+
+                processed += count
+                found.extend(matches)
+                finished += done
+                if limit is not None and len(found) >= limit:
+                    stop.set()
+                if on_progress is not None:
+                    on_progress(processed, len(found))
+        finally:
+            stop.set()
+
+        # 分区中的异常（例如正文解压失败）在这里抛出
+        for future in futures:
+            future.result()
+
+    results.close()
+    return found[:limit] if limit is not None else found
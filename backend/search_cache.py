@@ -0,0 +1,60 @@
+"""
+搜索结果缓存：按查询保存结果的 (邮件 id, 账号) 列表，重复搜索和分页读取结果时不需要再次搜索
+
+账号写入新邮件后，覆盖该账号的缓存结果失效；在搜索开始前取得 version，
+搜索期间有新邮件写入时，保存的结果会直接视为过期
+"""
+import threading
+from lru_cache import LRUCache
+
+
+# 缓存键：大小写和多余的空白不影响搜索结果
+def normalize_query(query):
+    return ' '.join((query or '').lower().split())
+
+
+class SearchCache:
+    def __init__(self, max_entries=100, max_results=200000):
+        # 按结果数量限制总量，单个查询的结果超过 max_results 时不缓存
+        self._cache = LRUCache(max_entries, max_results, lambda entry: len(entry[1]))
+        self._lock = threading.Lock()
+        self._epoch = 0               # 清空缓存时增加
+        self._version = 0             # 任意账号写入新邮件时增加，用于搜索全部账号的结果
+        self._account_versions = {}   # 账号 -> 该账号写入新邮件的次数
+
+    # 搜索开始前调用，返回的版本号传给 put
+    def version(self, accounts=None):
+        with self._lock:
+            if accounts is None:
+                return self._epoch, self._version
+            return self._epoch, tuple(self._account_versions.get(account, 0) for account in sorted(accounts))
+
+    # accounts 为结果覆盖的账号，None 表示所有账号
+    def get(self, query, accounts=None):
+        key = self._key(query, accounts)
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        version, results = entry
+        if version != self.version(accounts):
+            self._cache.pop(key)
+            return None
+        return results
+
+    def put(self, query, results, version, accounts=None):
+        self._cache.put(self._key(query, accounts), (version, list(results)))
+
+    # 账号写入了新邮件或邮件内容发生变化
+    def invalidate(self, account):
+        with self._lock:
+            self._version += 1
+            self._account_versions[account] = self._account_versions.get(account, 0) + 1
+
+    # 搜索方式变化时（例如全文索引建立完成）清空所有结果
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+        self._cache.clear()
+
+    def _key(self, query, accounts):
+        return (normalize_query(query), tuple(sorted(accounts)) if accounts is not None else None)
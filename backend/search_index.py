@@ -0,0 +1,671 @@
+"""
+邮件全文索引：基于 SQLite 的倒排索引，覆盖标题、发件人和正文，支持中文和前缀匹配
+
+另外为结构化查询（search_query.py）保存按字段区分的标题和发件人词，以及账号、时间、大小和是否有附件的列索引；
+执行查询时先估计每个条件匹配的邮件数，从最少的条件开始取候选邮件，其余条件只在候选邮件中检查
+
+每条倒排记录保存了 BM25 中与词频和邮件长度有关的部分（impact），词表 terms 保存每个词的邮件数和最高的 impact。
+有关键词且指定了结果数时，按 impact 从高到低读取关键词的倒排记录，剩下的邮件得分上界低于当前第 limit 名时停止，
+不需要给所有候选邮件打分
+"""
+import os
+import re
+import html
+import heapq
+import math
+import sqlite3
+import threading
+from date_utils import email_timestamp
+
+# 标题和发件人中的词比正文中的词权重更高
+FIELD_WEIGHTS = {'subject': 3, 'from': 2, 'content': 1}
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 候选邮件超过这个数量且指定了结果数时，按得分上界读取倒排记录，只给可能进入前几名的邮件打分
+TOP_K_MIN_CANDIDATES = 2000
+
+# 按得分读取时每批检查的邮件数，条件过滤掉大部分邮件时逐批翻倍
+TOP_K_BATCH = 64
+TOP_K_MAX_BATCH = 4096
+
+# 前缀匹配展开出的索引词超过这个数量时，不逐个读取这些词的倒排记录
+MAX_EXPANDED_TERMS = 64
+
+# 中日韩文字按二元组切分，其他文字按单词切分
+CJK_RANGES = '぀-ヿ㐀-䶿一-鿿가-힯豈-﫿'
+TOKEN_RE = re.compile(f'[{CJK_RANGES}]+|[^\\W{CJK_RANGES}]+')
+CJK_RE = re.compile(f'^[{CJK_RANGES}]')
+HTML_BLOCK_RE = re.compile(r'<(script|style)[^>]*>.*?</\1>', re.S | re.I)
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+# 按字段区分的词加上前缀保存在同一个倒排表中，前缀以 \x01 开头，不会被普通查询词的前缀匹配到
+FIELD_TERM_PREFIXES = {'subject': '\x01s:', 'from': '\x01f:'}
+
+# 列条件使用的索引
+COLUMN_INDEXES = {
+    'account': 'docs_account_timestamp',
+    'after': 'docs_timestamp',
+    'before': 'docs_timestamp',
+    'larger': 'docs_size',
+    'smaller': 'docs_size',
+    'has': 'docs_has_attachment'
+}
+
+
+# 去掉 HTML 标签，只保留文本
+def html_to_text(content):
+    if not content or '<' not in content:
+        return content or ''
+    content = HTML_BLOCK_RE.sub(' ', content)
+    content = HTML_TAG_RE.sub(' ', content)
+    return html.unescape(content)
+
+
+# 切分文本：中文等连续文字切成二元组，并保留每段的最后一个字，保证单字也能前缀匹配
+def tokenize(text):
+    tokens = []
+    for run in TOKEN_RE.findall((text or '').lower()):
+        if CJK_RE.match(run):
+            for i in range(len(run) - 1):
+                tokens.append(run[i:i + 2])
+            tokens.append(run[-1])
+        elif len(run) <= 64:
+            tokens.append(run)
+    return tokens
+
+
+# 切分查询：中文按二元组精确匹配，单个汉字和其他单词按前缀匹配
+def tokenize_query(query):
+    terms = []
+    for run in TOKEN_RE.findall((query or '').lower()):
+        if CJK_RE.match(run) and len(run) > 1:
+            terms.extend((run[i:i + 2], False) for i in range(len(run) - 1))
+        else:
+            terms.append((run, True))
+    return terms
+
+
+# 邮件大小：正文和附件的大小之和；只收取邮件头的邮件在正文下载前保存了按 BODYSTRUCTURE 估算的大小
+def message_size(email_data):
+    size = email_data.get('size')
+    if size is not None:
+        return size
+    content = email_data.get('content') or ''
+    return len(content.encode('utf-8')) + sum(item.get('size') or 0 for item in email_data.get('attachments') or [])
+
+
+def has_attachment(email_data):
+    return bool(email_data.get('attachments'))
+
+
+def idf(df, total_docs):
+    return math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+
+
+# BM25 中与词频和邮件长度有关的部分，建立索引时计算；平均长度使用建立索引时的参考长度，
+# 查询时一个索引词的得分为 idf × impact，同一个词的倒排记录按 impact 排序就是按得分排序
+def impact(tf, length, avg_length):
+    norm = 1 - BM25_B + BM25_B * length / avg_length
+    return tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+
+
+# 按 impact 从高到低的倒排记录 (doc, impact) 换算为 (得分, doc)
+def weighted_postings(rows, weight):
+    for doc, value in rows:
+        yield weight * value, doc
+
+
+# 列条件的 SQL，predicate 为 search_query.Predicate
+def column_condition(predicate):
+    field = predicate.field
+    if field == 'account':
+        return 'account = ?', [predicate.value]
+    if field == 'after':
+        return 'timestamp >= ?', [predicate.value]
+    if field == 'before':
+        return 'timestamp < ?', [predicate.value]
+    if field == 'larger':
+        return 'size > ?', [predicate.value]
+    if field == 'smaller':
+        return 'size < ?', [predicate.value]
+    return 'has_attachment = 1', []
+
+
+class SearchIndex:
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self.created = not os.path.exists(index_file)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(index_file, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._drop_old_postings()
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS docs (
+                doc INTEGER PRIMARY KEY,
+                email_id TEXT UNIQUE NOT NULL,
+                account TEXT NOT NULL,
+                date TEXT,
+                length INTEGER NOT NULL,
+                timestamp INTEGER,
+                size INTEGER,
+                has_attachment INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                impact REAL NOT NULL,
+                PRIMARY KEY (term, doc)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc);
+            CREATE TABLE IF NOT EXISTS terms (
+                term TEXT PRIMARY KEY,
+                df INTEGER NOT NULL,
+                max_impact REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        ''')
+        self._add_columns()
+        self._conn.executescript('''
+            CREATE INDEX IF NOT EXISTS docs_account_timestamp ON docs (account, timestamp);
+            CREATE INDEX IF NOT EXISTS docs_timestamp ON docs (timestamp);
+            CREATE INDEX IF NOT EXISTS docs_size ON docs (size);
+            CREATE INDEX IF NOT EXISTS docs_has_attachment ON docs (has_attachment);
+        ''')
+        if self._ready():
+            self._create_impact_index()
+        self._conn.commit()
+
+        # 文档总数和总长度用于打分，保存在内存中避免每次查询都统计
+        self._total_docs, self._total_length = self._conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs'
+        ).fetchone()
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'impact_length'").fetchone()
+        self._impact_length = float(row[0]) if row else None
+
+    # 旧索引的倒排记录没有 impact，删除后重新建表，并标记为需要重建
+    def _drop_old_postings(self):
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(postings)')]
+        if columns and 'impact' not in columns:
+            self._conn.execute('DROP TABLE postings')
+            self._conn.execute('DELETE FROM docs')
+            self._set_ready(False)
+            self._conn.commit()
+
+    # 旧索引缺少的列（以及按字段区分的词），添加后需要重建索引
+    def _add_columns(self):
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(docs)')]
+        for column in ('timestamp', 'size', 'has_attachment'):
+            if column not in columns:
+                self._conn.execute(f'ALTER TABLE docs ADD COLUMN {column} INTEGER')
+                self._set_ready(False)
+
+    # 索引是否已经完整建立（新建的索引需要先从已保存的邮件重建）
+    def is_ready(self):
+        with self._lock:
+            return self._ready()
+
+    # 已索引的邮件数
+    def count(self):
+        with self._lock:
+            return self._total_docs
+
+    def _ready(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'ready'").fetchone()
+        return row is not None and row[0] == '1'
+
+    # 按 impact 排序的倒排索引只在查询时使用；重建索引期间不逐条维护，写完后一次建立
+    # impact 相同时 doc 大的（较晚加入索引，通常时间较新）在前，得分相同按时间排序时可以少检查一些邮件
+    def _create_impact_index(self):
+        self._conn.execute('CREATE INDEX IF NOT EXISTS postings_term_impact ON postings (term, impact DESC, doc DESC)')
+
+    def _set_ready(self, ready):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('ready', ?)", ('1' if ready else '0',))
+
+    # 计算 impact 使用的参考长度，确定后不再改变，重建索引时重新确定
+    def _set_impact_length(self, length):
+        self._impact_length = max(1.0, float(length))
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('impact_length', ?)", (str(self._impact_length),))
+
+    def _term_weights(self, email_data):
+        weights = {}
+        length = 0
+        for field, weight in FIELD_WEIGHTS.items():
+            text = email_data.get(field) or ''
+            if field == 'content':
+                text = html_to_text(text)
+            for token in tokenize(text):
+                weights[token] = weights.get(token, 0) + weight
+                length += 1
+
+        # 字段词只用于结构化查询的过滤，不计入文档长度
+        for field, prefix in FIELD_TERM_PREFIXES.items():
+            for token in set(tokenize(email_data.get(field))):
+                weights[prefix + token] = 1
+        return weights, length
+
+    # 删除一封邮件的倒排记录，词表中的邮件数同时减少；最高 impact 不减少，仍然是得分上界
+    def _remove_postings(self, doc):
+        terms = self._conn.execute('SELECT term FROM postings INDEXED BY postings_doc WHERE doc = ?', (doc,)).fetchall()
+        self._conn.executemany('UPDATE terms SET df = df - 1 WHERE term = ?', terms)
+        self._conn.execute('DELETE FROM postings WHERE doc = ?', (doc,))
+
+    # weights 和 length 为 _term_weights 的结果，返回写入的倒排记录 [(term, doc, tf, impact)]
+    def _add(self, email_data, weights, length):
+        if self._impact_length is None:
+            self._set_impact_length(length)
+        row = self._conn.execute('SELECT doc FROM docs WHERE email_id = ?', (email_data['id'],)).fetchone()
+        if row:
+            doc = row[0]
+            old_length = self._conn.execute('SELECT length FROM docs WHERE doc = ?', (doc,)).fetchone()[0]
+            self._remove_postings(doc)
+            self._conn.execute('UPDATE docs SET account = ?, date = ?, length = ?, timestamp = ?, size = ?, has_attachment = ? WHERE doc = ?',
+                               (email_data.get('account', ''), email_data.get('date', ''), length, email_timestamp(email_data),
+                                message_size(email_data), int(has_attachment(email_data)), doc))
+            self._total_length += length - old_length
+        else:
+            cursor = self._conn.execute(
+                'INSERT INTO docs (email_id, account, date, length, timestamp, size, has_attachment) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (email_data['id'], email_data.get('account', ''), email_data.get('date', ''), length,
+                 email_timestamp(email_data), message_size(email_data), int(has_attachment(email_data)))
+            )
+            doc = cursor.lastrowid
+            self._total_docs += 1
+            self._total_length += length
+        postings = [(term, doc, tf, impact(tf, length, self._impact_length)) for term, tf in weights.items()]
+        self._conn.executemany('INSERT INTO postings (term, doc, tf, impact) VALUES (?, ?, ?, ?)', postings)
+        return postings
+
+    # 添加或更新一封邮件的索引，同时更新词表
+    def add_email(self, email_data):
+        weights, length = self._term_weights(email_data)
+        with self._lock:
+            postings = self._add(email_data, weights, length)
+            self._conn.executemany(
+                'INSERT INTO terms (term, df, max_impact) VALUES (?, 1, ?) '
+                'ON CONFLICT (term) DO UPDATE SET df = df + 1, max_impact = MAX(max_impact, excluded.max_impact)',
+                [(term, value) for term, doc, tf, value in postings]
+            )
+            self._conn.commit()
+
+    # 删除一封邮件的索引
+    def remove_email(self, email_id):
+        with self._lock:
+            row = self._conn.execute('SELECT doc, length FROM docs WHERE email_id = ?', (email_id,)).fetchone()
+            if row:
+                self._remove_postings(row[0])
+                self._conn.execute('DELETE FROM docs WHERE doc = ?', (row[0],))
+                self._conn.commit()
+                self._total_docs -= 1
+                self._total_length -= row[1]
+
+    # 清空索引后用给定的邮件重建，emails 可以是生成器
+    def rebuild(self, emails, batch_size=500):
+        with self._lock:
+            self._conn.execute('DELETE FROM postings')
+            self._conn.execute('DELETE FROM terms')
+            self._conn.execute('DELETE FROM docs')
+            self._conn.execute("DELETE FROM meta WHERE key = 'impact_length'")
+            self._conn.execute('DROP INDEX IF EXISTS postings_term_impact')
+            self._set_ready(False)
+            self._conn.commit()
+            self._total_docs = 0
+            self._total_length = 0
+            self._impact_length = None
+
+        count = 0
+        batch = []
+        for email_data in emails:
+            batch.append(email_data)
+            if len(batch) >= batch_size:
+                count += self._add_batch(batch)
+                batch = []
+        count += self._add_batch(batch)
+
+        # 词表从倒排记录一次统计，重建期间收取的邮件已经写入的词表记录一起重新统计
+        with self._lock:
+            self._create_impact_index()
+            self._conn.execute('DELETE FROM terms')
+            self._conn.execute('INSERT INTO terms (term, df, max_impact) SELECT term, COUNT(*), MAX(impact) FROM postings GROUP BY term')
+            self._set_ready(True)
+            self._conn.commit()
+        return count
+
+    # 切词在持有锁之前完成；参考长度取第一批邮件的平均长度；词表在全部写完后统计
+    def _add_batch(self, batch):
+        prepared = [(email_data, *self._term_weights(email_data)) for email_data in batch]
+        with self._lock:
+            if self._impact_length is None and prepared:
+                self._set_impact_length(sum(length for email_data, weights, length in prepared) / len(prepared))
+            for email_data, weights, length in prepared:
+                self._add(email_data, weights, length)
+            self._conn.commit()
+        return len(batch)
+
+    # 执行结构化查询（search_query.Query），返回 [(email_id, account, score)]
+    # 有关键词时按相关度排序，否则按时间倒序（score 为 0）；关键词切不出索引词时不能用索引查找，返回空列表
+    def query(self, query, limit=None):
+        text_terms = query.text_terms
+        if query.text and not text_terms:
+            return []
+        with self._lock:
+            if self._total_docs == 0:
+                return []
+            # 按相关度取前 limit 名时只需要知道是否有条件匹配的邮件很少，列条件数到 TOP_K_MIN_CANDIDATES 以上就不再继续数
+            top_k = bool(text_terms) and limit is not None
+            steps = self._plan(query, TOP_K_MIN_CANDIDATES + 1 if top_k else None)
+            terms = [self._expand(term, prefix) for term, prefix in text_terms]
+            if top_k and steps[0]['estimate'] > TOP_K_MIN_CANDIDATES:
+                top = self._top(query, steps, terms, limit)
+                if top is not None:
+                    return top
+            rows = self._execute(query, steps)
+            scores = self._scores(terms, [row[0] for row in rows]) if terms and rows else {}
+
+        # 时间相同时按 id 排序，与扫描搜索的顺序一致
+        rows.sort(key=lambda row: (row[3] or 0, row[1], row[2]), reverse=True)
+        if scores:
+            rows.sort(key=lambda row: scores[row[0]], reverse=True)
+        if limit is not None:
+            rows = rows[:limit]
+        return [(row[1], row[2], scores.get(row[0], 0.0)) for row in rows]
+
+    # 查询计划：第一个条件用于取候选邮件，其余条件只在候选邮件中检查，排除条件最后检查
+    def explain(self, query):
+        with self._lock:
+            steps = self._plan(query)
+        plan = [
+            {'predicate': step['predicate'], 'estimate': step['estimate'], 'index': step.get('index', 'postings'),
+             'role': 'driver' if i == 0 else 'filter'}
+            for i, step in enumerate(steps)
+        ]
+        plan.extend({'predicate': str(predicate), 'estimate': None, 'index': COLUMN_INDEXES.get(predicate.field, 'postings'), 'role': 'exclude'}
+                    for predicate in query.predicates if predicate.negated)
+        return plan
+
+    # 估计每个条件匹配的邮件数，按从少到多排列；使用同一个列索引的条件合并为一步（例如 after 和 before）
+    # 指定 cap 时列条件最多数到 cap 封邮件，估计数等于 cap 表示不少于 cap
+    def _plan(self, query, cap=None):
+        steps = []
+        column_steps = {}
+        for predicate in query.predicates:
+            if predicate.negated:
+                continue
+            if predicate.field in FIELD_TERM_PREFIXES:
+                prefix = FIELD_TERM_PREFIXES[predicate.field]
+                steps.append({'predicate': str(predicate), 'terms': [(prefix + term, is_prefix) for term, is_prefix in predicate.value]})
+                continue
+
+            condition, params = column_condition(predicate)
+            index = COLUMN_INDEXES[predicate.field]
+            step = column_steps.get(index)
+            if step is None:
+                step = column_steps[index] = {'predicate': str(predicate), 'index': index, 'conditions': [], 'params': []}
+                steps.append(step)
+            else:
+                step['predicate'] += f' {predicate}'
+            step['conditions'].append(condition)
+            step['params'].extend(params)
+
+        text_terms = query.text_terms
+        if text_terms:
+            steps.append({'predicate': query.text, 'terms': text_terms, 'text': True})
+
+        for step in steps:
+            if 'terms' in step:
+                step['estimate'] = min(self._term_count(term, prefix) for term, prefix in step['terms'])
+            else:
+                sql = f'SELECT 1 FROM docs INDEXED BY {step["index"]} WHERE {" AND ".join(step["conditions"])}'
+                params = step['params']
+                if cap is not None:
+                    sql += ' LIMIT ?'
+                    params = params + [cap]
+                step['estimate'] = self._conn.execute(f'SELECT COUNT(*) FROM ({sql})', params).fetchone()[0]
+        steps.sort(key=lambda step: step['estimate'])
+        return steps
+
+    # 所有列条件（包括排除条件）在读取候选邮件时一起检查，返回 (WHERE 条件, 参数)
+    def _column_filter(self, query):
+        conditions = []
+        params = []
+        for predicate in query.predicates:
+            if predicate.field in COLUMN_INDEXES:
+                condition, values = column_condition(predicate)
+                conditions.append(f'NOT ({condition})' if predicate.negated else condition)
+                params.extend(values)
+        return ' AND '.join(conditions), params
+
+    # 按查询计划取出匹配的邮件，返回 [(doc, email_id, account, timestamp, length)]
+    def _execute(self, query, steps):
+        where, params = self._column_filter(query)
+        driver = steps[0] if steps else None
+        if driver is None or 'index' in driver:
+            sql = 'SELECT doc, email_id, account, timestamp, length FROM docs'
+            if driver is not None:
+                sql += f' INDEXED BY {driver["index"]}'
+            if where:
+                sql += f' WHERE {where}'
+            rows = self._conn.execute(sql, params).fetchall()
+        else:
+            rows = self._doc_rows(self._term_docs(driver['terms']), where, params)
+        return self._filter(query, steps[1:], rows)
+
+    # 在候选邮件中检查按词匹配的条件（列条件已经在读取时检查）和按词排除的条件
+    def _filter(self, query, steps, rows):
+        for step in steps:
+            if not rows:
+                break
+            if 'terms' in step:
+                matched = self._term_docs(step['terms'], {row[0] for row in rows})
+                rows = [row for row in rows if row[0] in matched]
+
+        for predicate in query.predicates:
+            if rows and predicate.negated and predicate.field in FIELD_TERM_PREFIXES:
+                prefix = FIELD_TERM_PREFIXES[predicate.field]
+                excluded = self._term_docs([(prefix + term, is_prefix) for term, is_prefix in predicate.value], {row[0] for row in rows})
+                rows = [row for row in rows if row[0] not in excluded]
+        return rows
+
+    def _term_range(self, term, prefix):
+        if prefix:
+            return 'term >= ? AND term < ?', [term, term + '\U0010ffff']
+        return 'term = ?', [term]
+
+    # 一个查询词在倒排表中的行数，用于估计条件匹配的邮件数；从词表读取，不统计倒排记录
+    def _term_count(self, term, prefix):
+        condition, params = self._term_range(term, prefix)
+        return self._conn.execute(f'SELECT COALESCE(SUM(df), 0) FROM terms WHERE {condition}', params).fetchone()[0]
+
+    # 包含所有查询词的邮件；指定 candidates 时只在这些邮件中查找
+    # 查询词的行数少于候选邮件数时读取整个倒排列表求交集，否则逐个检查候选邮件
+    def _term_docs(self, terms, candidates=None):
+        docs = candidates
+        counts = {(term, prefix): self._term_count(term, prefix) for term, prefix in terms}
+        for term, prefix in sorted(terms, key=lambda item: counts[item]):
+            if docs is not None and not docs:
+                break
+            condition, params = self._term_range(term, prefix)
+            if docs is None or counts[(term, prefix)] < len(docs):
+                matched = {row[0] for row in self._conn.execute(f'SELECT doc FROM postings WHERE {condition}', params)}
+                docs = matched if docs is None else docs & matched
+            else:
+                # 不是前缀匹配时按主键逐个查找，否则读取候选邮件的所有倒排记录
+                index = ' INDEXED BY postings_doc' if prefix else ''
+                matched = set()
+                doc_list = list(docs)
+                for i in range(0, len(doc_list), 900):
+                    chunk = doc_list[i:i + 900]
+                    placeholders = ','.join('?' * len(chunk))
+                    matched.update(row[0] for row in self._conn.execute(
+                        f'SELECT doc FROM postings{index} WHERE {condition} AND doc IN ({placeholders})',
+                        params + chunk
+                    ))
+                docs = matched
+        return docs if docs is not None else set()
+
+    # 读取候选邮件的信息，同时检查列条件；按主键逐个查找，不让列条件的索引扫描整个范围
+    def _doc_rows(self, docs, where, params):
+        rows = []
+        doc_list = list(docs)
+        for i in range(0, len(doc_list), 900):
+            chunk = doc_list[i:i + 900]
+            placeholders = ','.join('?' * len(chunk))
+            sql = f'SELECT doc, email_id, account, timestamp, length FROM docs NOT INDEXED WHERE doc IN ({placeholders})'
+            if where:
+                sql += f' AND {where}'
+            rows.extend(self._conn.execute(sql, chunk + params).fetchall())
+        return rows
+
+    # 关键词在词表中展开出的索引词，返回 {'term', 'prefix', 'weights': {索引词: idf}, 'count': 倒排记录数,
+    # 'max_score': 这个关键词在一封邮件上的最高得分}
+    def _expand(self, term, prefix):
+        condition, params = self._term_range(term, prefix)
+        weights = {}
+        count = 0
+        max_score = 0.0
+        for index_term, df, max_impact in self._conn.execute(
+            f'SELECT term, df, max_impact FROM terms WHERE {condition} AND df > 0', params
+        ):
+            weights[index_term] = idf(df, self._total_docs)
+            count += df
+            max_score = max(max_score, weights[index_term] * max_impact)
+        return {'term': term, 'prefix': prefix, 'weights': weights, 'count': count, 'max_score': max_score}
+
+    # 一个关键词在候选邮件上的得分；前缀匹配展开出的多个索引词只取得分最高的一个，同一个关键词不重复计分，
+    # 因此它在任何邮件上的得分都不超过 max_score
+    def _term_scores(self, expanded, docs):
+        weights = expanded['weights']
+        scores = {}
+        doc_list = list(docs)
+        for i in range(0, len(doc_list), 900):
+            chunk = doc_list[i:i + 900]
+            placeholders = ','.join('?' * len(chunk))
+            if len(weights) <= MAX_EXPANDED_TERMS:
+                # 按主键逐个查找每个索引词
+                rows = []
+                for index_term in weights:
+                    rows.extend(self._conn.execute(
+                        f'SELECT term, doc, impact FROM postings WHERE term = ? AND doc IN ({placeholders})', [index_term] + chunk
+                    ))
+            else:
+                condition, params = self._term_range(expanded['term'], expanded['prefix'])
+                rows = self._conn.execute(
+                    f'SELECT term, doc, impact FROM postings INDEXED BY postings_doc WHERE doc IN ({placeholders}) AND {condition}',
+                    chunk + params
+                )
+            for index_term, doc, value in rows:
+                score = weights[index_term] * value
+                if score > scores.get(doc, 0.0):
+                    scores[doc] = score
+        return scores
+
+    # 候选邮件的 BM25 得分：各个关键词的得分之和；只返回包含所有关键词的邮件，只读取候选邮件的倒排记录
+    # known 是已经知道的关键词得分 {关键词的位置: {doc: 得分}}，这些关键词不再查找
+    def _scores(self, terms, docs, known=None):
+        scores = dict.fromkeys(docs, 0.0)
+        for i, expanded in enumerate(terms):
+            if known and i in known:
+                term_scores = known[i]
+            else:
+                term_scores = self._term_scores(expanded, scores)
+            scores = {doc: score + term_scores[doc] for doc, score in scores.items() if doc in term_scores}
+        return scores
+
+    # 从倒排记录最少的关键词开始，按得分从高到低读取它的倒排记录，只给读到的邮件检查条件和打分，返回前 limit 名
+    # 还没读到的邮件得分不超过 下一条倒排记录的得分 + 其他关键词的 max_score，低于当前第 limit 名时停止
+    # 这个关键词展开出的索引词太多时返回 None，改为给所有候选邮件打分
+    def _top(self, query, steps, terms, limit):
+        driver_index = min(range(len(terms)), key=lambda i: terms[i]['count'])
+        driver = terms[driver_index]
+        if len(driver['weights']) > MAX_EXPANDED_TERMS:
+            return None
+        others = sum(expanded['max_score'] for i, expanded in enumerate(terms) if i != driver_index)
+        where, params = self._column_filter(query)
+        # 是否包含所有关键词在打分时检查
+        steps = [step for step in steps if not step.get('text')]
+
+        # 每个索引词的倒排记录按 impact 从高到低读取，按得分合并成一个从高到低的序列
+        cursors = [
+            self._conn.execute(
+                'SELECT doc, impact FROM postings INDEXED BY postings_term_impact WHERE term = ? ORDER BY impact DESC, doc DESC',
+                (index_term,)
+            )
+            for index_term in driver['weights']
+        ]
+        postings = heapq.merge(*(weighted_postings(cursor, weight) for cursor, weight in zip(cursors, driver['weights'].values())),
+                               reverse=True)
+
+        top = []  # 最小堆 [(score, timestamp, email_id, account)]，排序方式与 query 相同
+        # 驱动关键词在读到的邮件上的得分：第一次读到一封邮件时就是它展开的索引词中最高的得分
+        driver_scores = {}
+        batch_size = max(limit, TOP_K_BATCH)
+        finished = False
+        try:
+            while not finished:
+                batch = []
+                finished = True
+                for score, doc in postings:
+                    # 之后的邮件得分都不超过 score + others，浮点数相加的顺序不同，上界留出一点余量
+                    if len(top) >= limit and (score + others) * (1 + 1e-9) < top[0][0]:
+                        break
+                    if doc not in driver_scores:
+                        driver_scores[doc] = score
+                        batch.append(doc)
+                        if len(batch) >= batch_size:
+                            finished = False
+                            break
+
+                rows = self._filter(query, steps, self._doc_rows(batch, where, params))
+                if len(top) >= limit:
+                    # 得分相同时按时间排序，上界等于第 limit 名的得分而时间更早的邮件不可能进入前 limit 名，不用查找其他关键词
+                    bounds = {score: self._bound(terms, driver_index, score) for score in {driver_scores[row[0]] for row in rows}}
+                    rows = [row for row in rows if (bounds[driver_scores[row[0]]], row[3] or 0, row[1], row[2]) > top[0]]
+                scores = self._scores(terms, [row[0] for row in rows], {driver_index: driver_scores})
+                for row in rows:
+                    if row[0] not in scores:
+                        continue
+                    item = (scores[row[0]], row[3] or 0, row[1], row[2])
+                    if len(top) < limit:
+                        heapq.heappush(top, item)
+                    elif item > top[0]:
+                        heapq.heapreplace(top, item)
+                batch_size = min(batch_size * 2, TOP_K_MAX_BATCH)
+        finally:
+            for cursor in cursors:
+                cursor.close()
+
+        top.sort(reverse=True)
+        return [(email_id, account, score) for score, timestamp, email_id, account in top]
+
+    # 一封邮件的得分上界：驱动关键词的得分加上其他关键词的 max_score，与 _scores 按同样的顺序相加，
+    # 浮点数舍入不改变大小关系，因此得分一定不超过上界
+    def _bound(self, terms, driver_index, driver_score):
+        bound = 0.0
+        for i, expanded in enumerate(terms):
+            bound += driver_score if i == driver_index else expanded['max_score']
+        return bound
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == '__main__':
+    import time
+    import config
+    from storage import create_email_store
+
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), config.DATA_DIR)
+    search_index = SearchIndex(os.path.join(data_dir, config.SEARCH_INDEX_FILE))
+
+    # 用法: python search_index.py，从已保存的邮件重建全文索引
+    start = time.time()
+    count = search_index.rebuild(create_email_store(data_dir).iter_emails())
+    print(f'已索引 {count} 封邮件，用时 {time.time() - start:.1f} 秒')
@@ -0,0 +1,170 @@
+"""
+搜索查询语言：关键词和字段条件用空格分隔，所有条件都需要满足
+
+    发票                    关键词：标题、发件人或正文（全文索引建立前只匹配标题和发件人）
+    from:alice              发件人
+    subject:"weekly report" 标题，值中有空格时用引号
+    account:me@example.com  邮件所属的账号
+    has:attachment          有附件
+    after:2024-01-01        日期范围（UTC），after 包含当天，before 不包含当天
+    before:2024/02/01
+    larger:1M smaller:100k  邮件大小，单位 k、m、g（按 1024 计算），没有单位时为字节
+
+字段条件前加 - 表示排除，例如 -from:noreply。from 和 subject 的值按全文索引的方式切词，
+每个词都要出现在对应字段中（英文单词前缀匹配，中文按二元组匹配）。未知的字段名按关键词处理
+"""
+import calendar
+import re
+from datetime import datetime
+from date_utils import email_timestamp
+from search_index import tokenize, tokenize_query, message_size, has_attachment
+
+TOKEN_RE = re.compile(r'(-?)([A-Za-z]+):("[^"]*"|\S+)|"([^"]*)"|(\S+)')
+SIZE_RE = re.compile(r'^(\d+(?:\.\d+)?)([kmg]?)b?$', re.I)
+SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+DATE_FORMATS = ('%Y-%m-%d', '%Y/%m/%d')
+
+TOKEN_FIELDS = ('from', 'subject')
+FIELDS = TOKEN_FIELDS + ('account', 'has', 'after', 'before', 'larger', 'smaller')
+
+
+# 查询语法错误，例如无法识别的日期
+class QueryError(ValueError):
+    pass
+
+
+def parse_date(value):
+    for fmt in DATE_FORMATS:
+        try:
+            return calendar.timegm(datetime.strptime(value, fmt).timetuple())
+        except ValueError:
+            continue
+    raise QueryError(f'无法识别的日期: {value}')
+
+
+def parse_size(value):
+    match = SIZE_RE.match(value)
+    if not match:
+        raise QueryError(f'无法识别的大小: {value}')
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+
+class Predicate:
+    def __init__(self, field, value, negated=False, raw=''):
+        self.field = field
+        self.value = value      # 解析后的值：词列表、账号、时间戳或字节数
+        self.negated = negated
+        self.raw = raw
+
+    def __str__(self):
+        return f'{"-" if self.negated else ""}{self.field}:{self.raw}'
+
+    def matches(self, email_data):
+        return self._test(email_data) != self.negated
+
+    def _test(self, email_data):
+        field = self.field
+        if field in TOKEN_FIELDS:
+            return terms_match(self.value, email_data.get(field))
+        if field == 'account':
+            return email_data.get('account') == self.value
+        if field == 'has':
+            return has_attachment(email_data)
+        if field == 'after':
+            return email_timestamp(email_data) >= self.value
+        if field == 'before':
+            return email_timestamp(email_data) < self.value
+        if field == 'larger':
+            return message_size(email_data) > self.value
+        return message_size(email_data) < self.value
+
+
+# 与全文索引相同的匹配方式：每个查询词都要出现在文本的词中，前缀匹配的词只需要是某个词的开头
+def terms_match(terms, text):
+    tokens = set(tokenize(text))
+    for term, prefix in terms:
+        if prefix:
+            if not any(token.startswith(term) for token in tokens):
+                return False
+        elif term not in tokens:
+            return False
+    return True
+
+
+class Query:
+    def __init__(self, text='', predicates=None):
+        self.text = text                    # 关键词，多个关键词用空格连接
+        self.predicates = predicates or []
+
+    # 关键词在全文索引中的查询词
+    @property
+    def text_terms(self):
+        return tokenize_query(self.text)
+
+    # 关键词中没有全文索引能查找的词（例如只有标点符号），只能逐封扫描按子串匹配
+    @property
+    def needs_scan(self):
+        return bool(self.text) and not self.text_terms
+
+    # 扫描搜索时是否需要读取正文（按正文估算邮件大小）
+    @property
+    def needs_body(self):
+        return any(predicate.field in ('larger', 'smaller') for predicate in self.predicates)
+
+    # 查询限定的账号，没有限定时返回 None
+    def accounts(self):
+        accounts = {predicate.value for predicate in self.predicates if predicate.field == 'account' and not predicate.negated}
+        return sorted(accounts) if accounts else None
+
+    # 扫描搜索时逐封检查：关键词与以前一样按子串匹配标题和发件人
+    def __call__(self, email_data):
+        for predicate in self.predicates:
+            if not predicate.matches(email_data):
+                return False
+        if self.text:
+            text = self.text.lower()
+            subject = (email_data.get('subject') or '').lower()
+            sender = (email_data.get('from') or '').lower()
+            return text in subject or text in sender
+        return True
+
+    def __str__(self):
+        return ' '.join([str(predicate) for predicate in self.predicates] + ([self.text] if self.text else []))
+
+
+def parse_query(query):
+    words = []
+    predicates = []
+    for match in TOKEN_RE.finditer(query or ''):
+        negated, field, value, quoted, word = match.groups()
+        if field is None or field.lower() not in FIELDS:
+            words.append(quoted if quoted is not None else match.group(0))
+            continue
+
+        field = field.lower()
+        raw = value
+        if value.startswith('"') and value.endswith('"') and len(value) >= 2:
+            value = value[1:-1]
+        if not value:
+            raise QueryError(f'{field}: 缺少值')
+
+        if field in TOKEN_FIELDS:
+            parsed = tokenize_query(value)
+            if not parsed:
+                raise QueryError(f'{field}:{raw} 中没有可以搜索的词')
+        elif field == 'account':
+            parsed = value
+        elif field == 'has':
+            if value.lower() not in ('attachment', 'attachments'):
+                raise QueryError(f'不支持的条件 has:{value}')
+            parsed = 'attachment'
+        elif field in ('after', 'before'):
+            parsed = parse_date(value)
+        else:
+            parsed = parse_size(value)
+        predicates.append(Predicate(field, parsed, bool(negated), raw))
+
+    text = ' '.join(word for word in words if word)
+    if not text and not predicates:
+        raise QueryError('查询为空')
+    return Query(text, predicates)
@@ -0,0 +1,544 @@
+"""
+邮件存储：json 后端每封邮件保存为 data/emails/<account>/<id>.json，并用位置索引记录邮件所属的账号，
+sqlite 后端把邮件保存在 WAL 模式的 SQLite 数据库中，正文单独存放
+
+开启正文压缩后，json 后端的正文压缩后以 base64 保存在 content_compressed 字段中（每封邮件仍然只有一个文件，
+小邮件不会因为多一个文件多占一个磁盘块），sqlite 后端的正文以 BLOB 保存；
+邮件列表（摘要）只读取元数据，读取完整邮件时才解压正文，未压缩保存的旧邮件照常读取
+"""
+import os
+import sys
+import json
+import base64
+import bisect
+import heapq
+import itertools
+import sqlite3
+import threading
+import urllib.parse
+import config
+from body_codec import BodyCodec
+from date_utils import email_timestamp, display_date_timestamp
+
+# 保存在 SQLite 索引列中的字段，其余字段以 JSON 形式保存在 extra 列
+INDEXED_FIELDS = ('id', 'account', 'message_id', 'subject', 'from', 'date', 'timestamp')
+
+# 一封邮件在 SQLite 中保存的数据量：各列的字节数（timestamp 按 8 字节）加上正文，不含页和索引的开销
+SQLITE_RECORD_SIZE = (
+    '8 + ' + ' + '.join(f'COALESCE(length(CAST(m.{column} AS BLOB)), 0)'
+                        for column in ('id', 'account', 'message_id', 'subject', 'sender', 'date', 'extra'))
+    + ' + COALESCE(length(CAST(b.content AS BLOB)), 0)'
+)
+
+
+def _sqlite_record_size(row, body):
+    size = 8 + sum(len(value.encode('utf-8')) for value in row if isinstance(value, str))
+    if isinstance(body, str):
+        return size + len(body.encode('utf-8'))
+    return size + len(body or b'')
+
+
+# 分页游标：上一页最后一封邮件的 (时间戳, id)
+def encode_cursor(timestamp, email_id):
+    raw = json.dumps([timestamp or 0, email_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, email_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise ValueError('invalid cursor')
+    if not isinstance(timestamp, (int, float)) or isinstance(timestamp, bool):
+        raise ValueError('invalid cursor')
+    return timestamp, str(email_id)
+
+
+# 摘要：列表视图不需要正文
+def to_summary(email_data):
+    return {key: value for key, value in email_data.items() if key != 'content'}
+
+
+# 邮件位置索引：email_id -> 账号，每行一条 "<email_id>\t<账号>"，只追加不重写
+# 第一次使用时加载到内存，文件不存在时扫描邮件目录重建
+class EmailLocationIndex:
+    def __init__(self, index_file, emails_dir):
+        self.index_file = index_file
+        self.emails_dir = emails_dir
+        self._lock = threading.Lock()
+        self._locations = None
+        self._offset = 0
+
+    def _ensure_loaded(self):
+        if self._locations is None:
+            self._locations = {}
+            if os.path.exists(self.index_file):
+                self._read_new_lines()
+            else:
+                self._rebuild()
+
+    # 读取文件中上次读取位置之后追加的行，其他进程（如迁移脚本）写入的邮件也能找到
+    def _read_new_lines(self):
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                f.seek(self._offset)
+                for line in f:
+                    if not line.endswith('\n'):
+                        break
+                    email_id, _, account = line.rstrip('\n').partition('\t')
+                    if account:
+                        # 同一个账号名只保留一个字符串对象，减少内存占用
+                        self._locations[email_id] = sys.intern(account)
+                    self._offset += len(line.encode('utf-8'))
+        except FileNotFoundError:
+            pass
+
+    def _rebuild(self):
+        locations = {}
+        for account in os.listdir(self.emails_dir):
+            account_dir = os.path.join(self.emails_dir, account)
+            if not os.path.isdir(account_dir):
+                continue
+            account = sys.intern(account)
+            for filename in os.listdir(account_dir):
+                if filename.endswith('.json'):
+                    locations[filename[:-5]] = account
+
+        tmp_file = f'{self.index_file}.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(''.join(f'{email_id}\t{account}\n' for email_id, account in locations.items()))
+        os.replace(tmp_file, self.index_file)
+        self._locations = locations
+        self._offset = os.path.getsize(self.index_file)
+
+    # 查找邮件所属的账号，找不到时先读取文件中新追加的行
+    def get(self, email_id):
+        with self._lock:
+            self._ensure_loaded()
+            account = self._locations.get(email_id)
+            if account is None:
+                self._read_new_lines()
+                account = self._locations.get(email_id)
+            return account
+
+    def add(self, email_id, account):
+        with self._lock:
+            self._ensure_loaded()
+            if self._locations.get(email_id) == account:
+                return
+            # 先追上其他进程追加的内容，再写入自己的一行
+            self._read_new_lines()
+            line = f'{email_id}\t{account}\n'
+            with open(self.index_file, 'a', encoding='utf-8') as f:
+                f.write(line)
+            self._locations[email_id] = sys.intern(account)
+            self._offset += len(line.encode('utf-8'))
+
+    def rebuild(self):
+        with self._lock:
+            self._rebuild()
+            return len(self._locations)
+
+
+class JsonEmailStore:
+    def __init__(self, emails_dir, locations_file, codec=None):
+        self.emails_dir = emails_dir
+        self.codec = codec or BodyCodec()
+        os.makedirs(emails_dir, exist_ok=True)
+        self.locations = EmailLocationIndex(locations_file, emails_dir)
+
+        # 分页用的排序键缓存：账号 -> 按 (时间戳, id) 升序排列的列表，以及 id -> 时间戳
+        # 第一次分页读取某个账号时建立，之后由 save 维护
+        self._page_lock = threading.Lock()
+        self._sorted_keys = {}
+        self._key_times = {}
+
+    # with_body 为 False 时不解压正文
+    def _read(self, email_file, with_body=True):
+        try:
+            with open(email_file, 'r', encoding='utf-8') as f:
+                email_data = json.load(f)
+            compressed = email_data.pop('content_compressed', None)
+            if with_body and compressed is not None:
+                email_data['content'] = self.codec.decompress(base64.b64decode(compressed))
+            return email_data
+        except:
+            return None
+
+    # 有邮件目录的账号列表
+    def accounts(self):
+        return [name for name in os.listdir(self.emails_dir) if os.path.isdir(os.path.join(self.emails_dir, name))]
+
+    # 保存邮件，返回邮件文件的大小
+    def save(self, email_data):
+        account = email_data['account']
+        account_dir = os.path.join(self.emails_dir, account)
+        os.makedirs(account_dir, exist_ok=True)
+        if self.codec.enabled and 'content' in email_data:
+            compressed = self.codec.compress(email_data['content'])
+            email_data = to_summary(email_data)
+            email_data['content_compressed'] = base64.b64encode(compressed).decode('ascii')
+
+        data = json.dumps(email_data, ensure_ascii=False, indent=2).encode('utf-8')
+        with open(os.path.join(account_dir, f"{email_data['id']}.json"), 'wb') as f:
+            f.write(data)
+        self.locations.add(email_data['id'], account)
+
+        with self._page_lock:
+            if account in self._sorted_keys:
+                self._insert_key(account, email_timestamp(email_data), email_data['id'])
+        return len(data)
+
+    def _insert_key(self, account, timestamp, email_id):
+        keys = self._sorted_keys[account]
+        times = self._key_times[account]
+        if email_id in times:
+            old_key = (times[email_id], email_id)
+            index = bisect.bisect_left(keys, old_key)
+            if index < len(keys) and keys[index] == old_key:
+                keys.pop(index)
+        bisect.insort(keys, (timestamp, email_id))
+        times[email_id] = timestamp
+
+    def _account_keys(self, account):
+        with self._page_lock:
+            if account not in self._sorted_keys:
+                times = {}
+                for email_data in self.iter_emails(account, with_body=False):
+                    times[email_data['id']] = email_timestamp(email_data)
+                self._key_times[account] = times
+                self._sorted_keys[account] = sorted((timestamp, email_id) for email_id, timestamp in times.items())
+            return self._sorted_keys[account]
+
+    # 读取邮件详情，不知道所属账号时从位置索引查找，只读取这封邮件的文件
+    def get(self, email_id, account=None, with_body=True):
+        if account is None:
+            account = self.locations.get(email_id)
+            if account is None:
+                return None
+        return self._read(os.path.join(self.emails_dir, account, f"{email_id}.json"), with_body)
+
+    def count(self, account):
+        account_dir = os.path.join(self.emails_dir, account)
+        if not os.path.exists(account_dir):
+            return 0
+        return len([f for f in os.listdir(account_dir) if f.endswith('.json')])
+
+    # 邮件文件占用的字节数，邮件不存在时为 0
+    def record_size(self, email_id, account=None):
+        if account is None:
+            account = self.locations.get(email_id)
+            if account is None:
+                return 0
+        try:
+            return os.path.getsize(os.path.join(self.emails_dir, account, f"{email_id}.json"))
+        except OSError:
+            return 0
+
+    # 账号所有邮件文件占用的字节数，只读取文件大小
+    def account_size(self, account):
+        account_dir = os.path.join(self.emails_dir, account)
+        if not os.path.isdir(account_dir):
+            return 0
+        return sum(entry.stat().st_size for entry in os.scandir(account_dir) if entry.name.endswith('.json'))
+
+    # 逐个读取邮件，不指定账号时读取所有账号；with_body 为 False 时不解压正文
+    def iter_emails(self, account=None, with_body=True):
+        accounts = [account] if account is not None else self.accounts()
+        for name in accounts:
+            account_dir = os.path.join(self.emails_dir, name)
+            if not os.path.isdir(account_dir):
+                continue
+            for filename in os.listdir(account_dir):
+                if filename.endswith('.json'):
+                    email_data = self._read(os.path.join(account_dir, filename), with_body)
+                    if email_data is not None:
+                        yield email_data
+
+    # 读取账号的第 part 个分区（共 parts 个），用于多个进程并行扫描同一个账号
+    def iter_partition(self, account, part, parts, with_body=True):
+        account_dir = os.path.join(self.emails_dir, account)
+        if not os.path.isdir(account_dir):
+            return
+        filenames = sorted(filename for filename in os.listdir(account_dir) if filename.endswith('.json'))
+        for filename in filenames[part::parts]:
+            email_data = self._read(os.path.join(account_dir, filename), with_body)
+            if email_data is not None:
+                yield email_data
+
+    # 邮件列表，按时间排序，最新的在前面
+    def list_emails(self, account=None, summary=False):
+        emails = list(self.iter_emails(account, with_body=not summary))
+        emails.sort(key=email_timestamp, reverse=True)
+        if summary:
+            emails = [to_summary(email_data) for email_data in emails]
+        return emails
+
+    # 按 (时间戳, id) 倒序分页，只读取当前页的邮件文件
+    def list_page(self, account=None, limit=50, cursor=None, summary=True):
+        accounts = [account] if account is not None else self.accounts()
+        position = decode_cursor(cursor) if cursor else None
+
+        iterators = []
+        for name in accounts:
+            keys = self._account_keys(name)
+            with self._page_lock:
+                end = bisect.bisect_left(keys, position) if position else len(keys)
+                # 复制当前页可能用到的键，避免与并发的 save 冲突
+                page_keys = keys[max(0, end - limit - 1):end]
+            iterators.append([(timestamp, email_id, name) for timestamp, email_id in reversed(page_keys)])
+
+        emails = []
+        last_key = None
+        for timestamp, email_id, name in itertools.islice(heapq.merge(*iterators, reverse=True), limit + 1):
+            if len(emails) == limit:
+                return emails, encode_cursor(*last_key)
+            email_data = self.get(email_id, name, with_body=not summary)
+            if email_data is not None:
+                emails.append(to_summary(email_data) if summary else email_data)
+            last_key = (timestamp, email_id)
+        return emails, None
+
+    # 按时间倒序逐封读取，用于流式输出，内存中只保留排序键
+    def iter_sorted(self, account=None, summary=False):
+        accounts = [account] if account is not None else self.accounts()
+        iterators = []
+        for name in accounts:
+            keys = self._account_keys(name)
+            with self._page_lock:
+                keys = list(keys)
+            iterators.append(zip(reversed(keys), itertools.repeat(name)))
+
+        for (timestamp, email_id), name in heapq.merge(*iterators, reverse=True):
+            email_data = self.get(email_id, name, with_body=not summary)
+            if email_data is not None:
+                yield to_summary(email_data) if summary else email_data
+
+    def close(self):
+        pass
+
+
+class SqliteEmailStore:
+    # readonly 为 True 时以只读方式打开已有的数据库，不创建表和索引、不升级旧数据库，用于扫描搜索的工作进程
+    def __init__(self, db_file, codec=None, readonly=False):
+        self.db_file = db_file
+        self.codec = codec or BodyCodec()
+        self.readonly = readonly
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        if readonly:
+            return
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS messages (
+                id TEXT PRIMARY KEY,
+                account TEXT NOT NULL,
+                message_id TEXT,
+                subject TEXT,
+                sender TEXT,
+                date TEXT,
+                extra TEXT NOT NULL DEFAULT '{}',
+                timestamp INTEGER
+            );
+        ''')
+        self._add_timestamp_column(conn)
+        conn.executescript('''
+            DROP INDEX IF EXISTS messages_account_date;
+            DROP INDEX IF EXISTS messages_date;
+            DROP INDEX IF EXISTS messages_account_date_id;
+            DROP INDEX IF EXISTS messages_date_id;
+            CREATE INDEX IF NOT EXISTS messages_account_timestamp_id ON messages (account, timestamp, id);
+            CREATE INDEX IF NOT EXISTS messages_timestamp_id ON messages (timestamp, id);
+            CREATE INDEX IF NOT EXISTS messages_sender ON messages (sender);
+            CREATE INDEX IF NOT EXISTS messages_subject ON messages (subject);
+            CREATE INDEX IF NOT EXISTS messages_message_id ON messages (message_id);
+            CREATE TABLE IF NOT EXISTS bodies (
+                id TEXT PRIMARY KEY,
+                content TEXT
+            );
+        ''')
+        conn.commit()
+
+    # 旧数据库没有 timestamp 列，添加后从 date 字段计算
+    def _add_timestamp_column(self, conn):
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(messages)')]
+        if 'timestamp' in columns:
+            return
+        with conn:
+            conn.execute('ALTER TABLE messages ADD COLUMN timestamp INTEGER')
+            rows = conn.execute('SELECT id, date FROM messages').fetchall()
+            conn.executemany('UPDATE messages SET timestamp = ? WHERE id = ?',
+                             [(display_date_timestamp(date), email_id) for email_id, date in rows])
+
+    # 每个线程使用自己的连接，WAL 模式下读操作互不阻塞
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.readonly:
+                conn = sqlite3.connect(f'file:{urllib.parse.quote(self.db_file)}?mode=ro', timeout=30, uri=True)
+            else:
+                conn = sqlite3.connect(self.db_file, timeout=30)
+                conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _to_row(self, email_data):
+        extra = {key: value for key, value in email_data.items() if key not in INDEXED_FIELDS and key != 'content'}
+        return (
+            email_data['id'],
+            email_data.get('account', ''),
+            email_data.get('message_id', ''),
+            email_data.get('subject', ''),
+            email_data.get('from', ''),
+            email_data.get('date', ''),
+            email_timestamp(email_data),
+            json.dumps(extra, ensure_ascii=False)
+        )
+
+    # 正文列保存的可能是未压缩的文本，也可能是压缩后的 BLOB
+    def _body(self, value):
+        return self.codec.decompress(value) if value else ''
+
+    def _from_row(self, row, content=None):
+        email_data = {
+            'id': row[0],
+            'account': row[1],
+            'message_id': row[2],
+            'subject': row[3],
+            'from': row[4],
+            'date': row[5],
+            'timestamp': row[6]
+        }
+        if content is not None:
+            email_data['content'] = content
+        email_data.update(json.loads(row[7] or '{}'))
+        return email_data
+
+    def accounts(self):
+        return [row[0] for row in self._conn().execute('SELECT DISTINCT account FROM messages')]
+
+    # 保存邮件，返回保存的数据量
+    def save(self, email_data):
+        return self.save_many([email_data])
+
+    # 批量保存邮件，在一个事务中完成，返回保存的数据量
+    def save_many(self, emails):
+        rows = [self._to_row(email_data) for email_data in emails]
+        bodies = [(email_data['id'], self.codec.compress(email_data.get('content', ''))) for email_data in emails]
+        conn = self._conn()
+        with self._write_lock:
+            with conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO messages (id, account, message_id, subject, sender, date, timestamp, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    rows
+                )
+                conn.executemany('INSERT OR REPLACE INTO bodies (id, content) VALUES (?, ?)', bodies)
+        return sum(_sqlite_record_size(row, body) for row, (email_id, body) in zip(rows, bodies))
+
+    def get(self, email_id, account=None):
+        row = self._conn().execute(
+            'SELECT m.id, m.account, m.message_id, m.subject, m.sender, m.date, m.timestamp, m.extra, b.content '
+            'FROM messages m LEFT JOIN bodies b ON b.id = m.id WHERE m.id = ?',
+            (email_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return self._from_row(row, self._body(row[8]))
+
+    def count(self, account):
+        return self._conn().execute('SELECT COUNT(*) FROM messages WHERE account = ?', (account,)).fetchone()[0]
+
+    # 邮件保存的数据量，邮件不存在时为 0
+    def record_size(self, email_id, account=None):
+        row = self._conn().execute(
+            f'SELECT {SQLITE_RECORD_SIZE} FROM messages m LEFT JOIN bodies b ON b.id = m.id WHERE m.id = ?', (email_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    # 账号所有邮件保存的数据量
+    def account_size(self, account):
+        return self._conn().execute(
+            f'SELECT COALESCE(SUM({SQLITE_RECORD_SIZE}), 0) FROM messages m LEFT JOIN bodies b ON b.id = m.id WHERE m.account = ?',
+            (account,)
+        ).fetchone()[0]
+
+    # 摘要查询不读取正文表
+    def _select(self, account, order_by_date, summary=False, cursor=None, limit=None, partition=None):
+        if summary:
+            sql = 'SELECT m.id, m.account, m.message_id, m.subject, m.sender, m.date, m.timestamp, m.extra FROM messages m'
+        else:
+            sql = ('SELECT m.id, m.account, m.message_id, m.subject, m.sender, m.date, m.timestamp, m.extra, b.content '
+                   'FROM messages m LEFT JOIN bodies b ON b.id = m.id')
+        conditions = []
+        params = []
+        if account is not None:
+            conditions.append('m.account = ?')
+            params.append(account)
+        if cursor is not None:
+            conditions.append('(m.timestamp, m.id) < (?, ?)')
+            params.extend(cursor)
+        if partition is not None:
+            conditions.append('m.rowid % ? = ?')
+            params.extend((partition[1], partition[0]))
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        if order_by_date:
+            sql += ' ORDER BY m.timestamp DESC, m.id DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return self._conn().execute(sql, params)
+
+    def _row_to_email(self, row, summary):
+        return self._from_row(row) if summary else self._from_row(row, self._body(row[8]))
+
+    # with_body 为 False 时不读取正文表
+    def iter_emails(self, account=None, with_body=True):
+        for row in self._select(account, False, not with_body):
+            yield self._row_to_email(row, not with_body)
+
+    # 读取账号的第 part 个分区（共 parts 个），用于多个进程并行扫描同一个账号
+    def iter_partition(self, account, part, parts, with_body=True):
+        for row in self._select(account, False, not with_body, partition=(part, parts)):
+            yield self._row_to_email(row, not with_body)
+
+    # 按时间倒序逐行读取，用于流式输出
+    def iter_sorted(self, account=None, summary=False):
+        for row in self._select(account, True, summary):
+            yield self._row_to_email(row, summary)
+
+    # 邮件列表，按时间排序，最新的在前面
+    def list_emails(self, account=None, summary=False):
+        return [self._row_to_email(row, summary) for row in self._select(account, True, summary)]
+
+    # 按 (时间戳, id) 倒序分页，使用 (account, timestamp, id) 索引，耗时只与页大小有关
+    def list_page(self, account=None, limit=50, cursor=None, summary=True):
+        position = decode_cursor(cursor) if cursor else None
+        rows = self._select(account, True, summary, position, limit + 1).fetchall()
+        emails = [self._row_to_email(row, summary) for row in rows[:limit]]
+        next_cursor = encode_cursor(rows[limit - 1][6], rows[limit - 1][0]) if len(rows) > limit else None
+        return emails, next_cursor
+
+    # 重新压缩正文后回收数据库文件中的空闲页
+    def vacuum(self):
+        self._conn().execute('VACUUM')
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# 根据配置创建正文压缩
+def create_body_codec(data_dir):
+    return BodyCodec(config.BODY_COMPRESSION, config.BODY_COMPRESSION_LEVEL, os.path.join(data_dir, config.BODY_DICT_DIR))
+
+
+# 根据配置创建邮件存储，readonly 为 True 时只用于读取（sqlite 后端不创建表、不升级数据库）
+def create_email_store(data_dir, readonly=False):
+    codec = create_body_codec(data_dir)
+    if config.STORAGE_BACKEND == 'sqlite':
+        return SqliteEmailStore(os.path.join(data_dir, config.SQLITE_STORE_FILE), codec, readonly)
+    return JsonEmailStore(os.path.join(data_dir, config.EMAILS_DIR), os.path.join(data_dir, config.EMAIL_LOCATIONS_FILE), codec)
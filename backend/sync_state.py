@@ -0,0 +1,84 @@
+"""
+邮件同步状态：记录每个账号邮箱的 UIDVALIDITY 和已同步的最大 UID，
+用于增量收取邮件；处理失败的邮件记录在 retry 中（UID -> 已失败次数），之后单独重试
+"""
+import os
+import json
+import re
+import threading
+
+
+class SyncStateStore:
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        self._lock = threading.Lock()
+        os.makedirs(state_dir, exist_ok=True)
+
+    def _state_file(self, account):
+        # 账号名作为文件名前做一次安全处理
+        safe_name = re.sub(r'[^\w\.@-]', '_', account)
+        return os.path.join(self.state_dir, f'{safe_name}.json')
+
+    # 读取账号的同步状态，不存在时返回空状态
+    def load(self, account):
+        state_file = self._state_file(account)
+        if not os.path.exists(state_file):
+            return {'uidvalidity': None, 'last_uid': 0, 'retry': {}}
+
+        try:
+            with open(state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+                return {
+                    'uidvalidity': state.get('uidvalidity'),
+                    'last_uid': int(state.get('last_uid', 0)),
+                    'retry': {int(uid): int(attempts) for uid, attempts in (state.get('retry') or {}).items()}
+                }
+        except:
+            return {'uidvalidity': None, 'last_uid': 0, 'retry': {}}
+
+    # 原子写入账号的同步状态（先写临时文件再替换）
+    def save(self, account, uidvalidity, last_uid, retry=None):
+        state_file = self._state_file(account)
+        tmp_file = f'{state_file}.tmp'
+        state = {'uidvalidity': uidvalidity, 'last_uid': last_uid}
+        if retry:
+            state['retry'] = {str(uid): attempts for uid, attempts in sorted(retry.items())}
+        with self._lock:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_file, state_file)
+
+    # 清除账号的同步状态，下次收取时将全量同步
+    def reset(self, account):
+        state_file = self._state_file(account)
+        with self._lock:
+            if os.path.exists(state_file):
+                os.remove(state_file)
+
+
+# 读取当前选中邮箱的 UIDVALIDITY
+def get_uidvalidity(mail, mailbox='INBOX'):
+    # SELECT 返回的 [UIDVALIDITY n] 响应码会被 imaplib 保存在未标记响应中
+    typ, data = mail.response('UIDVALIDITY')
+    if data and data[0]:
+        return int(data[0])
+
+    # 服务器未在 SELECT 中返回时，使用 STATUS 命令查询
+    typ, data = mail.status(mailbox, '(UIDVALIDITY)')
+    if typ == 'OK' and data and data[0]:
+        match = re.search(rb'UIDVALIDITY\s+(\d+)', data[0])
+        if match:
+            return int(match.group(1))
+
+    return None
+
+
+# 查找大于 last_uid 的所有邮件 UID
+def search_new_uids(mail, last_uid):
+    # UID SEARCH UID n:* 在没有新邮件时仍会返回最大的 UID，需要再过滤一次
+    status, data = mail.uid('SEARCH', None, f'UID {last_uid + 1}:*')
+    if status != 'OK' or not data or not data[0]:
+        return []
+
+    uids = [int(uid) for uid in data[0].split()]
+    return sorted(uid for uid in uids if uid > last_uid)
@@ -1,6 +1,6 @@
 'use client';
 
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import EmailList from '../components/EmailList';
 import AccountList from '../components/AccountList';
 import Toolbar from '../components/Toolbar';
@@ -28,6 +28,10 @@ export default function Home() {
   const [showNotifications, setShowNotifications] = useState(false);
   const [notifications, setNotifications] = useState([]);
   const [notificationCount, setNotificationCount] = useState(0);
+  const [eventsConnected, setEventsConnected] = useState(false);
+  const [newMail, setNewMail] = useState(null);
+  // 当前搜索任务的 id，只显示自己的搜索进度
+  const searchJobIdRef = useRef(null);
 
   // 加载API URL
   useEffect(() => {
@@ -76,36 +80,103 @@ export default function Home() {
     fetchNotifications();
   }, [apiUrl]);
 
+  // 订阅后端推送的进度和通知，浏览器不支持或连接断开时改为轮询
+  useEffect(() => {
+    if (typeof EventSource === 'undefined') return;
+
+    // EventSource 不能设置请求头，访问秘钥通过查询参数传递
+    const accessKey = localStorage.getItem(STORAGE_KEYS.ACCESS_KEY);
+    const query = accessKey ? `?access_key=${encodeURIComponent(accessKey)}` : '';
+    const source = new EventSource(`${apiUrl}/api/events${query}`);
+
+    source.onopen = () => setEventsConnected(true);
+    source.onerror = () => setEventsConnected(false);
+    source.addEventListener('fetch', event => setFetchProgress(JSON.parse(event.data)));
+    source.addEventListener('search', event => {
+      const data = JSON.parse(event.data);
+      if (data.job_id && data.job_id === searchJobIdRef.current) {
+        setSearchProgress(data);
+      }
+    });
+    source.addEventListener('notifications', event => updateNotifications(JSON.parse(event.data)));
+    source.addEventListener('mail', event => setNewMail(JSON.parse(event.data)));
+
+    return () => {
+      source.close();
+      setEventsConnected(false);
+    };
+  }, [apiUrl]);
+
   // 定期获取通知
   useEffect(() => {
+    if (eventsConnected) return;
+
     const interval = setInterval(() => {
       fetchNotifications();
     }, 5000);
 
     return () => clearInterval(interval);
-  }, [apiUrl]);
+  }, [apiUrl, eventsConnected]);
 
   // 监听获取邮件进度
   useEffect(() => {
-    if (fetchProgress.status === 'fetching') {
+    if (fetchProgress.status === 'fetching' && !eventsConnected) {
       const interval = setInterval(() => {
         checkFetchProgress();
       }, 1000);
 
       return () => clearInterval(interval);
     }
-  }, [fetchProgress.status, selectedAccount, apiUrl]);
+  }, [fetchProgress.status, apiUrl, eventsConnected]);
 
   // 监听搜索进度
   useEffect(() => {
-    if (searchProgress.status === 'searching') {
+    if (searchProgress.status === 'searching' && !eventsConnected) {
       const interval = setInterval(() => {
         checkSearchProgress();
       }, 1000);
 
       return () => clearInterval(interval);
     }
-  }, [searchProgress.status, searchQuery, apiUrl]);
+  }, [searchProgress.status, apiUrl, eventsConnected]);
+
+  // 收取完成后刷新邮件列表
+  useEffect(() => {
+    if (fetchProgress.status === 'completed') {
+      if (selectedAccount) {
+        fetchEmails(selectedAccount);
+      } else {
+        fetchAllEmails();
+      }
+      // 更新账号列表以获取最新的邮件数量
+      fetchAccounts();
+      // 获取最新通知
+      fetchNotifications();
+    }
+  }, [fetchProgress.status]);
+
+  // 后台监听收到新邮件后刷新邮件列表
+  useEffect(() => {
+    if (!newMail) return;
+
+    if (!isSearching) {
+      if (selectedAccount) {
+        if (selectedAccount === newMail.account) {
+          fetchEmails(selectedAccount);
+        }
+      } else {
+        fetchAllEmails();
+      }
+    }
+    fetchAccounts();
+  }, [newMail]);
+
+  // 搜索完成后获取搜索结果
+  useEffect(() => {
+    if (searchProgress.status === 'completed' && isSearching && searchJobIdRef.current) {
+      fetchSearchResults(searchJobIdRef.current);
+    }
+  }, [searchProgress.status]);
 
   // 监听错误状态，自动隐藏错误消息
   useEffect(() => {
@@ -144,33 +215,24 @@ export default function Home() {
       .then(response => response.json())
       .then(data => {
         setFetchProgress(data);
-        if (data.status === 'completed') {
-          if (selectedAccount) {
-            fetchEmails(selectedAccount);
-          } else {
-            fetchAllEmails();
-          }
-          // 更新账号列表以获取最新的邮件数量
-          fetchAccounts();
-          // 获取最新通知
-          fetchNotifications();
-        }
       })
       .catch(error => {
         console.error('获取进度失败:', error);
       });
   };
 
-  // 检查搜索进度
+  // 检查当前搜索任务的进度
   const checkSearchProgress = () => {
-    fetch(`${apiUrl}/api/search/progress`, {
+    const jobId = searchJobIdRef.current;
+    if (!jobId) return;
+
+    fetch(`${apiUrl}/api/jobs/${jobId}`, {
       headers: getAuthHeaders()
     })
       .then(response => response.json())
       .then(data => {
-        setSearchProgress(data);
-        if (data.status === 'completed') {
-          fetchSearchResults(searchQuery);
+        if (data.progress && jobId === searchJobIdRef.current) {
+          setSearchProgress(data.progress);
         }
       })
       .catch(error => {
@@ -178,6 +240,14 @@ export default function Home() {
       });
   };
 
+  // 更新通知列表
+  const updateNotifications = (data) => {
+    setNotifications(data);
+    // 计算错误通知数量
+    const errorCount = data.filter(notification => notification.type === 'error').length;
+    setNotificationCount(errorCount);
+  };
+
   // 获取通知
   const fetchNotifications = () => {
     fetch(`${apiUrl}/api/notifications`, {
@@ -185,10 +255,7 @@ export default function Home() {
     })
       .then(response => response.json())
       .then(data => {
-        setNotifications(data);
-        // 计算错误通知数量
-        const errorCount = data.filter(notification => notification.type === 'error').length;
-        setNotificationCount(errorCount);
+        updateNotifications(data);
       })
       .catch(error => {
         console.error('获取通知失败:', error);
@@ -298,7 +365,7 @@ export default function Home() {
       .then(response => response.json())
       .then(data => {
         if (data.success) {
-          // 进度会通过轮询获取
+          // 进度会通过事件推送或轮询获取
         }
       })
       .catch(error => {
@@ -317,7 +384,7 @@ export default function Home() {
       .then(response => response.json())
       .then(data => {
         if (data.success) {
-          // 进度会通过轮询获取
+          // 进度会通过事件推送或轮询获取
         }
       })
       .catch(error => {
@@ -333,6 +400,7 @@ export default function Home() {
     setSearchProgress({ status: 'searching', percentage: 0, message: '正在搜索邮件...' });
     setIsSearching(true);
     setSelectedAccount(null);
+    searchJobIdRef.current = null;
     
     fetch(`${apiUrl}/api/search?q=${encodeURIComponent(query)}`, {
       headers: getAuthHeaders()
@@ -340,7 +408,11 @@ export default function Home() {
       .then(response => response.json())
       .then(data => {
         if (data.success) {
-          // 进度会通过轮询获取
+          // 之后的进度会通过事件推送或轮询获取，任务可能在返回前已经完成，先查询一次
+          searchJobIdRef.current = data.job_id;
+          checkSearchProgress();
+        } else {
+          setSearchProgress({ status: 'error', percentage: 0, message: data.error || '搜索邮件失败' });
         }
       })
       .catch(error => {
@@ -349,9 +421,9 @@ export default function Home() {
       });
   };
 
-  // 获取搜索结果
-  const fetchSearchResults = (query) => {
-    fetch(`${apiUrl}/api/search/results?q=${encodeURIComponent(query)}`, {
+  // 获取搜索任务的结果
+  const fetchSearchResults = (jobId) => {
+    fetch(`${apiUrl}/api/search/results?job_id=${encodeURIComponent(jobId)}`, {
       headers: getAuthHeaders()
     })
       .then(response => response.json())
@@ -463,7 +535,7 @@ export default function Home() {
         <ProgressBar 
           percentage={fetchProgress.status === 'fetching' ? fetchProgress.percentage : searchProgress.percentage} 
           message={fetchProgress.status === 'fetching' ? fetchProgress.message : searchProgress.message} 
-          currentAccount={fetchProgress.current_account}
+          accounts={fetchProgress.accounts}
           currentAccountIndex={fetchProgress.current_account_index}
           totalAccounts={fetchProgress.total_accounts}
           currentEmailIndex={fetchProgress.current_email_index}
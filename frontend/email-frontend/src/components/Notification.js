@@ -55,7 +55,10 @@ export default function Notification({ isOpen, notifications, onClose, onClearAl
                   </div>
                   <div className={styles.notificationContent}>
                     <div className={styles.notificationTime}>{notification.time}</div>
-                    <div className={styles.notificationMessage}>{notification.message}</div>
+                    <div className={styles.notificationMessage}>
+                      {notification.message}
+                      {notification.count > 1 && <span className={styles.notificationCount}>（重复 {notification.count} 次）</span>}
+                    </div>
                   </div>
                 </li>
               ))}
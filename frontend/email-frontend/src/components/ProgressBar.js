@@ -3,22 +3,32 @@
 import { useState, useEffect } from 'react';
 import styles from './ProgressBar.module.css';
 
+// 同时显示的正在收取的账号数，其余的账号只显示数量
+const MAX_ACTIVE_ACCOUNTS = 3;
+
 export default function ProgressBar({ 
   percentage, 
   message, 
-  currentAccount,
+  accounts,
   currentAccountIndex,
   totalAccounts,
   currentEmailIndex,
   totalEmails
 }) {
+  // 多个账号并发收取，accounts 中状态为 fetching 的都是正在收取的账号
+  const activeAccounts = Object.keys(accounts || {}).filter(account => accounts[account].status === 'fetching');
+  const shownAccounts = activeAccounts.slice(0, MAX_ACTIVE_ACCOUNTS).join(', ');
+  const hiddenCount = activeAccounts.length - MAX_ACTIVE_ACCOUNTS;
+
   return (
     <div className={styles.progressContainer}>
       <div className={styles.progressInfo}>
         {totalAccounts > 1 && (
           <div className={styles.accountProgress}>
-            <span>账号进度: {currentAccountIndex}/{totalAccounts}</span>
-            {currentAccount && <span>当前账号: {currentAccount}</span>}
+            <span>已完成账号: {currentAccountIndex}/{totalAccounts}</span>
+            {activeAccounts.length > 0 && (
+              <span>正在收取: {shownAccounts}{hiddenCount > 0 && ` 等 ${activeAccounts.length} 个账号`}</span>
+            )}
           </div>
         )}
         {totalEmails > 0 && (